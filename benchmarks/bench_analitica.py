@@ -0,0 +1,55 @@
+# Uso: python -m benchmarks.bench_analitica [--simbolos 500] [--anos 10]
+# Genera un histórico diario sintético, lo guarda en el almacén .npy y mide la carga
+# alineada (matriz) y el cálculo de valor, TWR/MWR, drawdown y volatilidad móvil.
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from services.analitica import analizar
+from services.historico import AlmacenHistorico
+
+PRESUPUESTO_S = 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--simbolos", type=int, default=500)
+    parser.add_argument("--anos", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    fin = np.datetime64('today', 'D')
+    fechas = np.arange(fin - np.timedelta64(365 * args.anos, 'D'), fin)
+    fechas = fechas[np.is_busday(fechas)]
+    simbolos = [f"SIM{i:04d}" for i in range(args.simbolos)]
+
+    with tempfile.TemporaryDirectory() as directorio:
+        almacen = AlmacenHistorico(directorio)
+        inicio = time.perf_counter()
+        for simbolo in simbolos:
+            # Algunos símbolos empiezan a cotizar más tarde.
+            desde = rng.integers(0, len(fechas) // 4) if rng.random() < 0.2 else 0
+            cierres = 100 * np.exp(np.cumsum(rng.normal(0.0003, 0.015, len(fechas) - desde)))
+            almacen.anadir(simbolo, fechas[desde:], cierres)
+        escritura = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        fechas_rejilla, cierres = almacen.matriz(simbolos)
+        carga = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        resultado = analizar(fechas_rejilla, cierres, rng.integers(1, 100, len(simbolos)))
+        calculo = time.perf_counter() - inicio
+
+    print(f"{args.simbolos} símbolos x {len(fechas)} sesiones")
+    print(f"  escritura inicial: {escritura:.2f} s")
+    print(f"  matriz alineada:   {carga * 1000:.0f} ms")
+    print(f"  analítica:         {calculo * 1000:.0f} ms "
+          f"(TWR {resultado['twr']:.1%}, MWR {resultado['mwr']:.1%}, drawdown {resultado['max_drawdown']:.1%})")
+    total = carga + calculo
+    print(f"  total {total * 1000:.0f} ms ({'OK' if total < PRESUPUESTO_S else 'por encima de'} {PRESUPUESTO_S:.0f} s)")
+
+
+if __name__ == "__main__":
+    main()
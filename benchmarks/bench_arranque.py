@@ -0,0 +1,85 @@
+# Uso: python -m benchmarks.bench_arranque
+# Mide el arranque en un proceso limpio: tiempo de importación de gui.main_window
+# (según -X importtime), módulos pesados cargados antes de abrir ninguna ventana y,
+# si hay pantalla, el tiempo hasta que el menú principal está dibujado.
+import os
+import subprocess
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PRESUPUESTO_IMPORTACION_MS = 150
+PRESUPUESTO_MENU_MS = 500
+MODULOS_DIFERIDOS = ("numpy", "pandas", "matplotlib", "yfinance")
+
+_SONDA = """
+import sys, time
+inicio = time.perf_counter()
+import gui.main_window as main_window
+importacion = time.perf_counter() - inicio
+cargados = [m for m in {modulos!r} if m in sys.modules]
+menu = -1.0
+try:
+    root = main_window.crear_menu_principal()
+    root.update()
+    menu = time.perf_counter() - inicio
+    root.destroy()
+    main_window.ejecutor.cerrar()
+except Exception:
+    pass
+print(importacion, menu, ",".join(cargados))
+"""
+
+
+def importtime(modulo):
+    salida = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+                            capture_output=True, text=True, check=True, cwd=RAIZ).stderr
+    for linea in salida.splitlines():
+        partes = linea.split("|")
+        if len(partes) == 3 and partes[2].strip() == modulo:
+            return int(partes[1]) / 1000
+    return None
+
+
+def medir():
+    salida = subprocess.run([sys.executable, "-c", _SONDA.format(modulos=MODULOS_DIFERIDOS)],
+                            capture_output=True, text=True, check=True, cwd=RAIZ).stdout.split()
+    importacion, menu = float(salida[0]) * 1000, float(salida[1]) * 1000
+    cargados = salida[2].split(",") if len(salida) > 2 else []
+    return {
+        "importtime_ms": importtime("gui.main_window"),
+        "importacion_ms": importacion,
+        "menu_ms": menu if menu >= 0 else None,
+        "modulos_pesados": cargados,
+    }
+
+
+def comprobar(resultado):
+    errores = []
+    if resultado["importacion_ms"] > PRESUPUESTO_IMPORTACION_MS:
+        errores.append(f"importación {resultado['importacion_ms']:.0f} ms > {PRESUPUESTO_IMPORTACION_MS} ms")
+    if resultado["menu_ms"] is not None and resultado["menu_ms"] > PRESUPUESTO_MENU_MS:
+        errores.append(f"menú {resultado['menu_ms']:.0f} ms > {PRESUPUESTO_MENU_MS} ms")
+    if resultado["modulos_pesados"]:
+        errores.append("módulos pesados cargados al arrancar: " + ", ".join(resultado["modulos_pesados"]))
+    return errores
+
+
+def main():
+    resultado = medir()
+    print(f"importtime gui.main_window: {resultado['importtime_ms']:.1f} ms")
+    print(f"importación (reloj): {resultado['importacion_ms']:.1f} ms (presupuesto {PRESUPUESTO_IMPORTACION_MS} ms)")
+    if resultado["menu_ms"] is None:
+        print("menú principal: sin pantalla disponible, se omite")
+    else:
+        print(f"menú principal visible: {resultado['menu_ms']:.1f} ms (presupuesto {PRESUPUESTO_MENU_MS} ms)")
+    errores = comprobar(resultado)
+    for error in errores:
+        print(f"❌ {error}")
+    if not errores:
+        print("✅ arranque dentro de presupuesto")
+    return 1 if errores else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
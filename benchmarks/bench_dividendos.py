@@ -0,0 +1,52 @@
+# Uso: python -m benchmarks.bench_dividendos [--activos 1000] [--anos 10] [--latencia 0.2]
+# Descarga simulada de dividendos trimestrales para una cartera sintética: primera
+# ingesta completa, segunda pasada sin pagos nuevos (solo fechas posteriores al último
+# pago) y peticiones al proveedor en cada una.
+import argparse
+import datetime
+import os
+import tempfile
+import time
+
+from models.asset import Asset
+from models.portfolio import Portfolio
+from services.dividendos import LibroDividendos, ingerir_dividendos
+from services.market_data import ProveedorFalso
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--activos", type=int, default=1000)
+    parser.add_argument("--anos", type=int, default=10)
+    parser.add_argument("--latencia", type=float, default=0.2, help="segundos por petición simulada")
+    args = parser.parse_args()
+
+    hoy = datetime.date.today()
+    inicio = datetime.date(hoy.year - args.anos + 1, 1, 1)
+    fechas = [datetime.date(ano, mes, 15).isoformat()
+              for ano in range(inicio.year, hoy.year + 1) for mes in (3, 6, 9, 12)
+              if datetime.date(ano, mes, 15) <= hoy]
+    simbolos = [f"SIM{i:05d}" for i in range(args.activos)]
+    proveedor = ProveedorFalso({}, latencia=args.latencia,
+                               dividendos={s: [(fecha, 0.25) for fecha in fechas] for s in simbolos})
+
+    with tempfile.TemporaryDirectory() as directorio:
+        portfolio = Portfolio(os.path.join(directorio, "cartera.json"))
+        with portfolio.transaction():
+            for simbolo in simbolos:
+                portfolio.add_asset(Asset(simbolo, simbolo, 100, 10.0, 1000.0, 'Sí', 'ACC', 'degiro'))
+        libro = LibroDividendos(os.path.join(directorio, "dividendos.db"))
+
+        for pasada in ("primera ingesta", "sin pagos nuevos"):
+            peticiones = proveedor.peticiones
+            comienzo = time.perf_counter()
+            resultado = ingerir_dividendos(portfolio, libro, proveedor, desde=inicio)
+            segundos = time.perf_counter() - comienzo
+            print(f"{pasada:<18} {segundos:>6.2f} s  {resultado['pagos']:>7,} pagos  "
+                  f"{proveedor.peticiones - peticiones:>4} peticiones")
+        print(f"años en el libro: {len(libro.anos())}, total {sum(libro.resumen().values()):,.2f}")
+        libro.cerrar()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# Uso: python -m benchmarks.bench_importacion [--n 100000] [--xlsx]
+# Genera una exportación sintética (CSV de degiro, o XLSX con --xlsx) y mide la
+# importación completa en una cartera vacía: lectura, precios por lotes y transacción.
+import argparse
+import csv
+import os
+import tempfile
+import time
+
+from models.portfolio import Portfolio
+from services.importacion import importar
+from services.market_data import ProveedorFalso
+
+CABECERA = ['Producto', 'Símbolo/ISIN', 'Cantidad', 'Precio de cierre', 'Valor en EUR']
+
+
+def filas(n):
+    for i in range(n):
+        precio = 1 + (i % 997) / 10
+        yield [f"Activo sintético {i}", f"SIM{i:06d}", str(i % 50 + 1), f"{precio:.2f}".replace('.', ','),
+               f"{precio * (i % 50 + 1):.2f}".replace('.', ',')]
+
+
+def crear_csv(ruta, n):
+    with open(ruta, 'w', newline='', encoding='utf-8') as f:
+        escritor = csv.writer(f, delimiter=';')
+        escritor.writerow(CABECERA)
+        escritor.writerows(filas(n))
+
+
+def crear_xlsx(ruta, n):
+    from openpyxl import Workbook
+
+    libro = Workbook(write_only=True)
+    hoja = libro.create_sheet()
+    hoja.append(CABECERA)
+    for fila in filas(n):
+        hoja.append(fila)
+    libro.save(ruta)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=100000)
+    parser.add_argument("--xlsx", action="store_true", help="mide también la lectura de XLSX")
+    args = parser.parse_args()
+
+    variantes = [("csv", crear_csv)]
+    if args.xlsx:
+        variantes.append(("xlsx", crear_xlsx))
+
+    with tempfile.TemporaryDirectory() as directorio:
+        for extension, crear in variantes:
+            ruta = os.path.join(directorio, f"export.{extension}")
+            crear(ruta, args.n)
+            portfolio = Portfolio(os.path.join(directorio, f"cartera_{extension}.json"))
+            proveedor = ProveedorFalso({f"SIM{i:06d}": 2.0 for i in range(args.n)})
+            inicio = time.perf_counter()
+            resumen = importar(portfolio, ruta, formato='degiro', proveedor=proveedor)
+            segundos = time.perf_counter() - inicio
+            print(f"{extension}: {resumen['leidas']} filas en {segundos:.2f} s "
+                  f"({resumen['leidas'] / segundos:,.0f} filas/s), {resumen['nuevas']} altas, "
+                  f"{proveedor.peticiones} peticiones de precios")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# Uso: python -m benchmarks.bench_operaciones [--n 1000000] [--simbolos 2000]
+# Genera un libro sintético de operaciones (compras, ventas, algún split y comisiones) y
+# mide: inserción, construcción completa de lotes FIFO y coste medio, cálculo de
+# resultados, una actualización incremental de 1000 operaciones y la recarga desde el
+# punto de control.
+import argparse
+import datetime
+import os
+import random
+import tempfile
+import time
+
+from services.operaciones import LibroOperaciones, MotorCoste, METODOS
+
+BROKERS = ['degiro', 'ocean']
+INCREMENTO = 1000
+
+
+def generar(n, simbolos, rng, inicio=datetime.date(2000, 1, 1), desde=0):
+    # Fechas crecientes; las ventas no superan la cantidad comprada hasta el momento.
+    cantidades = {}
+    for i in range(desde, desde + n):
+        fecha = (inicio + datetime.timedelta(days=i * 9000 // 1000000)).isoformat()
+        clave = (f"SIM{rng.randrange(simbolos):05d}", rng.choice(BROKERS))
+        precio = round(rng.uniform(5, 300), 2)
+        sorteo = rng.random()
+        disponible = cantidades.get(clave, 0)
+        if sorteo < 0.0005 and disponible:
+            cantidades[clave] = disponible * 2
+            yield (fecha, *clave, 'split', 2)
+        elif sorteo < 0.01:
+            yield (fecha, *clave, 'comision', 0, 0.0, 1.5)
+        elif sorteo < 0.4 and disponible:
+            cantidad = rng.randint(1, disponible)
+            cantidades[clave] = disponible - cantidad
+            yield (fecha, *clave, 'venta', cantidad, precio, 2.0)
+        else:
+            cantidad = rng.randint(1, 100)
+            cantidades[clave] = disponible + cantidad
+            yield (fecha, *clave, 'compra', cantidad, precio, 2.0)
+
+
+def cronometro(etiqueta, funcion):
+    inicio = time.perf_counter()
+    resultado = funcion()
+    print(f"{etiqueta:<42} {time.perf_counter() - inicio:>8.2f} s")
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=1000000)
+    parser.add_argument("--simbolos", type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    precios = {f"SIM{i:05d}": 100.0 for i in range(args.simbolos)}
+    with tempfile.TemporaryDirectory() as directorio:
+        libro = LibroOperaciones(os.path.join(directorio, "operaciones.db"))
+        cronometro(f"inserción de {args.n:,} operaciones", lambda: libro.registrar_lote(generar(args.n, args.simbolos, rng)))
+        for metodo in METODOS:
+            motor = MotorCoste(libro, metodo)
+            cronometro(f"[{metodo}] construcción completa", motor.actualizar)
+            resultados = cronometro(f"[{metodo}] resultados de {len(motor.posiciones):,} posiciones",
+                                    lambda: motor.resultados(precios))
+            latente = sum(fila['latente'] for fila in resultados.values())
+            realizado = sum(fila['realizado'] for fila in resultados.values())
+            print(f"{'':<42} latente {latente:,.0f}, realizado {realizado:,.0f}")
+            cronometro(f"[{metodo}] punto de control", motor.guardar)
+
+        libro.registrar_lote(generar(INCREMENTO, args.simbolos, rng, desde=args.n))
+        for metodo in METODOS:
+            motor = cronometro(f"[{metodo}] recarga desde el punto de control", lambda: MotorCoste(libro, metodo))
+            procesadas = cronometro(f"[{metodo}] incremental de {INCREMENTO} operaciones", motor.actualizar)
+            assert procesadas == INCREMENTO, procesadas
+        libro.cerrar()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+# Uso: python -m benchmarks.bench_persistencia [--n 10000] [--sin-legacy]
+# Compara N altas secuenciales con diario + compactación frente a reescribir
+# todo el JSON en cada alta (comportamiento anterior de Portfolio.save_assets).
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from models.asset import Asset
+from models.portfolio import Portfolio
+
+
+def activo(i):
+    return Asset(f"SIM{i:06d}", f"Activo sintético {i}", 10, 1.5, 15.0, 'No', 'ACC', 'degiro')
+
+
+def altas_legacy(ruta, n):
+    activos = []
+    inicio = time.perf_counter()
+    for i in range(n):
+        activos.append(activo(i))
+        with open(ruta, 'w') as f:
+            json.dump([a.to_dict() for a in activos], f, indent=4)
+    return time.perf_counter() - inicio
+
+
+def altas_diario(ruta, n):
+    portfolio = Portfolio(ruta)
+    inicio = time.perf_counter()
+    for i in range(n):
+        portfolio.add_asset(activo(i))
+    portfolio.compact()
+    return time.perf_counter() - inicio
+
+
+def altas_transaccion(ruta, n):
+    portfolio = Portfolio(ruta)
+    inicio = time.perf_counter()
+    with portfolio.transaction():
+        for i in range(n):
+            portfolio.add_asset(activo(i))
+    portfolio.compact()
+    return time.perf_counter() - inicio
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=10000)
+    parser.add_argument("--sin-legacy", action="store_true", help="omite la variante anterior (O(n²))")
+    args = parser.parse_args()
+
+    variantes = [("diario", altas_diario), ("transacción", altas_transaccion)]
+    if not args.sin_legacy:
+        variantes.insert(0, ("reescritura completa", altas_legacy))
+
+    with tempfile.TemporaryDirectory() as directorio:
+        for nombre, funcion in variantes:
+            ruta = os.path.join(directorio, f"{funcion.__name__}.json")
+            segundos = funcion(ruta, args.n)
+            print(f"{nombre:>22}: {args.n} altas en {segundos:.2f}s ({args.n / segundos:.0f} altas/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# Uso: python -m benchmarks.bench_rebalanceo [--activos 5000] [--escenarios 1000]
+# Cartera sintética repartida entre tipos y brokers con efectivo en uno de ellos. Mide la
+# primera resolución (con la lista de operaciones), las re-resoluciones con precios
+# nuevos partiendo de la anterior y los escenarios por segundo sin lista de operaciones.
+# Comprueba en cada escenario que ningún broker queda en negativo.
+import argparse
+import time
+
+import numpy as np
+
+from services.rebalanceo import Rebalanceo
+
+TIPOS = ['ACC', 'ETF', 'PP', 'FON']
+BROKERS = ['sant', 'cxbank', 'bbva', 'degiro', 'ocean']
+OBJETIVOS = {'ACC': 45, 'ETF': 35, 'PP': 10, 'FON': 10}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--activos", type=int, default=5000)
+    parser.add_argument("--escenarios", type=int, default=1000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    n = args.activos
+    precios = rng.uniform(1, 500, n)
+    inicio = time.perf_counter()
+    rebalanceo = Rebalanceo([f"SIM{i:06d}" for i in range(n)], rng.integers(1, 500, n), precios,
+                            rng.choice(TIPOS, n), rng.choice(BROKERS, n), OBJETIVOS,
+                            efectivo={'degiro': 100_000.0}, lotes={'FON': 10}, minimo=50.0)
+    construccion = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    resultado = rebalanceo.resolver()
+    primera = time.perf_counter() - inicio
+    print(f"{n:,} posiciones")
+    print(f"  codificación:         {construccion * 1000:7.2f} ms")
+    print(f"  primera resolución:   {primera * 1000:7.2f} ms, {resultado['iteraciones']} iteraciones, "
+          f"{len(resultado['operaciones']):,} operaciones, desviación {resultado['desviacion']:.1e}")
+
+    escenarios = [precios * rng.normal(1, 0.02, n) for _ in range(args.escenarios)]
+    inicio = time.perf_counter()
+    resultado = rebalanceo.resolver(escenarios[0])
+    print(f"  re-resolución:        {(time.perf_counter() - inicio) * 1000:7.2f} ms, "
+          f"{resultado['iteraciones']} iteraciones (con lista de operaciones)")
+
+    iteraciones = 0
+    inicio = time.perf_counter()
+    for precios_escenario in escenarios:
+        resultado = rebalanceo.resolver(precios_escenario, detalle=False)
+        iteraciones += resultado['iteraciones']
+        assert min(resultado['efectivo_restante'].values(), default=0.0) >= -1e-6
+    segundos = time.perf_counter() - inicio
+    print(f"  escenarios:           {args.escenarios / segundos:7.0f} /s, "
+          f"{iteraciones / args.escenarios:.1f} iteraciones de media")
+
+
+if __name__ == "__main__":
+    main()
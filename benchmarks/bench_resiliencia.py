@@ -0,0 +1,39 @@
+# Uso: python -m benchmarks.bench_resiliencia [--simbolos 1000]
+# Sin red: pide cotizaciones a un proveedor que simula 429 y timeouts, a través del
+# limitador de tasa y el cortacircuitos, y muestra cobertura, tiempo y métricas.
+import argparse
+import time
+
+from services.market_data import ProveedorInestable, obtener_cotizaciones, ESTADO_MISSING
+from services.resiliencia import ProveedorResiliente, LimitadorTasa, Cortacircuitos
+
+ESCENARIOS = [
+    ("estable", dict()),
+    ("429 ocasionales", dict(prob_limite=0.2, reintentar_en=0.05)),
+    ("timeouts", dict(prob_timeout=0.2, espera_timeout=0.05)),
+    ("caída total", dict(prob_limite=1.0, reintentar_en=0.05)),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--simbolos", type=int, default=1000)
+    args = parser.parse_args()
+
+    precios = {f"SIM{i:05d}": 1.0 + i for i in range(args.simbolos)}
+    for nombre, opciones in ESCENARIOS:
+        base = ProveedorInestable(precios, semilla=1, **opciones)
+        proveedor = ProveedorResiliente(base, LimitadorTasa(tasa=50, capacidad=10),
+                                        Cortacircuitos(umbral=5, reapertura=1.0), pausa_limite=0.05)
+        inicio = time.perf_counter()
+        cotizaciones = obtener_cotizaciones(list(precios), proveedor, tamano_lote=20, espera=0.02)
+        segundos = time.perf_counter() - inicio
+        obtenidas = sum(1 for c in cotizaciones.values() if c.estado != ESTADO_MISSING)
+        metricas = proveedor.metricas.instantanea()
+        print(f"{nombre:>16}: {obtenidas}/{len(precios)} precios en {segundos:.2f} s, "
+              f"{metricas['peticiones']} llamadas al proveedor, {metricas['rechazadas']} rechazadas, "
+              f"circuito {proveedor.cortacircuitos.estado}, errores {metricas['errores']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+# Uso: python -m benchmarks.bench_revalorizacion [--carteras 200] [--posiciones 300]
+# Revaloriza N carteras sintéticas con símbolos solapados usando 1 proceso y todos
+# los núcleos, e informa de las peticiones al proveedor (no deberían crecer con N).
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from models.asset import Asset
+from services.market_data import ProveedorFalso
+from services.revalorizacion import revalorizar_carteras
+
+UNIVERSO = 2000
+
+
+def crear_carteras(directorio, n, posiciones):
+    rng = random.Random(1)
+    rutas = []
+    for i in range(n):
+        ruta = os.path.join(directorio, f"cartera_{i:04d}.json")
+        simbolos = rng.sample(range(UNIVERSO), posiciones)
+        activos = [Asset(f"SIM{s:05d}", f"Activo {s}", 10, 1.0, 10.0, 'No', 'ACC', 'degiro').to_dict()
+                   for s in simbolos]
+        with open(ruta, 'w') as f:
+            json.dump(activos, f)
+        rutas.append(ruta)
+    return rutas
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--carteras", type=int, default=200)
+    parser.add_argument("--posiciones", type=int, default=300)
+    args = parser.parse_args()
+
+    precios = {f"SIM{s:05d}": 1.0 + s / 100 for s in range(UNIVERSO)}
+    with tempfile.TemporaryDirectory() as directorio:
+        rutas = crear_carteras(directorio, args.carteras, args.posiciones)
+        for procesos in sorted({1, os.cpu_count() or 1}):
+            proveedor = ProveedorFalso(precios)
+            inicio = time.perf_counter()
+            resultado = revalorizar_carteras(rutas, proveedor, procesos=procesos)
+            segundos = time.perf_counter() - inicio
+            print(f"{args.carteras} carteras, {procesos:>2} procesos: {segundos:6.2f} s "
+                  f"({args.carteras / segundos:.0f} carteras/s), {resultado['simbolos']} símbolos, "
+                  f"{proveedor.peticiones} peticiones")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+# Uso: python -m benchmarks.bench_riesgo [--caminos 1000000] [--activos 300] [--procesos N]
+# Estima el modelo de covarianza sobre un histórico sintético correlacionado (un factor de
+# mercado más ruido propio) y mide la simulación Monte Carlo completa: tiempo, memoria
+# máxima del proceso principal y de los trabajadores, y reproducibilidad con otra
+# cantidad de procesos.
+import argparse
+import os
+import resource
+import time
+
+import numpy as np
+
+from services.riesgo import modelo_covarianza, simular
+
+SESIONES = 504
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--caminos", type=int, default=1_000_000)
+    parser.add_argument("--activos", type=int, default=300)
+    parser.add_argument("--procesos", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--sin-comprobar", action="store_true", help="omite la repetición con un solo proceso")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    mercado = rng.normal(0.0003, 0.01, SESIONES)
+    betas = rng.uniform(0.5, 1.5, args.activos)
+    rentabilidades = mercado[:, None] * betas + rng.normal(0, 0.012, (SESIONES, args.activos))
+    cierres = 100 * np.exp(np.cumsum(rentabilidades, axis=0))
+    valores = rng.uniform(1_000, 20_000, args.activos)
+
+    inicio = time.perf_counter()
+    media, covarianza, _ = modelo_covarianza(cierres)
+    modelo = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    resultado = simular(valores, media, covarianza, caminos=args.caminos, procesos=args.procesos, semilla=1)
+    segundos = time.perf_counter() - inicio
+
+    propio = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    hijos = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    print(f"{args.caminos:,} caminos x {args.activos} activos, {args.procesos} procesos")
+    print(f"  modelo de covarianza: {modelo * 1000:.0f} ms")
+    print(f"  simulación:           {segundos:.2f} s ({args.caminos / segundos:,.0f} caminos/s)")
+    if args.procesos > 1:
+        print(f"  memoria máxima:       {propio:.0f} MB principal, {hijos:.0f} MB por trabajador")
+    else:
+        print(f"  memoria máxima:       {propio:.0f} MB")
+    for nivel in resultado['var']:
+        print(f"  VaR {nivel:.0%}: {resultado['var'][nivel]:,.0f}   CVaR {nivel:.0%}: {resultado['cvar'][nivel]:,.0f}")
+    contribuciones = resultado['contribuciones']
+    print(f"  suma de contribuciones {contribuciones.sum():,.0f}, mayor {contribuciones.max():,.0f}")
+
+    if not args.sin_comprobar and args.procesos > 1:
+        repeticion = simular(valores, media, covarianza, caminos=args.caminos, procesos=1, semilla=1)
+        iguales = repeticion['var'] == resultado['var'] and np.allclose(repeticion['contribuciones'], contribuciones)
+        print(f"  mismo resultado con 1 proceso: {'sí' if iguales else 'NO'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# Uso: python -m benchmarks.bench_tabla_cartera
+# Mide el tiempo de apertura y la memoria residente de la tabla de cartera a 100, 1k y 10k filas.
+import os
+import random
+import time
+import tkinter as tk
+
+from gui.tabla_cartera import TablaCartera
+
+TAMANOS = [100, 1000, 10000]
+TIPOS = ['ACC', 'ETF', 'PP', 'FON']
+BROKERS = ['ocean', 'degiro', 'cxbank', 'bbva', 'sant']
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            paginas = int(f.read().split()[1])
+        return paginas * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def filas_sinteticas(n):
+    filas = []
+    for i in range(n):
+        cantidad = random.randint(1, 500)
+        precio = round(random.uniform(1, 300), 2)
+        filas.append({
+            'símbolo': f"SIM{i:06d}",
+            'título': f"Activo sintético {i}",
+            'cantidad': cantidad,
+            'precio_actual': precio,
+            'importe_total': cantidad * precio,
+            'dividendos': 'No',
+            'tipo_activo': random.choice(TIPOS),
+            'broker': random.choice(BROKERS),
+        })
+    return filas
+
+
+def medir(raiz, n):
+    filas = filas_sinteticas(n)
+    total = sum(fila['importe_total'] for fila in filas)
+    rss_antes = rss_mb()
+    inicio = time.perf_counter()
+    ventana = tk.Toplevel(raiz)
+    tabla = TablaCartera(ventana)
+    tabla.pack(fill=tk.BOTH, expand=True)
+    tabla.cargar(filas, total)
+    ventana.update()
+    apertura = time.perf_counter() - inicio
+    rss = rss_mb() - rss_antes
+    widgets = len(ventana.winfo_children()) + len(tabla.frame.winfo_children())
+    ventana.destroy()
+    return apertura, rss, widgets
+
+
+def main():
+    try:
+        raiz = tk.Tk()
+    except tk.TclError as e:
+        print(f"Sin pantalla disponible, se omite el benchmark: {e}")
+        return
+    raiz.withdraw()
+    print(f"{'filas':>8} {'apertura (s)':>14} {'RSS (MB)':>10} {'widgets':>8}")
+    for n in TAMANOS:
+        apertura, rss, widgets = medir(raiz, n)
+        print(f"{n:>8} {apertura:>14.3f} {rss:>10.1f} {widgets:>8}")
+    raiz.destroy()
+
+
+if __name__ == "__main__":
+    main()
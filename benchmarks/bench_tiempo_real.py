@@ -0,0 +1,60 @@
+# Uso: python -m benchmarks.bench_tiempo_real [--activos 2000] [--ticks 5000] [--segundos 5]
+# Alimenta el motor de tiempo real con la fuente simulada y aplica los ticks por
+# fotogramas, como la ventana de cartera pero sin Tk: mide el coste por fotograma y
+# comprueba que los totales incrementales coinciden con un recálculo completo.
+import argparse
+import statistics
+import tempfile
+import time
+
+from models.asset import Asset
+from models.portfolio import Portfolio
+from services.agregados import agregados_cartera
+from services.tiempo_real import FuenteSimulada, MotorTiempoReal
+
+FOTOGRAMA = 0.1
+PRESUPUESTO_FOTOGRAMA_MS = 16
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--activos", type=int, default=2000)
+    parser.add_argument("--ticks", type=int, default=5000, help="ticks por segundo de la fuente")
+    parser.add_argument("--segundos", type=float, default=5.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directorio:
+        portfolio = Portfolio(f"{directorio}/cartera.json")
+        with portfolio.transaction():
+            for i in range(args.activos):
+                portfolio.add_asset(Asset(f"SIM{i:05d}", f"Activo {i}", 10, 100.0, 1000.0, 'No',
+                                          ['ACC', 'ETF'][i % 2], ['degiro', 'ocean'][i % 2]))
+        totales = {k: (dict(v) if isinstance(v, dict) else v) for k, v in agregados_cartera(portfolio).items()}
+        fuente = FuenteSimulada({a.simbolo: a.precio_actual for a in portfolio.get_all_assets()},
+                                ticks_por_segundo=args.ticks)
+        motor = MotorTiempoReal(portfolio, fuente)
+
+        tiempos = []
+        motor.iniciar()
+        fin = time.perf_counter() + args.segundos
+        while time.perf_counter() < fin:
+            time.sleep(FOTOGRAMA)
+            inicio = time.perf_counter()
+            motor.aplicar(totales)
+            tiempos.append(time.perf_counter() - inicio)
+        motor.detener(totales)
+
+        recalculado = agregados_cartera(portfolio)
+        desviacion = abs(recalculado['general'] - totales['general'])
+
+    tiempos.sort()
+    p95 = tiempos[int(0.95 * (len(tiempos) - 1))] * 1000
+    print(f"{fuente.emitidos / args.segundos:,.0f} ticks/s emitidos, {motor.recibidos:,} recibidos, "
+          f"{motor.aplicados:,} cambios aplicados en {len(tiempos)} fotogramas")
+    print(f"fotograma: mediana {statistics.median(tiempos) * 1000:.2f} ms, p95 {p95:.2f} ms "
+          f"({'OK' if p95 < PRESUPUESTO_FOTOGRAMA_MS else 'por encima de'} {PRESUPUESTO_FOTOGRAMA_MS} ms)")
+    print(f"diferencia total incremental vs. recálculo: {desviacion:.6f}")
+
+
+if __name__ == "__main__":
+    main()
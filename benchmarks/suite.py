@@ -0,0 +1,201 @@
+# Uso: python -m benchmarks.suite [--tamanos 100 10000 100000] [--anos 30]
+#                                 [--salida resultados.json] [--comparar base.json] [--tolerancia 0.25]
+# Genera carteras y libros de dividendos sintéticos, mide las rutas principales y guarda
+# los tiempos en JSON. Con --comparar marca como regresión toda operación que supere la
+# referencia en más de la tolerancia y termina con código 1.
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from models.asset import Asset
+from models.portfolio import Portfolio
+from services.agregados import calcular_agregados
+from services.dividendos import LibroDividendos, migrar_desde_json
+from services.market_data import ProveedorFalso, obtener_cotizaciones
+from services.valoracion import resumen_dividendos
+
+TAMANOS = [100, 10000, 100000]
+ANOS_DIVIDENDOS = 30
+# Como mucho estos activos pagan dividendo (trimestral), para acotar el tamaño del libro.
+MAX_PAGADORES = 5000
+REPETICIONES = 3
+TOLERANCIA = 0.25
+# Diferencias por debajo de este margen (s) son ruido de medida, no regresiones.
+MARGEN_RUIDO = 0.005
+
+TIPOS = ['ACC', 'ETF', 'PP', 'FON']
+BROKERS = ['ocean', 'degiro', 'cxbank', 'bbva', 'sant']
+
+
+def generar_cartera(ruta, n, rng):
+    activos = []
+    for i in range(n):
+        cantidad = rng.randint(1, 500)
+        precio = round(rng.uniform(1, 300), 2)
+        activos.append(Asset(f"SIM{i:06d}", f"Activo sintético {i}", cantidad, precio, cantidad * precio,
+                             'Sí' if i % 3 == 0 else 'No', rng.choice(TIPOS), rng.choice(BROKERS)).to_dict())
+    with open(ruta, 'w') as f:
+        json.dump(activos, f, indent=4)
+    return [activo['símbolo'] for activo in activos]
+
+
+def generar_dividendos(ruta, simbolos, anos, rng):
+    # Formato heredado de dividendos.json: {"año": {"símbolo": [12 textos]}}.
+    pagadores = simbolos[::3][:MAX_PAGADORES]
+    ano_final = time.localtime().tm_year
+    datos = {}
+    for ano in range(ano_final - anos + 1, ano_final + 1):
+        datos[str(ano)] = {
+            simbolo: [f"{rng.uniform(1, 50):.2f}" if mes % 3 == 2 else "" for mes in range(12)]
+            for simbolo in pagadores
+        }
+    with open(ruta, 'w') as f:
+        json.dump(datos, f)
+    return pagadores
+
+
+def cronometrar(funcion, repeticiones=REPETICIONES):
+    # Mediana de varias ejecuciones, menos sensible a picos puntuales que la media.
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return statistics.median(tiempos)
+
+
+def medir_tabla(n, rng):
+    import tkinter as tk
+    from gui.tabla_cartera import TablaCartera
+
+    try:
+        raiz = tk.Tk()
+    except tk.TclError:
+        return None
+    raiz.withdraw()
+    filas = []
+    for i in range(n):
+        cantidad = rng.randint(1, 500)
+        precio = round(rng.uniform(1, 300), 2)
+        filas.append({'símbolo': f"SIM{i:06d}", 'título': f"Activo {i}", 'cantidad': cantidad,
+                      'precio_actual': precio, 'importe_total': cantidad * precio,
+                      'tipo_activo': rng.choice(TIPOS), 'broker': rng.choice(BROKERS)})
+    total = sum(fila['importe_total'] for fila in filas)
+
+    def abrir():
+        ventana = tk.Toplevel(raiz)
+        tabla = TablaCartera(ventana)
+        tabla.pack(fill=tk.BOTH, expand=True)
+        tabla.cargar(filas, total)
+        ventana.update()
+        ventana.destroy()
+
+    try:
+        return cronometrar(abrir)
+    finally:
+        raiz.destroy()
+
+
+def medir_tamano(n, anos, directorio, con_tk):
+    rng = random.Random(n)
+    ruta_cartera = os.path.join(directorio, f"cartera_{n}.json")
+    ruta_dividendos = os.path.join(directorio, f"dividendos_{n}.json")
+    simbolos = generar_cartera(ruta_cartera, n, rng)
+    pagadores = generar_dividendos(ruta_dividendos, simbolos, anos, rng)
+    resultados = {}
+
+    resultados['portfolio.load_assets'] = cronometrar(lambda: Portfolio(ruta_cartera))
+    portfolio = Portfolio(ruta_cartera)
+    resultados['portfolio.save_assets'] = cronometrar(portfolio.save_assets)
+    resultados['agregados'] = cronometrar(lambda: calcular_agregados(portfolio.to_columns()))
+
+    ruta_libro = os.path.join(directorio, f"dividendos_{n}.db")
+    libro = LibroDividendos(ruta_libro)
+    inicio = time.perf_counter()
+    migrar_desde_json(ruta_dividendos, libro)
+    resultados['dividendos.migrar_json'] = time.perf_counter() - inicio
+    resultados['dividendos.resumen'] = cronometrar(lambda: resumen_dividendos(libro, pagadores))
+    libro.cerrar()
+
+    proveedor = ProveedorFalso({simbolo: 1.0 for simbolo in simbolos})
+    resultados['cotizaciones'] = cronometrar(lambda: obtener_cotizaciones(simbolos, proveedor))
+
+    if con_tk:
+        tabla = medir_tabla(n, rng)
+        if tabla is not None:
+            resultados['gui.tabla_cartera'] = tabla
+    return resultados
+
+
+def comparar(actual, base, tolerancia):
+    regresiones = []
+    for tamano, operaciones in actual['resultados'].items():
+        for operacion, segundos in operaciones.items():
+            referencia = base.get('resultados', {}).get(tamano, {}).get(operacion)
+            if referencia and segundos > referencia * (1 + tolerancia) and segundos - referencia > MARGEN_RUIDO:
+                regresiones.append((tamano, operacion, referencia, segundos))
+    return regresiones
+
+
+def hay_pantalla():
+    import tkinter as tk
+
+    try:
+        tk.Tk().destroy()
+    except tk.TclError:
+        return False
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tamanos", type=int, nargs="+", default=TAMANOS)
+    parser.add_argument("--anos", type=int, default=ANOS_DIVIDENDOS)
+    parser.add_argument("--salida", help="fichero JSON donde guardar los resultados")
+    parser.add_argument("--comparar", help="resultados de referencia (JSON) para detectar regresiones")
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA,
+                        help="fracción de empeoramiento admitida frente a la referencia")
+    args = parser.parse_args(argv)
+
+    con_tk = hay_pantalla()
+    if not con_tk:
+        print("Sin pantalla disponible: se omiten las mediciones de Tk (use xvfb-run para incluirlas).")
+
+    actual = {
+        'fecha': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'python': platform.python_version(),
+        'maquina': platform.platform(),
+        'anos_dividendos': args.anos,
+        'resultados': {},
+    }
+    with tempfile.TemporaryDirectory() as directorio:
+        for n in args.tamanos:
+            resultados = medir_tamano(n, args.anos, directorio, con_tk)
+            actual['resultados'][str(n)] = resultados
+            for operacion, segundos in resultados.items():
+                print(f"{n:>8} {operacion:<28} {segundos * 1000:>10.1f} ms")
+
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            json.dump(actual, f, indent=2)
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            base = json.load(f)
+        regresiones = comparar(actual, base, args.tolerancia)
+        for tamano, operacion, referencia, segundos in regresiones:
+            print(f"REGRESIÓN {tamano} {operacion}: {referencia * 1000:.1f} ms -> {segundos * 1000:.1f} ms")
+        if regresiones:
+            return 1
+        print(f"Sin regresiones frente a {args.comparar} (tolerancia {args.tolerancia:.0%}).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+import math
+import tkinter as tk
+
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+
+
+# Los gráficos usan Figure directamente (no pyplot), así que no quedan registrados
+# globalmente y se liberan al cerrar la ventana. actualizar() reutiliza los artistas
+# existentes siempre que las categorías no cambien.
+class GraficoBarras:
+    def __init__(self, master, titulo, ylabel, figsize=(5, 3)):
+        self.titulo = titulo
+        self.ylabel = ylabel
+        self.figura = Figure(figsize=figsize)
+        self.ax = self.figura.add_subplot()
+        self.canvas = FigureCanvasTkAgg(self.figura, master=master)
+        self.etiquetas = None
+        self.barras = None
+        self.textos = []
+
+    def widget(self):
+        return self.canvas.get_tk_widget()
+
+    def _dibujar(self, etiquetas, valores, colores):
+        self.ax.clear()
+        self.barras = self.ax.bar(etiquetas, valores, color=colores)
+        self.ax.set_ylabel(self.ylabel)
+        self.ax.set_title(self.titulo)
+        self.etiquetas = list(etiquetas)
+        self.textos = self.ax.bar_label(self.barras, fmt='%.0f€')
+        self.figura.tight_layout()
+
+    def actualizar(self, etiquetas, valores, colores):
+        if self.barras is None or list(etiquetas) != self.etiquetas:
+            self._dibujar(etiquetas, valores, colores)
+        else:
+            for barra, valor in zip(self.barras, valores):
+                barra.set_height(valor)
+            for texto in self.textos:
+                texto.remove()
+            # bar_label tomaría las alturas originales del contenedor; se pasan los textos ya formateados.
+            self.textos = self.ax.bar_label(self.barras, labels=[f"{valor:.0f}€" for valor in valores])
+            self.ax.relim()
+            self.ax.autoscale_view()
+        self.canvas.draw_idle()
+
+
+class GraficoTarta:
+    ANGULO_INICIAL = 140
+    DISTANCIA_ETIQUETA = 1.1
+    DISTANCIA_PORCENTAJE = 0.6
+
+    def __init__(self, master, titulo, figsize=(7, 5)):
+        self.titulo = titulo
+        self.figura = Figure(figsize=figsize)
+        self.ax = self.figura.add_subplot()
+        self.canvas = FigureCanvasTkAgg(self.figura, master=master)
+        self.etiquetas = None
+        self.cunas = None
+        self.textos = None
+        self.porcentajes = None
+
+    def widget(self):
+        return self.canvas.get_tk_widget()
+
+    def _dibujar(self, etiquetas, valores, colores):
+        self.ax.clear()
+        self.etiquetas = list(etiquetas)
+        if not valores:
+            self.cunas = None
+            return
+        self.cunas, self.textos, self.porcentajes = self.ax.pie(
+            valores, labels=etiquetas, autopct='%1.1f%%', startangle=self.ANGULO_INICIAL,
+            colors=colores, textprops={'fontsize': 10})
+        self.ax.axis('equal')
+        self.ax.set_title(self.titulo, fontsize=14, fontweight='bold')
+
+    def actualizar(self, etiquetas, valores, colores):
+        if self.cunas is None or list(etiquetas) != self.etiquetas:
+            self._dibujar(etiquetas, valores, colores)
+        else:
+            total = float(sum(valores))
+            theta1 = self.ANGULO_INICIAL
+            for cuna, texto, porcentaje, valor in zip(self.cunas, self.textos, self.porcentajes, valores):
+                fraccion = valor / total
+                theta2 = theta1 + 360 * fraccion
+                cuna.set_theta1(theta1)
+                cuna.set_theta2(theta2)
+                medio = math.radians((theta1 + theta2) / 2)
+                x, y = math.cos(medio), math.sin(medio)
+                texto.set_position((self.DISTANCIA_ETIQUETA * x, self.DISTANCIA_ETIQUETA * y))
+                texto.set_horizontalalignment('left' if x > 0 else 'right')
+                porcentaje.set_position((self.DISTANCIA_PORCENTAJE * x, self.DISTANCIA_PORCENTAJE * y))
+                porcentaje.set_text(f"{fraccion * 100:.1f}%")
+                theta1 = theta2
+        self.canvas.draw_idle()
+
+
+# Conjunto de etiquetas "clave: total" que se crean, actualizan u ocultan según los totales.
+class ListaTotales:
+    def __init__(self, master, formato):
+        self.master = master
+        self.formato = formato
+        self.labels = {}
+
+    def actualizar(self, totales):
+        for clave, total in totales.items():
+            label = self.labels.get(clave)
+            if label is None:
+                label = tk.Label(self.master, font=("Arial", 11))
+                self.labels[clave] = label
+            if total > 0:
+                label.config(text=self.formato(clave, total))
+                if not label.winfo_manager():
+                    label.pack(anchor="w", padx=10, pady=2)
+            else:
+                label.pack_forget()
+        for clave, label in self.labels.items():
+            if clave not in totales:
+                label.pack_forget()
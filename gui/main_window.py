@@ -1,21 +1,94 @@
 import tkinter as tk
-from tkinter import messagebox
-import json
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from tkinter import messagebox, filedialog
+import copy
+import datetime
+import math
+import os
+import time
 from tkinter import ttk
-import pandas as pd
 
 from models.portfolio import Portfolio
-from services.market_data import obtener_precios_actuales
+from services.market_data import obtener_precios_actuales, ESTADO_MISSING
+from services.valoracion import ORDEN_TIPOS, ordenar_posiciones, refrescar_precios, resumen_dividendos
 from models.asset import Asset
+from services.dividendos import obtener_libro, formatear_importe
+from services.divisas import DIVISAS
+from services.instrumentacion import medido
+from gui.tareas import EjecutorTareas, GuardadoDiferido, volcar_guardados
+from gui.tabla_cartera import TablaCartera, COLORES_TIPO
 
 CARTERA_ARCHIVO = "data/cartera.json"
-DIVIDENDOS_ARCHIVO = "data/dividendos.json"
 
-portfolio = Portfolio(CARTERA_ARCHIVO)
+# Orden de presentación; las categorías en sí se descubren a partir de los datos.
+ORDEN_BROKERS = ['sant', 'cxbank', 'bbva', 'degiro', 'ocean']
+
+# Segundos sin ver una pestaña de año antes de destruir su rejilla, y cada cuánto se comprueba.
+INACTIVIDAD_PESTANA = 300
+COMPROBACION_PESTANAS_MS = 60000
+
+# Símbolos por petición al refrescar toda la cartera (marca el paso de la barra de progreso).
+LOTE_REFRESCO = 25
+
+# Caminos Monte Carlo de la ventana de riesgo (el CLI admite más con --caminos).
+CAMINOS_RIESGO = 200_000
+
+# Modo en tiempo real: las filas cambiadas se pintan como mucho a 10 fotogramas por segundo;
+# totales, porcentajes y gráficos, una vez por segundo. CARTERA_FUENTE=simulada usa un feed local.
+INTERVALO_FOTOGRAMA_MS = 100
+INTERVALO_GRAFICOS = 1.0
+INTERVALO_SONDEO_VIVO = 30.0
+
+# La cartera se carga la primera vez que una ventana la necesita, no al importar el módulo.
+_portfolio = None
+ejecutor = None
+
+# Motores de tiempo real en marcha. Salir destruye las ventanas sin pasar por su cierre,
+# así que iniciar_gui los detiene (y guarda sus últimos precios) antes de terminar.
+_motores_vivos = set()
+
+def obtener_portfolio():
+    global _portfolio
+    if _portfolio is None:
+        _portfolio = Portfolio(CARTERA_ARCHIVO)
+    return _portfolio
+
+def leer_cantidad(texto):
+    # Admite decimales (participaciones de fondos, importaciones como 607,4) con coma o
+    # punto; las cantidades enteras se guardan como int, igual que en la importación.
+    try:
+        cantidad = float(texto.strip().replace(',', '.'))
+    except ValueError:
+        return None
+    if not math.isfinite(cantidad) or cantidad < 0:
+        return None
+    return int(cantidad) if cantidad.is_integer() else cantidad
+
+def anotar_operacion(libro, simbolo, broker, diferencia, precio, divisa):
+    # Un cambio de cantidad hecho a mano queda en el libro como compra o venta al precio actual.
+    if diferencia:
+        libro.registrar(datetime.date.today().isoformat(), simbolo, broker,
+                        'compra' if diferencia > 0 else 'venta', abs(diferencia), precio, 0.0, divisa)
+
+def anotar_edicion(libro, anterior, editado):
+    # Si la edición cambia el broker, la posición sale entera del anterior y entra en el
+    # nuevo, para que el coste FIFO/medio quede donde están las acciones.
+    if editado.broker != anterior['broker']:
+        anotar_operacion(libro, editado.simbolo, anterior['broker'], -anterior['cantidad'],
+                         editado.precio_actual, anterior['divisa'])
+        anotar_operacion(libro, editado.simbolo, editado.broker, editado.cantidad,
+                         editado.precio_actual, editado.divisa)
+    else:
+        anotar_operacion(libro, editado.simbolo, editado.broker, editado.cantidad - anterior['cantidad'],
+                         editado.precio_actual, editado.divisa)
+
+def libro_operaciones():
+    # Se abre antes de tocar la cartera: la primera vez parte de sus posiciones actuales.
+    from services.operaciones import obtener_libro_operaciones
+
+    return obtener_libro_operaciones(obtener_portfolio())
 
 def ventana_agregar_activos():
+    portfolio = obtener_portfolio()
     ventana = tk.Toplevel()
     ventana.title("Agregar Nuevos Activos")
     ventana.geometry("600x400")
@@ -49,55 +122,188 @@ def ventana_agregar_activos():
     broker_combobox = tk.OptionMenu(ventana, broker_var, 'ocean', 'degiro', 'cxbank', 'bbva', 'sant')
     broker_combobox.grid(row=3, column=1, padx=5, pady=5, sticky="w")
 
+    tk.Label(ventana, text="Divisa:").grid(row=3, column=2, padx=5, pady=5, sticky="e")
+    divisa_var = tk.StringVar(value='EUR')
+    tk.OptionMenu(ventana, divisa_var, *DIVISAS).grid(row=3, column=3, padx=5, pady=5, sticky="w")
+
     def agregar_elemento():
         simbolo = entry_simbolo.get().strip()
         titulo = entry_titulo.get().strip()
-        cantidad = entry_cantidad.get().strip()
+        cantidad = leer_cantidad(entry_cantidad.get())
         precio_manual = entry_precio_manual.get().strip()
 
-        if not simbolo or not titulo or not cantidad.isdigit():
+        if not simbolo or not titulo or cantidad is None:
             messagebox.showerror("Error", "Campos obligatorios incompletos o inválidos.")
             return
 
-        cantidad = int(cantidad)
-        precios_actuales = obtener_precios_actuales([simbolo])
-        precio_actual = precios_actuales.get(simbolo, 0.0)
+        # Aviso rápido; la comprobación que cuenta es la de add_asset, bajo el lock de la
+        # cartera, porque dos altas seguidas del mismo símbolo pueden estar ambas en cola.
+        if portfolio.get_asset_by_symbol(simbolo):
+            messagebox.showerror("Error", f"El símbolo '{simbolo}' ya está en la cartera.")
+            return
 
-        if precio_actual == 0.0:
-            if not precio_manual:
-                messagebox.showerror("Error", "El precio no se encontró y no se ingresó manualmente.")
-                return
-            try:
-                precio_actual = float(precio_manual)
-            except ValueError:
-                messagebox.showerror("Error", "El precio ingresado manualmente no es válido.")
-                return
+        dividendos = 'Sí' if var_dividendos.get() else 'No'
+        tipo_activo = tipo_activo_var.get()
+        broker = broker_var.get()
+        divisa = divisa_var.get()
 
-        asset = Asset(
-            simbolo,
-            titulo,
-            cantidad,
-            precio_actual,
-            cantidad * precio_actual,
-            'Sí' if var_dividendos.get() else 'No',
-            tipo_activo_var.get(),
-            broker_var.get()
-        )
-        portfolio.add_asset(asset)
-        messagebox.showinfo("Éxito", "Elemento añadido a la cartera.")
-        entry_simbolo.delete(0, tk.END)
-        entry_titulo.delete(0, tk.END)
-        entry_cantidad.delete(0, tk.END)
-        entry_precio_manual.delete(0, tk.END)
-        var_dividendos.set(False)
-        tipo_activo_var.set('')
-        broker_var.set('')
+        def continuar(precios_actuales):
+            if not ventana.winfo_exists():
+                return
+            precio_actual = precios_actuales.get(simbolo, 0.0)
+
+            if precio_actual == 0.0:
+                if not precio_manual:
+                    boton_agregar.config(state=tk.NORMAL)
+                    messagebox.showerror("Error", "El precio no se encontró y no se ingresó manualmente.")
+                    return
+                try:
+                    precio_actual = float(precio_manual)
+                except ValueError:
+                    boton_agregar.config(state=tk.NORMAL)
+                    messagebox.showerror("Error", "El precio ingresado manualmente no es válido.")
+                    return
+
+            asset = Asset(
+                simbolo,
+                titulo,
+                cantidad,
+                precio_actual,
+                cantidad * precio_actual,
+                dividendos,
+                tipo_activo,
+                broker,
+                divisa
+            )
+            def guardar(tarea):
+                libro = libro_operaciones()
+                portfolio.add_asset(asset)
+                anotar_operacion(libro, simbolo, broker, cantidad, precio_actual, divisa)
+
+            # El aviso y la limpieza del formulario esperan a que el alta esté guardada.
+            def guardado_ok(_):
+                if not ventana.winfo_exists():
+                    return
+                boton_agregar.config(state=tk.NORMAL)
+                messagebox.showinfo("Éxito", "Elemento añadido a la cartera.", parent=ventana)
+                entry_simbolo.delete(0, tk.END)
+                entry_titulo.delete(0, tk.END)
+                entry_cantidad.delete(0, tk.END)
+                entry_precio_manual.delete(0, tk.END)
+                var_dividendos.set(False)
+                tipo_activo_var.set('')
+                broker_var.set('')
+                divisa_var.set('EUR')
+
+            def guardado_fallido(error):
+                if ventana.winfo_exists():
+                    boton_agregar.config(state=tk.NORMAL)
+                messagebox.showerror("Error", f"No se pudo añadir el activo: {error}")
+
+            ejecutor.enviar(guardar, al_terminar=guardado_ok, al_error=guardado_fallido, guardado=True)
+
+        def fallo(error):
+            continuar({})
+
+        boton_agregar.config(state=tk.DISABLED)
+        ejecutor.enviar(lambda tarea: obtener_precios_actuales([simbolo]), al_terminar=continuar, al_error=fallo)
 
     boton_agregar = tk.Button(ventana, text="AGREGAR ACTIVO", command=agregar_elemento,
                              bg="green", fg="white", font=("Arial", 10, "bold"))
     boton_agregar.grid(row=4, column=1, columnspan=2, padx=10, pady=20, sticky="ew")
 
+def ventana_importar_activos():
+    portfolio = obtener_portfolio()
+    ventana = tk.Toplevel()
+    ventana.title("Importar Posiciones")
+    ventana.geometry("520x260")
+
+    from services.importacion import FORMATOS
+
+    ruta_var = tk.StringVar()
+    formato_var = tk.StringVar(value='aaf')
+    broker_var = tk.StringVar()
+
+    tk.Label(ventana, text="Fichero:").grid(row=0, column=0, padx=5, pady=5, sticky="e")
+    tk.Entry(ventana, textvariable=ruta_var, width=40).grid(row=0, column=1, padx=5, pady=5)
+
+    def elegir_fichero():
+        ruta = filedialog.askopenfilename(parent=ventana, filetypes=[
+            ("Exportaciones", "*.xlsx *.xlsm *.csv"), ("Todos", "*.*")])
+        if ruta:
+            ruta_var.set(ruta)
+
+    tk.Button(ventana, text="...", command=elegir_fichero).grid(row=0, column=2, padx=5, pady=5)
+
+    tk.Label(ventana, text="Formato:").grid(row=1, column=0, padx=5, pady=5, sticky="e")
+    tk.OptionMenu(ventana, formato_var, *FORMATOS).grid(row=1, column=1, padx=5, pady=5, sticky="w")
+
+    tk.Label(ventana, text="Broker (altas):").grid(row=2, column=0, padx=5, pady=5, sticky="e")
+    tk.OptionMenu(ventana, broker_var, '', *ORDEN_BROKERS).grid(row=2, column=1, padx=5, pady=5, sticky="w")
+
+    barra = ttk.Progressbar(ventana, mode="indeterminate", length=300)
+    barra.grid(row=3, column=0, columnspan=3, padx=10, pady=10)
+    estado = tk.Label(ventana, text="")
+    estado.grid(row=4, column=0, columnspan=3)
+
+    def importar():
+        from services.importacion import importar
+
+        ruta = ruta_var.get().strip()
+        if not ruta:
+            messagebox.showerror("Error", "Selecciona un fichero.", parent=ventana)
+            return
+        formato = formato_var.get()
+        broker = broker_var.get() or None
+
+        def progreso(leidas, total):
+            estado.config(text=f"{leidas} filas leídas")
+
+        def terminado(resumen):
+            barra.stop()
+            boton_importar.config(state=tk.NORMAL)
+            estado.config(text="")
+            mensaje = (f"Filas leídas: {resumen['leidas']}\nAltas: {resumen['nuevas']}\n"
+                       f"Actualizadas: {resumen['actualizadas']}\nOperaciones anotadas: {resumen['operaciones']}\n"
+                       f"Descartadas: {len(resumen['descartadas'])}")
+            for fila, simbolo, motivo in resumen['descartadas'][:10]:
+                mensaje += f"\n  - fila {fila} ({simbolo}): {motivo}"
+            if resumen['sin_precio']:
+                mensaje += f"\nSin precio: {', '.join(resumen['sin_precio'][:10])}"
+            messagebox.showinfo("Importación completada", mensaje, parent=ventana)
+
+        def fallo(error):
+            barra.stop()
+            boton_importar.config(state=tk.NORMAL)
+            estado.config(text="")
+            messagebox.showerror("Error", f"No se pudo importar el fichero:\n{error}", parent=ventana)
+
+        boton_importar.config(state=tk.DISABLED)
+        barra.start(15)
+        ejecutor.enviar(
+            lambda tarea: importar(portfolio, ruta, formato, broker=broker, libro=libro_operaciones(),
+                                   progreso=tarea.progreso, comprobar=tarea.comprobar),
+            al_terminar=terminado, al_error=fallo, al_progreso=progreso)
+
+    boton_importar = tk.Button(ventana, text="IMPORTAR", command=importar,
+                               bg="green", fg="white", font=("Arial", 10, "bold"))
+    boton_importar.grid(row=5, column=1, padx=10, pady=10, sticky="ew")
+
+def ordenar_categorias(totales, preferencia):
+    orden = {clave: i for i, clave in enumerate(preferencia)}
+    return {clave: totales[clave] for clave in sorted(totales, key=lambda c: (orden.get(c, len(orden)), str(c)))}
+
+def error_guardado(error):
+    messagebox.showerror("Error", f"No se pudo guardar la cartera: {error}")
+
+@medido("gui.ventana_ver_cartera")
 def ventana_ver_cartera():
+    # Matplotlib y NumPy se importan al abrir la ventana para no retrasar el arranque.
+    from gui.graficos import GraficoBarras, GraficoTarta, ListaTotales
+    from services.agregados import agregados_cartera, acumular
+    from services.divisas import tipos_cartera
+
+    portfolio = obtener_portfolio()
     ventana = tk.Toplevel()
     ventana.title("Ver Cartera")
     ventana.geometry("1200x800")
@@ -109,69 +315,67 @@ def ventana_ver_cartera():
         return
 
     cartera_list_of_dicts = [asset.to_dict() for asset in cartera]
-    total_general = sum(item['importe_total'] for item in cartera_list_of_dicts)
-    totales_tipo = {tipo: sum(item['importe_total'] for item in cartera_list_of_dicts if item.get('tipo_activo') == tipo) for tipo in ['ACC', 'ETF', 'PP', 'FON']}
-    totales_broker = {broker: sum(item['importe_total'] for item in cartera_list_of_dicts if item.get('broker') == broker) for broker in ['sant', 'cxbank', 'bbva', 'degiro', 'ocean']}
-    total_acciones = sum(item['cantidad'] for item in cartera_list_of_dicts)
-    totales_tipo_cant = {tipo: sum(item['cantidad'] for item in cartera_list_of_dicts if item.get('tipo_activo') == tipo) for tipo in ['ACC', 'ETF', 'PP', 'FON']}
-    totales_broker_cant = {broker: sum(item['cantidad'] for item in cartera_list_of_dicts if item.get('broker') == broker) for broker in ['sant', 'cxbank', 'bbva', 'degiro', 'ocean']}
-
-    columnas = [
-        'símbolo',
-        'título',
-        'cantidad',
-        'precio_actual',
-        'importe_total',
-        '% Activo',
-        'tipo_activo',
-        'broker'
-    ]
-    anchuras = {
-        'símbolo': 12,
-        'título': 40,
-        'cantidad': 10,
-        'precio_actual': 12,
-        'importe_total': 15,
-        '% Activo': 8
-    }
-
-    cartera_df = pd.DataFrame(cartera_list_of_dicts)
-    orden_tipos = {'ACC': 0, 'ETF': 1, 'PP': 2, 'FON': 3}
-    cartera_df['orden_tipo'] = cartera_df['tipo_activo'].map(orden_tipos)
-    cartera_df = cartera_df.sort_values(['orden_tipo', 'símbolo']).drop('orden_tipo', axis=1)
-    total_general_calculado = cartera_df['importe_total'].sum()
-
-    columnas_map = {
-        'símbolo': 'SIMBOLO',
-        'título': 'TITULO',
-        'cantidad': 'CANTIDAD',
-        'precio_actual': 'PRECIO',
-        'importe_total': 'IMPORTE',
-        '% Activo': '%',
-        'tipo_activo': 'TIPO',
-        'broker': 'BROKER'
-    }
-
-    frame_scroll = tk.Frame(ventana)
-    frame_scroll.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
-
-    canvas = tk.Canvas(frame_scroll)
-    scrollbar = tk.Scrollbar(frame_scroll, orient="vertical", command=canvas.yview)
-    frame_tabla = tk.Frame(canvas)
-
-    canvas.create_window((0, 0), window=frame_tabla, anchor="nw")
-    canvas.configure(yscrollcommand=scrollbar.set)
-
-    canvas.pack(side="left", fill="both", expand=True)
-    scrollbar.pack(side="right", fill="y")
-
-    for i, columna in enumerate(columnas):
-        anchor = "w" if columna == "título" else "center"
-        tk.Label(frame_tabla, text=columnas_map[columna], borderwidth=1, relief="solid", width=anchuras.get(columna, 15),
-                bg="yellow", fg="blue", font=("Arial", 12, "bold"), anchor=anchor).grid(row=0, column=i, sticky="ew")
-
-    tk.Label(frame_tabla, text="MODIFICAR", borderwidth=1, relief="solid", width=15,
-            bg="yellow", fg="blue", font=("Arial", 12, "bold")).grid(row=0, column=len(columnas), columnspan=2, sticky="ew")
+    # Se pinta con los últimos tipos de cambio guardados; los actuales se piden en segundo
+    # plano y los totales se repintan al llegar.
+    totales = copy.deepcopy(agregados_cartera(portfolio, tipos_cartera(portfolio, solo_cache=True)))
+    tipos_pendientes = True
+
+    filas_ordenadas = ordenar_posiciones(cartera_list_of_dicts)
+
+    # --- Barra de acciones: refresco de precios en segundo plano ---
+    frame_acciones = tk.Frame(ventana)
+    frame_acciones.pack(fill=tk.X, padx=10, pady=(10, 0))
+    boton_actualizar = tk.Button(frame_acciones, text="Actualizar precios", bg="lightblue")
+    boton_actualizar.pack(side=tk.LEFT)
+    barra_progreso = ttk.Progressbar(frame_acciones, length=300, mode="determinate")
+    barra_progreso.pack(side=tk.LEFT, padx=10)
+    boton_cancelar = tk.Button(frame_acciones, text="Cancelar", state=tk.DISABLED)
+    boton_cancelar.pack(side=tk.LEFT)
+    var_tiempo_real = tk.BooleanVar(value=False)
+    tk.Checkbutton(frame_acciones, text="Tiempo real", variable=var_tiempo_real,
+                   command=lambda: alternar_tiempo_real()).pack(side=tk.LEFT, padx=10)
+    tk.Button(frame_acciones, text="Riesgo (VaR)", bg="lightyellow",
+              command=lambda: ventana_riesgo(ventana, totales['tipos'])).pack(side=tk.LEFT)
+    tk.Button(frame_acciones, text="Rebalancear", bg="lightgreen",
+              command=lambda: ventana_rebalanceo(ventana, totales)).pack(side=tk.LEFT, padx=5)
+
+    def actualizar_precios():
+        total_simbolos = len(cartera)
+
+        def trabajo(tarea):
+            estados = refrescar_precios(portfolio, tamano_lote=LOTE_REFRESCO,
+                                        progreso=tarea.progreso, comprobar=tarea.comprobar)
+            return sum(1 for estado in estados.values() if estado != ESTADO_MISSING)
+
+        def restablecer():
+            boton_actualizar.config(state=tk.NORMAL)
+            boton_cancelar.config(state=tk.DISABLED)
+            barra_progreso.configure(value=0)
+
+        def progreso(hecho, total):
+            barra_progreso.configure(maximum=total, value=hecho)
+
+        def terminado(actualizados):
+            restablecer()
+            recargar()
+            messagebox.showinfo("Éxito", f"Precios actualizados: {actualizados} de {total_simbolos}.")
+
+        def fallo(error):
+            restablecer()
+            messagebox.showerror("Error", f"No se pudieron actualizar los precios: {error}")
+
+        def cancelar():
+            tarea.cancelar()
+            restablecer()
+
+        tarea = ejecutor.enviar(trabajo, al_terminar=terminado, al_error=fallo, al_progreso=progreso)
+        boton_actualizar.config(state=tk.DISABLED)
+        boton_cancelar.config(state=tk.NORMAL, command=cancelar)
+
+    boton_actualizar.config(command=actualizar_precios)
+
+    tabla = TablaCartera(ventana, al_editar=lambda s: editar_elemento(s), al_eliminar=lambda s: eliminar_elemento(s))
+    tabla.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
 
     def editar_elemento(simbolo):
         elemento = portfolio.get_asset_by_symbol(simbolo)
@@ -203,9 +407,14 @@ def ventana_ver_cartera():
         broker_var = tk.StringVar(value=elemento.broker)
         tk.OptionMenu(ventana_edicion, broker_var, 'ocean', 'degiro', 'cxbank', 'bbva', 'sant').grid(row=4, column=1, padx=10, pady=5)
 
+        tk.Label(ventana_edicion, text="Divisa:").grid(row=5, column=0, padx=10, pady=5)
+        divisa_var = tk.StringVar(value=elemento.divisa)
+        tk.OptionMenu(ventana_edicion, divisa_var, *DIVISAS).grid(row=5, column=1, padx=10, pady=5)
+
         def guardar_edicion():
-            if not entry_cantidad.get().isdigit():
-                messagebox.showerror("Error", "La cantidad debe ser un número entero válido.")
+            cantidad = leer_cantidad(entry_cantidad.get())
+            if cantidad is None:
+                messagebox.showerror("Error", "La cantidad debe ser un número válido.")
                 return
             try:
                 nuevo_precio = float(entry_precio.get())
@@ -213,47 +422,52 @@ def ventana_ver_cartera():
                 messagebox.showerror("Error", "El precio debe ser un número válido.")
                 return
 
-            elemento.cantidad = int(entry_cantidad.get())
-            elemento.precio_actual = nuevo_precio
-            elemento.dividendos = 'Sí' if var_dividendos.get() else 'No'
-            elemento.tipo_activo = tipo_var.get()
-            elemento.broker = broker_var.get()
-            elemento.importe_total = elemento.cantidad * elemento.precio_actual
+            # Un Asset nuevo en lugar de modificar el de la cartera: los hilos de trabajo pueden
+            # estar leyéndolo o guardándolo; el cambio entra por update_asset, bajo su lock.
+            anterior = elemento.to_dict()
+            datos = dict(anterior)
+            datos.update({
+                'cantidad': cantidad,
+                'precio_actual': nuevo_precio,
+                'importe_total': cantidad * nuevo_precio,
+                'dividendos': 'Sí' if var_dividendos.get() else 'No',
+                'tipo_activo': tipo_var.get(),
+                'broker': broker_var.get(),
+                'divisa': divisa_var.get(),
+            })
+            editado = Asset.from_dict(datos)
 
-            portfolio.update_asset(simbolo, elemento)
-            messagebox.showinfo("Éxito", "Elemento editado correctamente.")
             ventana_edicion.destroy()
-            ventana.destroy()
-            ventana_ver_cartera()
+            aplicar_cambio(anterior, editado.to_dict())
+
+            def guardar(tarea):
+                libro = libro_operaciones()
+                portfolio.update_asset(simbolo, editado)
+                anotar_edicion(libro, anterior, editado)
+                return calcular_resultados()
 
-        tk.Button(ventana_edicion, text="Guardar", command=guardar_edicion).grid(row=5, columnspan=2, pady=10)
+            ejecutor.enviar(guardar, al_terminar=pintar_resultados, al_error=error_guardado, guardado=True)
+
+        tk.Button(ventana_edicion, text="Guardar", command=guardar_edicion).grid(row=6, columnspan=2, pady=10)
 
     def eliminar_elemento(simbolo):
-        if messagebox.askyesno("Confirmar", "¿Está seguro de que desea eliminar este elemento?"):
-            portfolio.delete_asset(simbolo)
-            messagebox.showinfo("Éxito", "Elemento eliminado.")
-            ventana.destroy()
-            ventana_ver_cartera()
-
-    for index, row in cartera_df.iterrows():
-        tipo_activo = row.get('tipo_activo', '')
-        bg_color = {"PP": "#ADD8E6", "FON": "#90EE90", "ETF": "#FFFFE0", "ACC": "#FFDAB9"}.get(tipo_activo, "white")
-
-        for i, columna in enumerate(columnas):
-            if columna == '% Activo':
-                porcentaje = (row['importe_total'] / total_general_calculado * 100) if total_general_calculado > 0 else 0
-                valor = f"{porcentaje:.2f}%"
-            else:
-                valor = f"{row.get(columna, ''):.2f}" if columna == 'importe_total' else str(row.get(columna, ''))
-            anchor = "w" if columna == "título" else "center"
-            tk.Label(frame_tabla, text=valor, borderwidth=1, relief="solid", width=anchuras.get(columna, 15),
-                    anchor=anchor, bg=bg_color).grid(row=index + 1, column=i, sticky="ew")
+        elemento = portfolio.get_asset_by_symbol(simbolo)
+        if elemento and messagebox.askyesno("Confirmar", "¿Está seguro de que desea eliminar este elemento?"):
+            anterior = elemento.to_dict()
+            aplicar_cambio(anterior, None)
+
+            def guardar(tarea):
+                libro = libro_operaciones()
+                portfolio.delete_asset(simbolo)
+                anotar_operacion(libro, simbolo, anterior['broker'], -anterior['cantidad'],
+                                 anterior['precio_actual'], anterior['divisa'])
+                return calcular_resultados()
 
-        simbolo = row.get('símbolo', '')
-        tk.Button(frame_tabla, text="Editar", command=lambda s=simbolo: editar_elemento(s)).grid(row=index + 1, column=len(columnas), sticky="ew")
-        tk.Button(frame_tabla, text="Eliminar", command=lambda s=simbolo: eliminar_elemento(s)).grid(row=index + 1, column=len(columnas) + 1, sticky="ew")
+            def eliminado(resultados):
+                pintar_resultados(resultados)
+                messagebox.showinfo("Éxito", "Elemento eliminado.")
 
-    frame_tabla.bind("<Configure>", lambda e: canvas.configure(scrollregion=canvas.bbox("all")))
+            ejecutor.enviar(guardar, al_terminar=eliminado, al_error=error_guardado, guardado=True)
 
     # --- Frame inferior para gráficos y resúmenes ---
     frame_inferior = tk.Frame(ventana)
@@ -263,83 +477,414 @@ def ventana_ver_cartera():
     frame_izquierda = tk.Frame(frame_inferior)
     frame_izquierda.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
 
-    tipos_graf = ['ACC', 'ETF', 'PP', 'FON']
-    totales_tipo_graf = [totales_tipo.get(tipo, 0) for tipo in tipos_graf]
-    colores = ['#FFDAB9', '#FFFFE0', '#ADD8E6', '#90EE90']
-
-    fig, ax = plt.subplots(figsize=(5, 3)) # Ajustado tamaño
-    bars = ax.bar(tipos_graf, totales_tipo_graf, color=colores)
-    ax.set_ylabel('Importe (€)')
-    ax.set_title('Importe por Tipo de Activo')
-    ax.bar_label(bars, fmt='%.0f€')
-    fig.tight_layout()
-
-    canvas_graf = FigureCanvasTkAgg(fig, master=frame_izquierda)
-    canvas_graf.draw()
-    canvas_graf.get_tk_widget().pack(side=tk.TOP, fill=tk.X)
+    grafico_barras = GraficoBarras(frame_izquierda, 'Importe por Tipo de Activo', 'Importe (€)')
+    grafico_barras.widget().pack(side=tk.TOP, fill=tk.X)
 
     frame_sumario_importe = tk.Frame(frame_izquierda)
     frame_sumario_importe.pack(fill=tk.X, pady=5)
-    tk.Label(frame_sumario_importe, text=f"IMPORTE TOTAL: {total_general:.2f}€", font=("Arial", 16, "bold"), fg="red").pack()
+    label_total = tk.Label(frame_sumario_importe, font=("Arial", 16, "bold"), fg="red")
+    label_total.pack()
+    label_resultados = tk.Label(frame_sumario_importe, font=("Arial", 12))
+    label_resultados.pack()
     frame_columnas = tk.Frame(frame_sumario_importe)
     frame_columnas.pack()
     frame_tipos = tk.LabelFrame(frame_columnas, text="Totales por Tipo", font=("Arial", 12, "bold"))
     frame_tipos.pack(side=tk.LEFT, padx=5, pady=5, anchor="n")
-    for tipo, total in totales_tipo.items():
-        if total > 0:
-            tk.Label(frame_tipos, text=f"{tipo}: {total:.2f}€", font=("Arial", 11)).pack(anchor="w", padx=10, pady=2)
+    lista_tipos = ListaTotales(frame_tipos, lambda tipo, total: f"{tipo}: {total:.2f}€")
     frame_brokers = tk.LabelFrame(frame_columnas, text="Totales por Broker", font=("Arial", 12, "bold"))
     frame_brokers.pack(side=tk.LEFT, padx=5, pady=5, anchor="n")
-    for broker, total in totales_broker.items():
-        if total > 0:
-            tk.Label(frame_brokers, text=f"{broker}: {total:.2f}€", font=("Arial", 11)).pack(anchor="w", padx=10, pady=2)
+    lista_brokers = ListaTotales(frame_brokers, lambda broker, total: f"{broker}: {total:.2f}€")
 
     frame_sumario_cantidad = tk.Frame(frame_izquierda)
     frame_sumario_cantidad.pack(fill=tk.X, pady=5)
-    tk.Label(frame_sumario_cantidad, text=f"TOTAL ACCIONES: {total_acciones}", font=("Arial", 16, "bold"), fg="blue").pack()
+    label_acciones = tk.Label(frame_sumario_cantidad, font=("Arial", 16, "bold"), fg="blue")
+    label_acciones.pack()
     frame_columnas_cant = tk.Frame(frame_sumario_cantidad)
     frame_columnas_cant.pack()
     frame_tipos_cant = tk.LabelFrame(frame_columnas_cant, text="Acciones por Tipo", font=("Arial", 12, "bold"))
     frame_tipos_cant.pack(side=tk.LEFT, padx=5, pady=5, anchor="n")
-    for tipo, total in totales_tipo_cant.items():
-        if total > 0:
-            tk.Label(frame_tipos_cant, text=f"{tipo}: {total}", font=("Arial", 11)).pack(anchor="w", padx=10, pady=2)
+    lista_tipos_cant = ListaTotales(frame_tipos_cant, lambda tipo, total: f"{tipo}: {total}")
     frame_brokers_cant = tk.LabelFrame(frame_columnas_cant, text="Acciones por Broker", font=("Arial", 12, "bold"))
     frame_brokers_cant.pack(side=tk.LEFT, padx=5, pady=5, anchor="n")
-    for broker, total in totales_broker_cant.items():
-        if total > 0:
-            tk.Label(frame_brokers_cant, text=f"{broker}: {total}", font=("Arial", 11)).pack(anchor="w", padx=10, pady=2)
+    lista_brokers_cant = ListaTotales(frame_brokers_cant, lambda broker, total: f"{broker}: {total}")
 
     # --- Gráfico circular (lado derecho) ---
     frame_derecha = tk.Frame(frame_inferior)
     frame_derecha.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True, padx=(20, 0))
 
-    labels_graf = [tipo for tipo, total in totales_tipo.items() if total > 0]
-    valores_graf = [total for total in totales_tipo.values() if total > 0]
-    colores = ['#FFDAB9', '#FFFFE0', '#ADD8E6', '#90EE90']
-
-    if valores_graf:
-        fig, ax = plt.subplots(figsize=(7, 5))
-        ax.pie(valores_graf, labels=labels_graf, autopct='%1.1f%%', startangle=140, colors=colores, textprops={'fontsize': 10})
-        ax.axis('equal')
-        ax.set_title('Distribución por Tipo de Activo', fontsize=14, fontweight='bold')
-
-        canvas_pie = FigureCanvasTkAgg(fig, master=frame_derecha)
-        canvas_pie.draw()
-        canvas_pie.get_tk_widget().pack(fill=tk.BOTH, expand=True)
-
-def cargar_dividendos():
-    try:
-        with open(DIVIDENDOS_ARCHIVO, "r") as archivo:
-            return json.load(archivo)
-    except FileNotFoundError:
-        return {}
+    grafico_tarta = GraficoTarta(frame_derecha, 'Distribución por Tipo de Activo')
+    grafico_tarta.widget().pack(fill=tk.BOTH, expand=True)
+
+    @medido("gui.pintar_totales")
+    def pintar_totales():
+        texto_total = f"IMPORTE TOTAL: {totales['general']:.2f}€"
+        if totales['sin_tipo']:
+            aviso = "tipo de cambio pendiente" if tipos_pendientes else "sin tipo de cambio"
+            texto_total += f"  ({aviso}: {', '.join(totales['sin_tipo'])})"
+        label_total.config(text=texto_total)
+        label_acciones.config(text=f"TOTAL ACCIONES: {totales['acciones']}")
+        totales_tipo = ordenar_categorias(totales['tipo'], ORDEN_TIPOS)
+        lista_tipos.actualizar(totales_tipo)
+        lista_brokers.actualizar(ordenar_categorias(totales['broker'], ORDEN_BROKERS))
+        lista_tipos_cant.actualizar(ordenar_categorias(totales['tipo_cant'], ORDEN_TIPOS))
+        lista_brokers_cant.actualizar(ordenar_categorias(totales['broker_cant'], ORDEN_BROKERS))
+
+        tipos_graf = list(totales_tipo)
+        grafico_barras.actualizar(tipos_graf, [totales_tipo[tipo] for tipo in tipos_graf],
+                                  [COLORES_TIPO.get(tipo, "white") for tipo in tipos_graf])
+        labels_graf = [tipo for tipo, total in totales_tipo.items() if total > 0]
+        grafico_tarta.actualizar(labels_graf, [totales_tipo[tipo] for tipo in labels_graf],
+                                 [COLORES_TIPO.get(tipo, "white") for tipo in labels_graf])
+
+    # Resultados latente y realizado según el libro de operaciones (FIFO), en segundo plano:
+    # la primera vez puede tener que recorrer todo el historial.
+    def calcular_resultados():
+        from services.operaciones import obtener_motor, resultados_cartera
+
+        motor_coste = obtener_motor(portfolio)
+        motor_coste.actualizar()
+        return resultados_cartera(portfolio, motor_coste, tipos_cartera(portfolio))
+
+    def pintar_resultados(resultados):
+        if label_resultados.winfo_exists():
+            label_resultados.config(text=f"Plusvalía latente: {resultados['latente']:.2f}€  ·  "
+                                         f"realizada: {resultados['realizado']:.2f}€")
+
+    # Enlace modelo/vista: un cambio en una fila ajusta solo esa fila y los totales afectados.
+    def aplicar_cambio(anterior, nuevo):
+        if anterior:
+            acumular(totales, anterior, -1)
+        if nuevo:
+            acumular(totales, nuevo, 1)
+            tabla.actualizar_fila(nuevo)
+        else:
+            tabla.eliminar_fila(anterior['símbolo'])
+        tabla.actualizar_total(totales['general'])
+        pintar_totales()
+
+    # --- Tiempo real: los ticks se acumulan en el motor y se aplican por fotogramas ---
+    motor = None
+    ultimo_repintado = 0.0
+    totales_pendientes = False
+
+    def crear_fuente():
+        from services.tiempo_real import FuenteSimulada, FuenteSondeo
+
+        if os.environ.get("CARTERA_FUENTE") == "simulada":
+            return FuenteSimulada({asset.simbolo: asset.precio_actual for asset in portfolio.get_all_assets()})
+        return FuenteSondeo(intervalo=INTERVALO_SONDEO_VIVO)
+
+    def pintar_cambios(cambios, forzar=False):
+        nonlocal ultimo_repintado, totales_pendientes
+        for _, nuevo in cambios:
+            tabla.actualizar_fila(nuevo)
+        totales_pendientes = totales_pendientes or bool(cambios)
+        ahora = time.monotonic()
+        if totales_pendientes and (forzar or ahora - ultimo_repintado >= INTERVALO_GRAFICOS):
+            ultimo_repintado = ahora
+            totales_pendientes = False
+            tabla.actualizar_total(totales['general'])
+            pintar_totales()
+
+    @medido("gui.fotograma_tiempo_real")
+    def fotograma():
+        if motor is None or not motor.activo or not ventana.winfo_exists():
+            return
+        pintar_cambios(motor.aplicar(totales))
+        ventana.after(INTERVALO_FOTOGRAMA_MS, fotograma)
+
+    def alternar_tiempo_real():
+        nonlocal motor
+        from services.tiempo_real import MotorTiempoReal
+
+        if var_tiempo_real.get():
+            motor = MotorTiempoReal(portfolio, crear_fuente())
+            motor.iniciar()
+            _motores_vivos.add(motor)
+            ventana.after(INTERVALO_FOTOGRAMA_MS, fotograma)
+        elif motor is not None:
+            _motores_vivos.discard(motor)
+            pintar_cambios(motor.detener(totales), forzar=True)
+            motor = None
+
+    def cerrar():
+        if motor is not None:
+            _motores_vivos.discard(motor)
+            motor.detener()
+        ventana.destroy()
+
+    ventana.protocol("WM_DELETE_WINDOW", cerrar)
+
+    def calcular_totales(tipos):
+        totales.clear()
+        totales.update(copy.deepcopy(agregados_cartera(portfolio, tipos)))
+
+    # Tipos de cambio: en la caché de divisas (TTL de una hora), pero si falta o caduca
+    # alguno hay que ir a la red, y eso no puede bloquear el hilo de Tk.
+    def pedir_tipos():
+        nonlocal tipos_pendientes
+        tipos_pendientes = True
+        ejecutor.enviar(lambda tarea: tipos_cartera(portfolio), al_terminar=tipos_recibidos,
+                        al_error=lambda error: tipos_recibidos(None))
+
+    def tipos_recibidos(tipos):
+        nonlocal tipos_pendientes
+        tipos_pendientes = False
+        if not ventana.winfo_exists():
+            return
+        if tipos is not None and tipos != totales['tipos']:
+            calcular_totales(tipos)
+            tabla.cambiar_tipos(totales['tipos'], totales['general'])
+        pintar_totales()
+
+    @medido("gui.recargar_cartera")
+    def recargar():
+        filas = [asset.to_dict() for asset in portfolio.get_all_assets()]
+        calcular_totales(tipos_cartera(portfolio, solo_cache=True))
+        tabla.cargar(filas, totales['general'], totales['tipos'])
+        pintar_totales()
+        pedir_tipos()
+        ejecutor.enviar(lambda tarea: calcular_resultados(), al_terminar=pintar_resultados)
+
+    # Al abrir, la cartera se contrasta con el libro de operaciones: si las cantidades se
+    # cambiaron por fuera (el JSON a mano, otra herramienta), se ofrece corregirlas.
+    def calcular_y_conciliar(tarea):
+        from services.operaciones import conciliar, obtener_motor
+
+        resultados = calcular_resultados()
+        return resultados, conciliar(portfolio, obtener_motor(portfolio))
+
+    def sincronizar(tarea):
+        from services.operaciones import obtener_motor, registrar_saldos_iniciales, sincronizar_cartera
+
+        motor_coste = obtener_motor(portfolio)
+        sincronizar_cartera(portfolio, motor_coste)
+        # Las posiciones sin historial entran en el libro como saldo inicial.
+        registrar_saldos_iniciales(portfolio, libro_operaciones(), datetime.date.today().isoformat(), motor_coste)
+
+    def mostrar_conciliacion(respuesta):
+        resultados, diferencias = respuesta
+        pintar_resultados(resultados)
+        if not diferencias or not ventana.winfo_exists():
+            return
+        mensaje = "Las cantidades de la cartera no coinciden con el libro de operaciones:"
+        for simbolo, en_cartera, en_libro in diferencias[:10]:
+            mensaje += f"\n  - {simbolo}: cartera {en_cartera:g}, libro " + \
+                       ("sin operaciones" if en_libro is None else f"{en_libro:g}")
+        if len(diferencias) > 10:
+            mensaje += f"\n  ... y {len(diferencias) - 10} más"
+        if messagebox.askyesno("Conciliación", mensaje + "\n\n¿Aplicar las cantidades del libro?", parent=ventana):
+            ejecutor.enviar(sincronizar, al_terminar=lambda _: recargar(), al_error=error_guardado,
+                            guardado=True)
+
+    tabla.cargar(filas_ordenadas, totales['general'], totales['tipos'])
+    pintar_totales()
+    pedir_tipos()
+    ejecutor.enviar(calcular_y_conciliar, al_terminar=mostrar_conciliacion)
+
+def ventana_riesgo(padre, tipos):
+    # VaR/CVaR a un día y contribución al CVaR 99% por activo, tipo y broker. La simulación
+    # (y la descarga del histórico que falte) va en segundo plano.
+    from services.historico import obtener_almacen
+    from services.riesgo import riesgo_cartera
+
+    portfolio = obtener_portfolio()
+    ventana = tk.Toplevel(padre)
+    ventana.title("Riesgo de la cartera")
+    ventana.geometry("900x600")
+
+    label_estado = tk.Label(ventana, text="Simulando...", font=("Arial", 14, "bold"))
+    label_estado.pack(pady=10)
+    frame_tablas = tk.Frame(ventana)
+    frame_tablas.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+
+    def crear_tabla(titulo):
+        frame = tk.LabelFrame(frame_tablas, text=titulo, font=("Arial", 12, "bold"))
+        frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=5)
+        tabla = ttk.Treeview(frame, columns=("nombre", "cvar", "porcentaje"), show="headings")
+        for columna, texto, ancho in (("nombre", "", 120), ("cvar", "CVaR (€)", 90), ("porcentaje", "%", 60)):
+            tabla.heading(columna, text=texto)
+            tabla.column(columna, width=ancho, anchor="w" if columna == "nombre" else "e")
+        tabla.pack(fill=tk.BOTH, expand=True)
+        return tabla
+
+    tablas = {'por_activo': crear_tabla("Por activo"), 'por_tipo': crear_tabla("Por tipo"),
+              'por_broker': crear_tabla("Por broker")}
+
+    def trabajo(tarea):
+        almacen = obtener_almacen()
+        almacen.actualizar([asset.simbolo for asset in portfolio.get_all_assets()])
+        return riesgo_cartera(portfolio, almacen, tipos, caminos=CAMINOS_RIESGO)
+
+    def terminado(resultado):
+        if not ventana.winfo_exists():
+            return
+        if not resultado['var']:
+            label_estado.config(text="No hay histórico suficiente para estimar el riesgo.")
+            return
+        texto = "   ".join(f"VaR {nivel:.0%}: {resultado['var'][nivel]:.2f}€  CVaR: {resultado['cvar'][nivel]:.2f}€"
+                           for nivel in resultado['var'])
+        if resultado['sin_historico']:
+            texto += f"\nSin histórico: {', '.join(resultado['sin_historico'])}"
+        label_estado.config(text=texto)
+        cvar = resultado['cvar'][resultado['nivel_contribuciones']]
+        for nombre, tabla in tablas.items():
+            for clave, contribucion in sorted(resultado[nombre].items(), key=lambda x: -x[1]):
+                porcentaje = contribucion / cvar * 100 if cvar else 0.0
+                tabla.insert("", tk.END, values=(clave, f"{contribucion:.2f}", f"{porcentaje:.1f}%"))
+
+    def fallo(error):
+        if ventana.winfo_exists():
+            label_estado.config(text=f"No se pudo calcular el riesgo: {error}")
+
+    ejecutor.enviar(trabajo, al_terminar=terminado, al_error=fallo)
+
+def ventana_rebalanceo(padre, totales):
+    # Pesos objetivo por tipo (y opcionalmente por broker), efectivo de cada broker e
+    # importe mínimo por operación; se guardan en data/objetivos.json con "Calcular". El
+    # mismo Rebalanceo se reutiliza mientras no cambien las posiciones.
+    from services.rebalanceo import cargar_objetivos, guardar_objetivos, rebalancear_cartera
+
+    portfolio = obtener_portfolio()
+    objetivos = cargar_objetivos()
+    tipos = totales['tipos']
+    ventana = tk.Toplevel(padre)
+    ventana.title("Rebalanceo de la cartera")
+    ventana.geometry("1000x700")
+
+    frame_objetivos = tk.Frame(ventana)
+    frame_objetivos.pack(fill=tk.X, padx=10, pady=10)
+    frame_tipos = tk.LabelFrame(frame_objetivos, text="Objetivo por tipo (%)", font=("Arial", 12, "bold"))
+    frame_tipos.pack(side=tk.LEFT, padx=5, anchor="n")
+    entradas_tipo = {}
+    for fila, tipo in enumerate(ordenar_categorias(totales['tipo'], ORDEN_TIPOS)):
+        tk.Label(frame_tipos, text=tipo).grid(row=fila, column=0, padx=5, pady=2, sticky="w")
+        entry = tk.Entry(frame_tipos, width=8)
+        if tipo in objetivos['tipo']:
+            entry.insert(0, objetivos['tipo'][tipo])
+        elif not objetivos['tipo'] and totales['general']:
+            entry.insert(0, f"{totales['tipo'][tipo] / totales['general'] * 100:.1f}")
+        entry.grid(row=fila, column=1, padx=5, pady=2)
+        entradas_tipo[tipo] = entry
+
+    frame_brokers = tk.LabelFrame(frame_objetivos, text="Por broker (objetivo vacío: sin traspasos)",
+                                  font=("Arial", 12, "bold"))
+    frame_brokers.pack(side=tk.LEFT, padx=5, anchor="n")
+    tk.Label(frame_brokers, text="Efectivo (€)").grid(row=0, column=1, padx=5)
+    tk.Label(frame_brokers, text="Objetivo (%)").grid(row=0, column=2, padx=5)
+    entradas_broker = {}
+    brokers = ordenar_categorias({**totales['broker'], **objetivos['efectivo']}, ORDEN_BROKERS)
+    for fila, broker in enumerate(brokers, start=1):
+        tk.Label(frame_brokers, text=broker).grid(row=fila, column=0, padx=5, pady=2, sticky="w")
+        entry_efectivo = tk.Entry(frame_brokers, width=10)
+        entry_efectivo.insert(0, objetivos['efectivo'].get(broker, ""))
+        entry_efectivo.grid(row=fila, column=1, padx=5, pady=2)
+        entry_objetivo = tk.Entry(frame_brokers, width=8)
+        entry_objetivo.insert(0, objetivos['broker'].get(broker, ""))
+        entry_objetivo.grid(row=fila, column=2, padx=5, pady=2)
+        entradas_broker[broker] = (entry_efectivo, entry_objetivo)
+
+    frame_opciones = tk.Frame(frame_objetivos)
+    frame_opciones.pack(side=tk.LEFT, padx=5, anchor="n")
+    tk.Label(frame_opciones, text="Importe mínimo por operación (€):").pack(anchor="w")
+    entry_minimo = tk.Entry(frame_opciones, width=10)
+    entry_minimo.insert(0, objetivos['minimo'] or "")
+    entry_minimo.pack(anchor="w", pady=(0, 10))
+    boton_calcular = tk.Button(frame_opciones, text="Calcular", bg="lightblue")
+    boton_calcular.pack(anchor="w")
+
+    label_estado = tk.Label(ventana, font=("Arial", 12), justify=tk.LEFT)
+    label_estado.pack(fill=tk.X, padx=10)
+    columnas = (("símbolo", "Símbolo", 140, "w"), ("operacion", "Operación", 90, "w"), ("cantidad", "Cantidad", 80, "e"),
+                ("tipo_activo", "Tipo", 60, "w"), ("broker", "Broker", 80, "w"), ("importe", "Importe (€)", 110, "e"))
+    tabla = ttk.Treeview(ventana, columns=[c[0] for c in columnas], show="headings")
+    for columna, texto, ancho, alineacion in columnas:
+        tabla.heading(columna, text=texto)
+        tabla.column(columna, width=ancho, anchor=alineacion)
+    tabla.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+
+    estado = {'rebalanceo': None}
+
+    def numero(texto):
+        texto = texto.strip().replace(",", ".")
+        return float(texto) if texto else None
+
+    def leer_objetivos():
+        nuevos = dict(objetivos)
+        nuevos['tipo'] = {tipo: numero(entry.get()) for tipo, entry in entradas_tipo.items()}
+        nuevos['tipo'] = {tipo: peso for tipo, peso in nuevos['tipo'].items() if peso is not None}
+        nuevos['efectivo'] = {}
+        nuevos['broker'] = {}
+        for broker, (entry_efectivo, entry_objetivo) in entradas_broker.items():
+            efectivo = numero(entry_efectivo.get())
+            peso = numero(entry_objetivo.get())
+            if efectivo:
+                nuevos['efectivo'][broker] = efectivo
+            if peso is not None:
+                nuevos['broker'][broker] = peso
+        nuevos['minimo'] = numero(entry_minimo.get()) or 0.0
+        return nuevos
+
+    def calcular(guardar=True):
+        try:
+            nuevos = leer_objetivos()
+        except ValueError:
+            messagebox.showerror("Error", "Los objetivos, el efectivo y el mínimo deben ser números válidos.")
+            return
+        boton_calcular.config(state=tk.DISABLED)
+        label_estado.config(text="Calculando...")
 
-def guardar_dividendos(dividendos):
-    with open(DIVIDENDOS_ARCHIVO, "w") as archivo:
-        json.dump(dividendos, archivo, indent=4)
+        def trabajo(tarea):
+            if guardar:
+                guardar_objetivos(nuevos)
+            estado['rebalanceo'], resultado = rebalancear_cartera(portfolio, nuevos, tipos, estado['rebalanceo'])
+            return resultado
 
+        def terminado(resultado):
+            if not ventana.winfo_exists():
+                return
+            boton_calcular.config(state=tk.NORMAL)
+            objetivos.update(nuevos)
+            tabla.delete(*tabla.get_children())
+            for operacion in resultado['operaciones']:
+                tabla.insert("", tk.END, values=(operacion['símbolo'], operacion['operacion'], operacion['cantidad'],
+                                                 operacion['tipo_activo'], operacion['broker'],
+                                                 f"{operacion['importe']:.2f}"))
+            lineas = [f"{len(resultado['operaciones'])} operaciones: compras {resultado['compras']:.2f}€, "
+                      f"ventas {resultado['ventas']:.2f}€",
+                      "Pesos (actual → final / objetivo): " + ", ".join(
+                          f"{tipo} {resultado['pesos_actuales'].get(tipo, 0):.1%} → "
+                          f"{resultado['pesos_finales'].get(tipo, 0):.1%} / {objetivo:.1%}"
+                          for tipo, objetivo in resultado['pesos_objetivo'].items())]
+            if resultado['transferencias']:
+                lineas.append("Traspasos: " + ", ".join(f"{broker} {importe:+.2f}€"
+                                                        for broker, importe in resultado['transferencias'].items()))
+            if resultado['efectivo_restante']:
+                lineas.append("Efectivo sin invertir: " + ", ".join(
+                    f"{broker} {importe:.2f}€" for broker, importe in resultado['efectivo_restante'].items()))
+            if resultado['desviacion'] > 0.001:
+                lineas.append(f"Con el efectivo de cada broker el objetivo no se alcanza del todo "
+                              f"(desviación {resultado['desviacion']:.1%}).")
+            if resultado['sin_activos']:
+                lineas.append(f"Sin activos en los que invertir: {', '.join(resultado['sin_activos'])}")
+            if resultado['sin_precio']:
+                lineas.append(f"Sin precio o tipo de cambio: {', '.join(resultado['sin_precio'])}")
+            label_estado.config(text="\n".join(lineas))
+
+        def fallo(error):
+            if ventana.winfo_exists():
+                boton_calcular.config(state=tk.NORMAL)
+                label_estado.config(text=f"No se pudo calcular el rebalanceo: {error}")
+
+        ejecutor.enviar(trabajo, al_terminar=terminado, al_error=fallo, guardado=guardar)
+
+    boton_calcular.config(command=calcular)
+    # Al abrir se calcula con lo guardado (o los pesos actuales) sin escribir nada.
+    calcular(guardar=False)
+
+@medido("gui.ventana_dividendos")
 def ventana_dividendos():
+    portfolio = obtener_portfolio()
     ventana = tk.Toplevel()
     ventana.title("Dividendos")
     ventana.geometry("1600x1200")
@@ -351,7 +896,60 @@ def ventana_dividendos():
         tk.Label(ventana, text="No hay activos con dividendos.", font=("Arial", 14)).pack(pady=50)
         return
 
-    dividendos_data = cargar_dividendos()
+    libro = obtener_libro()
+
+    # Las ediciones de la rejilla se agrupan y se escriben en segundo plano tras una pausa.
+    cambios = {}
+    ediciones = {}
+
+    def preparar_cambios():
+        pagos = [(simbolo, ano, mes, importe) for (simbolo, ano, mes), importe in cambios.items()]
+        cambios.clear()
+        return pagos
+
+    guardado = GuardadoDiferido(ventana, preparar_cambios, libro.registrar_lote, ejecutor,
+                                al_error=lambda e: messagebox.showerror("Error", f"No se pudieron guardar los dividendos: {e}"))
+
+    def cerrar():
+        ventana.after_cancel(comprobacion[0])
+        guardado.cerrar()
+        ventana.destroy()
+
+    ventana.protocol("WM_DELETE_WINDOW", cerrar)
+
+    def descargar():
+        from services.dividendos import ingerir_dividendos
+
+        def trabajo(tarea):
+            return ingerir_dividendos(portfolio, libro, libro_operaciones=libro_operaciones())
+
+        def terminado(resultado):
+            mensaje = f"Pagos nuevos: {resultado['pagos']}."
+            if resultado['sin_respuesta']:
+                mensaje += f"\nSin respuesta del proveedor: {', '.join(resultado['sin_respuesta'])}"
+            if resultado['sin_tipo']:
+                mensaje += f"\nSin tipo de cambio (se reintentará): {', '.join(resultado['sin_tipo'])}"
+            messagebox.showinfo("Dividendos", mensaje)
+            if not ventana.winfo_exists():
+                return
+            if resultado['pagos']:
+                # Rejillas y resumen se leen del libro al construirse: se reabre la ventana.
+                cerrar()
+                ventana_dividendos()
+            else:
+                boton_descargar.config(state=tk.NORMAL)
+
+        def fallo(error):
+            if ventana.winfo_exists():
+                boton_descargar.config(state=tk.NORMAL)
+            messagebox.showerror("Error", f"No se pudieron descargar los dividendos: {error}")
+
+        guardado.volcar()
+        boton_descargar.config(state=tk.DISABLED)
+        ejecutor.enviar(trabajo, al_terminar=terminado, al_error=fallo)
+
+    boton_descargar = tk.Button(ventana, text="Descargar dividendos", command=descargar, bg="lightblue")
+    boton_descargar.pack(anchor="w", padx=10, pady=(10, 0))
 
     notebook = ttk.Notebook(ventana)
     notebook.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
@@ -361,61 +959,45 @@ def ventana_dividendos():
 
     frame_resumen = tk.LabelFrame(frame_resumen_tab, text="Resumen de Dividendos Totales", font=("Arial", 14, "bold"), padx=10, pady=10)
     frame_resumen.pack(fill=tk.X, padx=10, pady=10, anchor="n")
-    anos = [2022, 2023, 2024, 2025]
+    anos_libro = libro.anos()
+    ano_actual = datetime.date.today().year
+    anos = list(range(min(anos_libro + [ano_actual]), max(anos_libro + [ano_actual]) + 1))
+
+    resumen = resumen_dividendos(libro, [activo.simbolo for activo in activos_con_dividendos], anos)
+    totales_por_activo_ano = resumen['por_activo_ano']
+    totales_por_ano = resumen['por_ano']
+    totales_por_activo = resumen['por_activo']
+    gran_total = resumen['total']
+
+    # Un único Treeview: el número de widgets no crece con los años de historial.
+    columnas_resumen = ["Activo"] + [str(ano) for ano in anos] + ["Total Activo", "% Total"]
+    tabla_resumen = ttk.Treeview(frame_resumen, columns=columnas_resumen, show="headings",
+                                 height=min(len(activos_con_dividendos) + 1, 30))
+    for columna in columnas_resumen:
+        tabla_resumen.heading(columna, text=columna)
+        tabla_resumen.column(columna, width=150 if columna == "Activo" else 100, anchor="w" if columna == "Activo" else "e")
+    tabla_resumen.tag_configure("total", background="orange", font=("Arial", 11, "bold"))
+    scroll_resumen = ttk.Scrollbar(frame_resumen, orient="horizontal", command=tabla_resumen.xview)
+    tabla_resumen.configure(xscrollcommand=scroll_resumen.set)
+    tabla_resumen.pack(fill=tk.X)
+    scroll_resumen.pack(fill=tk.X)
 
-    totales_por_activo_ano = {activo.simbolo: {ano: 0 for ano in anos} for activo in activos_con_dividendos}
-    totales_por_ano = {ano: 0 for ano in anos}
-
-    for ano_str, data_ano in dividendos_data.items():
-        try:
-            ano = int(ano_str)
-            if ano in anos:
-                for simbolo, valores in data_ano.items():
-                    if simbolo in totales_por_activo_ano:
-                        total_activo_ano = sum(float(v or 0) for v in valores)
-                        totales_por_activo_ano[simbolo][ano] = total_activo_ano
-                        totales_por_ano[ano] += total_activo_ano
-        except (ValueError, TypeError):
-            continue
-
-    totales_por_activo = {simbolo: sum(totales_anuales.values()) for simbolo, totales_anuales in totales_por_activo_ano.items()}
-    gran_total = sum(totales_por_ano.values())
-
-    headers = ["Activo"] + [str(ano) for ano in anos] + ["Total Activo", "% Total"]
-    header_font = ("Arial", 11, "bold")
-    for i, header in enumerate(headers):
-        tk.Label(frame_resumen, text=header, font=header_font, bg="lightblue", relief="solid", borderwidth=1, padx=5, pady=2).grid(row=0, column=i, sticky="ew")
-
-    row_idx = 1
     for activo in sorted(activos_con_dividendos, key=lambda x: x.simbolo):
         simbolo = activo.simbolo
-        tk.Label(frame_resumen, text=simbolo, anchor="w", relief="solid", borderwidth=1, padx=5).grid(row=row_idx, column=0, sticky="ew")
-
-        for i, ano in enumerate(anos):
-            valor = totales_por_activo_ano.get(simbolo, {}).get(ano, 0)
-            tk.Label(frame_resumen, text=f"{valor:.2f}€", anchor="e", relief="solid", borderwidth=1, padx=5).grid(row=row_idx, column=i+1, sticky="ew")
-
         total_activo = totales_por_activo.get(simbolo, 0)
-        tk.Label(frame_resumen, text=f"{total_activo:.2f}€", anchor="e", relief="solid", borderwidth=1, bg="lightgray", font=("Arial", 10, "bold"), padx=5).grid(row=row_idx, column=len(anos)+1, sticky="ew")
-
         porcentaje = (total_activo / gran_total * 100) if gran_total > 0 else 0
-        tk.Label(frame_resumen, text=f"{porcentaje:.2f}%", anchor="e", relief="solid", borderwidth=1, bg="lightgray", font=("Arial", 10, "bold"), padx=5).grid(row=row_idx, column=len(anos)+2, sticky="ew")
+        tabla_resumen.insert("", tk.END, values=[simbolo]
+                             + [f"{totales_por_activo_ano[simbolo][ano]:.2f}€" for ano in anos]
+                             + [f"{total_activo:.2f}€", f"{porcentaje:.2f}%"])
 
-        row_idx += 1
-
-    tk.Label(frame_resumen, text="TOTAL AÑO", font=header_font, bg="orange", relief="solid", borderwidth=1, padx=5).grid(row=row_idx, column=0, sticky="ew")
-    for i, ano in enumerate(anos):
-        tk.Label(frame_resumen, text=f"{totales_por_ano[ano]:.2f}€", font=header_font, anchor="e", bg="orange", relief="solid", borderwidth=1, padx=5).grid(row=row_idx, column=i+1, sticky="ew")
-
-    tk.Label(frame_resumen, text=f"{gran_total:.2f}€", font=header_font, anchor="e", bg="red", fg="white", relief="solid", borderwidth=1, padx=5).grid(row=row_idx, column=len(anos)+1, sticky="ew")
-    tk.Label(frame_resumen, text="100.00%", font=header_font, anchor="e", bg="red", fg="white", relief="solid", borderwidth=1, padx=5).grid(row=row_idx, column=len(anos)+2, sticky="ew")
+    tabla_resumen.insert("", tk.END, tags=("total",), values=["TOTAL AÑO"]
+                         + [f"{totales_por_ano[ano]:.2f}€" for ano in anos]
+                         + [f"{gran_total:.2f}€", "100.00%"])
 
     meses = ['Ene', 'Feb', 'Mar', 'Abr', 'May', 'Jun', 'Jul', 'Ago', 'Sep', 'Oct', 'Nov', 'Dic']
 
-    def crear_tabla_ano(ano):
-        frame_ano = tk.Frame(notebook)
-        notebook.add(frame_ano, text=str(ano))
-
+    @medido("gui.crear_tabla_ano")
+    def crear_tabla_ano(ano, frame_ano):
         canvas = tk.Canvas(frame_ano)
         scrollbar = tk.Scrollbar(frame_ano, orient="vertical", command=canvas.yview)
         frame_tabla = tk.Frame(canvas)
@@ -435,73 +1017,83 @@ def ventana_dividendos():
         tk.Label(frame_tabla, text="Total", borderwidth=1, relief="solid", width=10,
                 bg="orange", fg="blue", font=("Arial", 12, "bold")).grid(row=0, column=13)
 
-        entries = {}
+        rejilla = libro.rejilla(ano)
+        # Celdas descargadas automáticamente: se distinguen por color de las tecleadas.
+        automaticos = libro.automaticos(ano)
+        # Ediciones de esta sesión que quizá aún no estén en el libro (guardado diferido).
+        for (simbolo, ano_edicion, mes), importe in ediciones.items():
+            if ano_edicion == ano:
+                rejilla.setdefault(simbolo, [0.0] * 12)[mes - 1] = importe
+                automaticos.discard((simbolo, mes))
         totales_fila = {}
         totales_mes = [tk.StringVar() for _ in range(12)]
         total_general = tk.StringVar()
+        # Valores numéricos de cada celda y sus sumas, para actualizar solo la fila,
+        # el mes y el total general afectados por una edición.
+        textos = {}
+        valores = {}
+        suma_fila = {}
+        suma_mes = [0.0] * 12
+        suma_total = [0.0]
+
+        def convertir(texto):
+            try:
+                return float(texto or 0)
+            except ValueError:
+                return 0.0
 
-        def actualizar_totales():
-            total_gral = 0
-            for activo in activos_con_dividendos:
-                simbolo = activo.simbolo
-                total_fila = 0
-                for mes_idx in range(12):
-                    try:
-                        valor = float(entries[simbolo][mes_idx].get() or 0)
-                        total_fila += valor
-                    except ValueError:
-                        pass
-                totales_fila[simbolo].set(f"{total_fila:.2f}")
-                total_gral += total_fila
-
-            for mes_idx in range(12):
-                total_mes = 0
-                for activo in activos_con_dividendos:
-                    simbolo = activo.simbolo
-                    entry = entries[simbolo][mes_idx]
-                    try:
-                        valor = float(entry.get() or 0)
-                        total_mes += valor
-                        if valor > 0:
-                            entry.config(bg="#90EE90")
-                        else:
-                            entry.config(bg="white")
-                    except ValueError:
-                        entry.config(bg="white")
-                totales_mes[mes_idx].set(f"{total_mes:.2f}")
-
-            total_general.set(f"{total_gral:.2f}")
-
-            if str(ano) not in dividendos_data:
-                dividendos_data[str(ano)] = {}
-            for activo in activos_con_dividendos:
-                simbolo = activo.simbolo
-                dividendos_data[str(ano)][simbolo] = [entry.get() for entry in entries[simbolo]]
-            guardar_dividendos(dividendos_data)
+        def editar_celda(entry, simbolo, mes_idx):
+            texto = entry.get()
+            if textos[simbolo][mes_idx] == texto:
+                return
+            textos[simbolo][mes_idx] = texto
+
+            nuevo = convertir(texto)
+            delta = nuevo - valores[simbolo][mes_idx]
+            valores[simbolo][mes_idx] = nuevo
+            entry.config(bg="#90EE90" if nuevo > 0 else "white")
+            if delta:
+                suma_fila[simbolo] += delta
+                suma_mes[mes_idx] += delta
+                suma_total[0] += delta
+                totales_fila[simbolo].set(f"{suma_fila[simbolo]:.2f}")
+                totales_mes[mes_idx].set(f"{suma_mes[mes_idx]:.2f}")
+                total_general.set(f"{suma_total[0]:.2f}")
+                cambios[(simbolo, ano, mes_idx + 1)] = nuevo
+                ediciones[(simbolo, ano, mes_idx + 1)] = nuevo
+                guardado.marcar()
 
         for index, activo in enumerate(activos_con_dividendos):
             simbolo = activo.simbolo
             tk.Label(frame_tabla, text=simbolo, borderwidth=1, relief="solid", width=15,
                     anchor="w").grid(row=index+1, column=0)
 
-            entries[simbolo] = []
             totales_fila[simbolo] = tk.StringVar()
+            valores[simbolo] = list(rejilla.get(simbolo, [0.0] * 12))
+            textos[simbolo] = [formatear_importe(valor) for valor in valores[simbolo]]
 
             for mes_idx in range(12):
-                valor_inicial = ""
-                if str(ano) in dividendos_data and simbolo in dividendos_data[str(ano)]:
-                    if mes_idx < len(dividendos_data[str(ano)][simbolo]):
-                        valor_inicial = dividendos_data[str(ano)][simbolo][mes_idx]
+                valor = valores[simbolo][mes_idx]
+                valor_inicial = textos[simbolo][mes_idx]
+                suma_mes[mes_idx] += valor
 
-                entry = tk.Entry(frame_tabla, width=8, justify="center")
+                color = "white" if valor <= 0 else "#ADD8E6" if (simbolo, mes_idx + 1) in automaticos else "#90EE90"
+                entry = tk.Entry(frame_tabla, width=8, justify="center", bg=color)
                 entry.insert(0, valor_inicial)
-                entry.bind('<KeyRelease>', lambda e: actualizar_totales())
+                entry.bind('<KeyRelease>', lambda e, s=simbolo, m=mes_idx: editar_celda(e.widget, s, m))
                 entry.grid(row=index+1, column=mes_idx+1, padx=1, pady=1)
-                entries[simbolo].append(entry)
+
+            suma_fila[simbolo] = sum(valores[simbolo])
+            suma_total[0] += suma_fila[simbolo]
+            totales_fila[simbolo].set(f"{suma_fila[simbolo]:.2f}")
 
             tk.Label(frame_tabla, textvariable=totales_fila[simbolo], borderwidth=1, relief="solid",
                     width=10, anchor="center", bg="lightgray").grid(row=index+1, column=13)
 
+        for mes_idx in range(12):
+            totales_mes[mes_idx].set(f"{suma_mes[mes_idx]:.2f}")
+        total_general.set(f"{suma_total[0]:.2f}")
+
         tk.Label(frame_tabla, text="TOTAL", borderwidth=1, relief="solid", width=15,
                 bg="orange", fg="blue", font=("Arial", 12, "bold")).grid(row=len(activos_con_dividendos)+1, column=0)
 
@@ -512,22 +1104,57 @@ def ventana_dividendos():
         tk.Label(frame_tabla, textvariable=total_general, borderwidth=1, relief="solid",
                 width=10, anchor="center", bg="orange", font=("Arial", 12, "bold")).grid(row=len(activos_con_dividendos)+1, column=13)
 
-        actualizar_totales()
         frame_tabla.bind("<Configure>", lambda e: canvas.configure(scrollregion=canvas.bbox("all")))
 
-    for ano in [2022, 2023, 2024, 2025]:
-        crear_tabla_ano(ano)
+    # Las pestañas de cada año se crean vacías y se rellenan al seleccionarlas por primera vez;
+    # las que llevan un rato sin verse se vacían para liberar sus widgets.
+    pestanas = {}
+    construidas = {}
 
-def iniciar_gui():
+    for ano in anos:
+        frame_ano = tk.Frame(notebook)
+        notebook.add(frame_ano, text=str(ano))
+        pestanas[str(frame_ano)] = (ano, frame_ano)
+
+    def al_cambiar_pestana(event):
+        seleccion = pestanas.get(notebook.select())
+        if seleccion is None:
+            return
+        ano, frame_ano = seleccion
+        if ano not in construidas:
+            crear_tabla_ano(ano, frame_ano)
+        construidas[ano] = (time.monotonic(), frame_ano)
+
+    def liberar_pestanas():
+        ahora = time.monotonic()
+        actual = pestanas.get(notebook.select(), (None,))[0]
+        for ano, (visto, frame_ano) in list(construidas.items()):
+            if ano == actual:
+                construidas[ano] = (ahora, frame_ano)
+            elif ahora - visto > INACTIVIDAD_PESTANA:
+                for hijo in frame_ano.winfo_children():
+                    hijo.destroy()
+                del construidas[ano]
+        comprobacion[0] = ventana.after(COMPROBACION_PESTANAS_MS, liberar_pestanas)
+
+    notebook.bind("<<NotebookTabChanged>>", al_cambiar_pestana)
+    comprobacion = [ventana.after(COMPROBACION_PESTANAS_MS, liberar_pestanas)]
+
+def crear_menu_principal():
+    global ejecutor
     root = tk.Tk()
+    ejecutor = EjecutorTareas(root)
     root.title("Gestor de Cartera AAF")
-    root.geometry("400x350")
+    root.geometry("400x410")
 
     tk.Label(root, text="Gestor de Cartera AAF", font=("Arial", 18, "bold")).pack(pady=20)
 
     tk.Button(root, text="Añadir Nuevos Activos", command=ventana_agregar_activos,
              width=25, height=2, font=("Arial", 12), bg="lightblue").pack(pady=5)
 
+    tk.Button(root, text="Importar Posiciones", command=ventana_importar_activos,
+             width=25, height=2, font=("Arial", 12), bg="lightblue").pack(pady=5)
+
     tk.Button(root, text="Ver Cartera", command=ventana_ver_cartera,
              width=25, height=2, font=("Arial", 12), bg="lightgreen").pack(pady=5)
 
@@ -536,5 +1163,18 @@ def iniciar_gui():
 
     tk.Button(root, text="Salir", command=root.destroy,
              width=25, height=2, font=("Arial", 12), bg="#FFC0CB").pack(pady=(20, 10))
+    return root
 
+def detener_motores():
+    # Aplica los ticks pendientes, guarda los últimos precios en el diario y para las fuentes.
+    while _motores_vivos:
+        _motores_vivos.pop().detener()
+
+def iniciar_gui():
+    root = crear_menu_principal()
     root.mainloop()
+    detener_motores()
+    volcar_guardados()
+    ejecutor.cerrar()
+    if _portfolio is not None:
+        _portfolio.compact()
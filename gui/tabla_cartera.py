@@ -0,0 +1,197 @@
+import tkinter as tk
+from tkinter import ttk
+
+COLUMNAS = [
+    'símbolo',
+    'título',
+    'cantidad',
+    'precio_actual',
+    'importe_total',
+    'divisa',
+    '% Activo',
+    'tipo_activo',
+    'broker'
+]
+
+COLUMNAS_MAP = {
+    'símbolo': 'SIMBOLO',
+    'título': 'TITULO',
+    'cantidad': 'CANTIDAD',
+    'precio_actual': 'PRECIO',
+    'importe_total': 'IMPORTE',
+    'divisa': 'DIV',
+    '% Activo': '%',
+    'tipo_activo': 'TIPO',
+    'broker': 'BROKER'
+}
+
+ANCHURAS = {
+    'símbolo': 100,
+    'título': 320,
+    'cantidad': 80,
+    'precio_actual': 90,
+    'importe_total': 110,
+    'divisa': 50,
+    '% Activo': 70,
+    'tipo_activo': 60,
+    'broker': 80
+}
+
+COLUMNAS_NUMERICAS = {'cantidad', 'precio_actual', 'importe_total', '% Activo'}
+
+COLORES_TIPO = {"PP": "#ADD8E6", "FON": "#90EE90", "ETF": "#FFFFE0", "ACC": "#FFDAB9"}
+
+
+# Tabla de la cartera sobre ttk.Treeview: Tk solo dibuja las filas visibles,
+# así que el número de widgets no depende del número de posiciones.
+class TablaCartera:
+    def __init__(self, master, al_editar=None, al_eliminar=None):
+        self.al_editar = al_editar
+        self.al_eliminar = al_eliminar
+        self.total = 0.0
+        # Tipos de cambio a la divisa base para el porcentaje; None si todo está en la base.
+        self.tipos = None
+        self._filas = {}
+        self._orden = (None, False)
+
+        self.frame = tk.Frame(master)
+        self.tree = ttk.Treeview(self.frame, columns=COLUMNAS, show="headings", selectmode="browse")
+        scrollbar = ttk.Scrollbar(self.frame, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.pack(side="left", fill="both", expand=True)
+        scrollbar.pack(side="right", fill="y")
+
+        for columna in COLUMNAS:
+            self.tree.heading(columna, text=COLUMNAS_MAP[columna], command=lambda c=columna: self.ordenar(c))
+            anchor = "w" if columna == "título" else "center"
+            self.tree.column(columna, width=ANCHURAS[columna], anchor=anchor, stretch=columna == "título")
+        for tipo, color in COLORES_TIPO.items():
+            self.tree.tag_configure(tipo, background=color)
+
+        self.menu = tk.Menu(self.tree, tearoff=0)
+        self.menu.add_command(label="Editar", command=lambda: self._accion(self.al_editar))
+        self.menu.add_command(label="Eliminar", command=lambda: self._accion(self.al_eliminar))
+        self.tree.bind("<Button-3>", self._mostrar_menu)
+        self.tree.bind("<Double-1>", lambda e: self._accion(self.al_editar))
+        self.tree.bind("<Delete>", lambda e: self._accion(self.al_eliminar))
+
+    def pack(self, **kwargs):
+        self.frame.pack(**kwargs)
+
+    def _importe_base(self, fila):
+        if self.tipos is None:
+            return fila['importe_total']
+        return fila['importe_total'] * self.tipos.get(fila.get('divisa', 'EUR'), 0.0)
+
+    def _valores(self, fila):
+        porcentaje = (self._importe_base(fila) / self.total * 100) if self.total > 0 else 0
+        valores = []
+        for columna in COLUMNAS:
+            if columna == '% Activo':
+                valores.append(f"{porcentaje:.2f}%")
+            elif columna == 'importe_total':
+                valores.append(f"{fila['importe_total']:.2f}")
+            else:
+                valores.append(str(fila.get(columna, '')))
+        return valores
+
+    def cargar(self, filas, total, tipos=None):
+        self.total = total
+        self.tipos = tipos
+        self.tree.delete(*self.tree.get_children())
+        self._filas = {}
+        for fila in filas:
+            simbolo = fila['símbolo']
+            self._filas[simbolo] = fila
+            self.tree.insert("", tk.END, iid=simbolo, values=self._valores(fila), tags=(fila.get('tipo_activo', ''),))
+        columna, descendente = self._orden
+        if columna:
+            self.ordenar(columna, descendente)
+
+    def actualizar_fila(self, fila):
+        # Con un orden activo, una fila nueva entra en su sitio y una modificada solo se
+        # mueve si deja de estar ordenada respecto a sus vecinas.
+        simbolo = fila['símbolo']
+        self._filas[simbolo] = fila
+        tags = (fila.get('tipo_activo', ''),)
+        if self.tree.exists(simbolo):
+            self.tree.item(simbolo, values=self._valores(fila), tags=tags)
+            if self._orden[0] and not self._en_orden(simbolo):
+                self.tree.move(simbolo, "", self._posicion(simbolo))
+        else:
+            posicion = self._posicion(simbolo) if self._orden[0] else tk.END
+            self.tree.insert("", posicion, iid=simbolo, values=self._valores(fila), tags=tags)
+
+    def _antes(self, a, b, clave):
+        # ¿Debe ir la fila a antes que b (estrictamente) en el orden activo?
+        return clave(b) < clave(a) if self._orden[1] else clave(a) < clave(b)
+
+    def _en_orden(self, simbolo):
+        clave = self._clave(self._orden[0])
+        anterior, siguiente = self.tree.prev(simbolo), self.tree.next(simbolo)
+        return not ((anterior and self._antes(simbolo, anterior, clave)) or
+                    (siguiente and self._antes(siguiente, simbolo, clave)))
+
+    def _posicion(self, simbolo):
+        # Búsqueda binaria sobre las filas ya colocadas; a igualdad, detrás de las existentes.
+        clave = self._clave(self._orden[0])
+        hijos = [hijo for hijo in self.tree.get_children() if hijo != simbolo]
+        bajo, alto = 0, len(hijos)
+        while bajo < alto:
+            medio = (bajo + alto) // 2
+            if self._antes(simbolo, hijos[medio], clave):
+                alto = medio
+            else:
+                bajo = medio + 1
+        return bajo
+
+    def eliminar_fila(self, simbolo):
+        if self._filas.pop(simbolo, None) is not None:
+            self.tree.delete(simbolo)
+
+    def actualizar_total(self, total):
+        # Solo cambia la columna de porcentaje; el resto de cada fila se deja intacto.
+        if total == self.total:
+            return
+        self.total = total
+        for simbolo, fila in self._filas.items():
+            porcentaje = (self._importe_base(fila) / total * 100) if total > 0 else 0
+            self.tree.set(simbolo, '% Activo', f"{porcentaje:.2f}%")
+
+    def cambiar_tipos(self, tipos, total):
+        # Tipos de cambio nuevos: cambian los porcentajes (y el orden por porcentaje), no las filas.
+        self.tipos = tipos
+        self.total = None
+        self.actualizar_total(total)
+        if self._orden[0] == '% Activo':
+            self.ordenar(*self._orden)
+
+    def _clave(self, columna):
+        if columna == '% Activo':
+            return lambda simbolo: self._importe_base(self._filas[simbolo])
+        if columna in COLUMNAS_NUMERICAS:
+            return lambda simbolo: self._filas[simbolo].get(columna) or 0
+        return lambda simbolo: str(self._filas[simbolo].get(columna, '')).lower()
+
+    def ordenar(self, columna, descendente=None):
+        if descendente is None:
+            columna_actual, descendente_actual = self._orden
+            descendente = not descendente_actual if columna_actual == columna else False
+        self._orden = (columna, descendente)
+        for posicion, simbolo in enumerate(sorted(self._filas, key=self._clave(columna), reverse=descendente)):
+            self.tree.move(simbolo, "", posicion)
+
+    def seleccionado(self):
+        seleccion = self.tree.selection()
+        return seleccion[0] if seleccion else None
+
+    def _mostrar_menu(self, event):
+        fila = self.tree.identify_row(event.y)
+        if fila:
+            self.tree.selection_set(fila)
+            self.menu.tk_popup(event.x_root, event.y_root)
+
+    def _accion(self, callback):
+        simbolo = self.seleccionado()
+        if simbolo and callback:
+            callback(simbolo)
@@ -0,0 +1,164 @@
+import queue
+import sys
+import threading
+import time
+import tkinter as tk
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Presupuesto de tiempo por sondeo para no bloquear el bucle de Tk más de un fotograma.
+PRESUPUESTO_SONDEO = 0.008
+INTERVALO_SONDEO_MS = 15
+
+
+class TareaCancelada(Exception):
+    pass
+
+
+class Tarea:
+    def __init__(self, cola, al_terminar=None, al_error=None, al_progreso=None):
+        self._cola = cola
+        self._cancelada = threading.Event()
+        self.al_terminar = al_terminar
+        self.al_error = al_error
+        self.al_progreso = al_progreso
+
+    def cancelar(self):
+        self._cancelada.set()
+
+    @property
+    def cancelada(self):
+        return self._cancelada.is_set()
+
+    def comprobar(self):
+        if self.cancelada:
+            raise TareaCancelada()
+
+    def progreso(self, hecho, total):
+        if self.al_progreso:
+            self._cola.put((self.al_progreso, (hecho, total)))
+
+
+# Ejecuta trabajos en un pool de hilos; los resultados vuelven por una cola
+# que el bucle de Tk drena con after(), de modo que los callbacks corren en el hilo de la GUI.
+# Los trabajos enviados con guardado=True escriben datos y se terminan siempre, también al
+# cerrar; el resto (descargas, cálculos) se cancela al cerrar.
+class EjecutorTareas:
+    def __init__(self, raiz, max_hilos=4):
+        self.raiz = raiz
+        self._pool = ThreadPoolExecutor(max_workers=max_hilos, thread_name_prefix="cartera")
+        self._cola = queue.Queue()
+        self._cerrado = False
+        self._cancelables = set()
+        self._lock = threading.Lock()
+        self.raiz.after(INTERVALO_SONDEO_MS, self._sondear)
+
+    def enviar(self, trabajo, al_terminar=None, al_error=None, al_progreso=None, guardado=False):
+        tarea = Tarea(self._cola, al_terminar, al_error, al_progreso)
+        if not guardado:
+            with self._lock:
+                self._cancelables.add(tarea)
+        self._pool.submit(self._ejecutar, trabajo, tarea)
+        return tarea
+
+    def _ejecutar(self, trabajo, tarea):
+        try:
+            if tarea.cancelada:
+                return
+            resultado = trabajo(tarea)
+        except TareaCancelada:
+            return
+        except Exception as e:
+            if tarea.al_error:
+                self._cola.put((tarea.al_error, (e,)))
+            return
+        finally:
+            with self._lock:
+                self._cancelables.discard(tarea)
+        if tarea.cancelada:
+            return
+        if tarea.al_terminar:
+            self._cola.put((tarea.al_terminar, (resultado,)))
+
+    def _sondear(self):
+        if self._cerrado:
+            return
+        limite = time.perf_counter() + PRESUPUESTO_SONDEO
+        while time.perf_counter() < limite:
+            try:
+                callback, args = self._cola.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                callback(*args)
+            except Exception:
+                # Como cualquier otro callback de Tk: se informa por el manejador de la raíz
+                # (traza completa) y se sigue drenando la cola.
+                self.raiz.report_callback_exception(*sys.exc_info())
+        self.raiz.after(INTERVALO_SONDEO_MS, self._sondear)
+
+    def cerrar(self):
+        # Lo cancelable que aún no ha empezado ya no se ejecuta; lo que está en marcha se
+        # detiene en su próximo comprobar(). Los guardados en cola se esperan.
+        self._cerrado = True
+        with self._lock:
+            for tarea in self._cancelables:
+                tarea.cancelar()
+        self._pool.shutdown(wait=True)
+
+
+# Guardados diferidos de las ventanas abiertas. Salir destruye la raíz sin pasar por el
+# cierre de cada ventana, así que al terminar se vuelcan todos con volcar_guardados().
+_guardados_abiertos = set()
+
+
+def volcar_guardados():
+    for guardado in list(_guardados_abiertos):
+        guardado.cerrar()
+
+
+# Guardado con retardo: varias ediciones seguidas se agrupan en una sola escritura.
+# preparar() se llama en el hilo de Tk y devuelve los datos a escribir (instantánea o
+# cambios pendientes); escribir(datos) se ejecuta en el ejecutor, siempre en orden de llegada.
+class GuardadoDiferido:
+    def __init__(self, widget, preparar, escribir, ejecutor, retardo_ms=800, al_error=None):
+        self.widget = widget
+        self.preparar = preparar
+        self.escribir = escribir
+        self.ejecutor = ejecutor
+        self.retardo_ms = retardo_ms
+        self.al_error = al_error
+        self._pendiente = None
+        self._cola = deque()
+        self._lock = threading.Lock()
+        _guardados_abiertos.add(self)
+
+    def marcar(self):
+        if self._pendiente is not None:
+            self.widget.after_cancel(self._pendiente)
+        self._pendiente = self.widget.after(self.retardo_ms, self.volcar)
+
+    def volcar(self):
+        if self._pendiente is None:
+            return
+        try:
+            self.widget.after_cancel(self._pendiente)
+        except tk.TclError:
+            # La ventana ya no existe (se está saliendo): el temporizador murió con ella.
+            pass
+        self._pendiente = None
+        self._cola.append(self.preparar())
+        self.ejecutor.enviar(self._escribir_pendientes, al_error=self.al_error, guardado=True)
+
+    def cerrar(self):
+        self.volcar()
+        _guardados_abiertos.discard(self)
+
+    def _escribir_pendientes(self, tarea):
+        with self._lock:
+            while self._cola:
+                self.escribir(self._cola.popleft())
+
+    @property
+    def pendiente(self):
+        return self._pendiente is not None
@@ -1,5 +1,7 @@
 class Asset:
-    def __init__(self, simbolo, titulo, cantidad, precio_actual, importe_total, dividendos, tipo_activo, broker):
+    __slots__ = ("simbolo", "titulo", "cantidad", "precio_actual", "importe_total", "dividendos", "tipo_activo", "broker", "divisa")
+
+    def __init__(self, simbolo, titulo, cantidad, precio_actual, importe_total, dividendos, tipo_activo, broker, divisa="EUR"):
         self.simbolo = simbolo
         self.titulo = titulo
         self.cantidad = cantidad
@@ -8,6 +10,8 @@ class Asset:
         self.dividendos = dividendos
         self.tipo_activo = tipo_activo
         self.broker = broker
+        # Divisa de cotización: precio_actual e importe_total están expresados en ella.
+        self.divisa = divisa
 
     def to_dict(self):
         return {
@@ -19,6 +23,7 @@ class Asset:
             "dividendos": self.dividendos,
             "tipo_activo": self.tipo_activo,
             "broker": self.broker,
+            "divisa": self.divisa,
         }
 
     @classmethod
@@ -32,4 +37,5 @@ class Asset:
             data["dividendos"],
             data["tipo_activo"],
             data["broker"],
+            data.get("divisa", "EUR"),
         )
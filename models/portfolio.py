@@ -1,44 +1,259 @@
 import json
+import os
+import threading
+from contextlib import contextmanager
 from models.asset import Asset
+from services.instrumentacion import medido, contar
+
+# Entradas de diario acumuladas antes de volcar una instantánea completa y vaciarlo.
+COMPACT_EVERY = 1000
 
 class Portfolio:
     def __init__(self, cartera_file):
         self.cartera_file = cartera_file
+        # Las mutaciones y el guardado pueden llegar desde hilos de trabajo de la GUI.
+        self.lock = threading.RLock()
+        # Se incrementa en cada mutación; permite invalidar cachés derivadas (agregados).
+        self.version = 0
+        # Cada mutación se añade a un diario (una línea JSON por cambio) en lugar de
+        # reescribir toda la cartera; el diario se compacta en una instantánea atómica.
+        self.journal_file = cartera_file + ".journal"
+        self._journal_entries = 0
+        self._batch = None
+        # Precios cambiados con persist=False que aún no están en el diario.
+        self._unlogged_prices = set()
         self.assets = self.load_assets()
+        self._reindex()
+
+    def _reindex(self):
+        # símbolo -> posición en self.assets, más índices secundarios por tipo y broker.
+        # _indexed guarda el tipo/broker con el que se indexó cada símbolo, por si el Asset
+        # se modificó en sitio antes de llamar a update_asset.
+        self._index = {}
+        self._by_type = {}
+        self._by_broker = {}
+        self._indexed = {}
+        for i, asset in enumerate(self.assets):
+            self._index[asset.simbolo] = i
+            self._add_secondary(asset)
+
+    def _add_secondary(self, asset):
+        self._by_type.setdefault(asset.tipo_activo, set()).add(asset.simbolo)
+        self._by_broker.setdefault(asset.broker, set()).add(asset.simbolo)
+        self._indexed[asset.simbolo] = (asset.tipo_activo, asset.broker)
+
+    def _remove_secondary(self, symbol):
+        tipo, broker = self._indexed.pop(symbol)
+        self._by_type[tipo].discard(symbol)
+        self._by_broker[broker].discard(symbol)
 
+    @medido("portfolio.load_assets")
     def load_assets(self):
         try:
             with open(self.cartera_file, 'r') as f:
                 data = json.load(f)
-                return [Asset.from_dict(item) for item in data]
-        except (FileNotFoundError, json.JSONDecodeError):
-            return []
+        except FileNotFoundError:
+            data = []
+        except json.JSONDecodeError as e:
+            # Las instantáneas se escriben de forma atómica: un fichero ilegible no es una cartera vacía.
+            raise ValueError(f"El fichero de cartera '{self.cartera_file}' está dañado: {e}") from e
+        assets = {item["símbolo"]: Asset.from_dict(item) for item in data}
+        self._journal_entries = self._replay_journal(assets)
+        return list(assets.values())
+
+    def _replay_journal(self, assets):
+        try:
+            with open(self.journal_file, 'rb') as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return 0
+        applied = 0
+        offset = 0
+        for line in lines:
+            try:
+                if not line.endswith(b"\n"):
+                    raise ValueError("entrada incompleta")
+                entry = json.loads(line)
+            except ValueError:
+                # Última línea a medio escribir tras una caída: se recorta para que
+                # las siguientes entradas no se peguen a ella.
+                with open(self.journal_file, 'r+b') as f:
+                    f.truncate(offset)
+                break
+            offset += len(line)
+            applied += 1
+            op = entry["op"]
+            if op == "add":
+                asset = Asset.from_dict(entry["asset"])
+                assets[asset.simbolo] = asset
+            elif op == "update":
+                # En su sitio, como update_asset: recargar no debe cambiar el orden.
+                asset = Asset.from_dict(entry["asset"])
+                symbol = entry["symbol"]
+                if symbol not in assets:
+                    continue
+                if asset.simbolo == symbol:
+                    assets[symbol] = asset
+                else:
+                    items = list(assets.items())
+                    assets.clear()
+                    assets.update((asset.simbolo, asset) if k == symbol else (k, v) for k, v in items)
+            elif op == "delete":
+                assets.pop(entry["symbol"], None)
+            elif op == "prices":
+                for symbol, price in entry["prices"].items():
+                    if symbol in assets:
+                        assets[symbol].precio_actual = price
+                        assets[symbol].importe_total = assets[symbol].cantidad * price
+        return applied
+
+    def _log(self, entry):
+        if self._batch is not None:
+            self._batch.append(entry)
+            return
+        self._write_journal([entry])
+
+    def _write_journal(self, entries):
+        if self._journal_entries + len(entries) >= COMPACT_EVERY:
+            self.save_assets()
+            return
+        with open(self.journal_file, 'a') as f:
+            f.write("".join(json.dumps(entry) + "\n" for entry in entries))
+        self._journal_entries += len(entries)
+        contar("portfolio.entradas_diario", len(entries))
 
+    @medido("portfolio.save_assets")
     def save_assets(self):
-        with open(self.cartera_file, 'w') as f:
-            json.dump([asset.to_dict() for asset in self.assets], f, indent=4)
+        # Instantánea completa: fichero temporal + os.replace, y después se vacía el diario.
+        with self.lock:
+            temp_file = self.cartera_file + ".tmp"
+            with open(temp_file, 'w') as f:
+                json.dump([asset.to_dict() for asset in self.assets], f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_file, self.cartera_file)
+            if os.path.exists(self.journal_file):
+                os.remove(self.journal_file)
+            self._journal_entries = 0
+            self._unlogged_prices.clear()
+
+    def compact(self):
+        with self.lock:
+            if self._journal_entries:
+                self.save_assets()
+
+    @contextmanager
+    def transaction(self):
+        # Agrupa varias mutaciones y las persiste de una vez al salir. Si el bloque falla,
+        # se descartan y la cartera se recarga desde disco.
+        with self.lock:
+            if self._batch is not None:
+                yield self
+                return
+            self._batch = []
+            try:
+                yield self
+            except BaseException:
+                self._batch = None
+                self._unlogged_prices.clear()
+                self.assets = self.load_assets()
+                self._reindex()
+                self.version += 1
+                raise
+            entries, self._batch = self._batch, None
+            if entries:
+                self._write_journal(entries)
 
     def add_asset(self, asset):
-        self.assets.append(asset)
-        self.save_assets()
+        with self.lock:
+            if asset.simbolo in self._index:
+                raise ValueError(f"El símbolo '{asset.simbolo}' ya está en la cartera.")
+            self._index[asset.simbolo] = len(self.assets)
+            self.assets.append(asset)
+            self._add_secondary(asset)
+            self.version += 1
+            self._log({"op": "add", "asset": asset.to_dict()})
 
     def update_asset(self, symbol, updated_asset):
-        for i, asset in enumerate(self.assets):
-            if asset.simbolo == symbol:
-                self.assets[i] = updated_asset
-                self.save_assets()
-                return True
-        return False
+        with self.lock:
+            i = self._index.get(symbol)
+            if i is None:
+                return False
+            self._remove_secondary(symbol)
+            if updated_asset.simbolo != symbol:
+                del self._index[symbol]
+                self._index[updated_asset.simbolo] = i
+            self.assets[i] = updated_asset
+            self._add_secondary(updated_asset)
+            self.version += 1
+            self._log({"op": "update", "symbol": symbol, "asset": updated_asset.to_dict()})
+            return True
 
     def delete_asset(self, symbol):
-        self.assets = [asset for asset in self.assets if asset.simbolo != symbol]
-        self.save_assets()
+        with self.lock:
+            i = self._index.pop(symbol, None)
+            if i is None:
+                return
+            # Se conserva el orden (el de la tabla y el del fichero): los posteriores
+            # retroceden una posición. Borrar es raro frente a consultar y actualizar.
+            del self.assets[i]
+            for j in range(i, len(self.assets)):
+                self._index[self.assets[j].simbolo] = j
+            self._remove_secondary(symbol)
+            self._unlogged_prices.discard(symbol)
+            self.version += 1
+            self._log({"op": "delete", "symbol": symbol})
+
+    def update_prices(self, prices, persist=True):
+        # persist=False solo cambia la memoria (ticks en tiempo real); quien lo use debe
+        # volver a llamar con persist=True para dejar los últimos precios en el diario.
+        # Un precio igual al actual no cuenta como cambio, salvo que falte en el diario.
+        with self.lock:
+            applied = {}
+            changed = False
+            for symbol, price in prices.items():
+                i = self._index.get(symbol)
+                if i is None:
+                    continue
+                asset = self.assets[i]
+                if asset.precio_actual != price:
+                    asset.precio_actual = price
+                    asset.importe_total = asset.cantidad * asset.precio_actual
+                    changed = True
+                elif not (persist and symbol in self._unlogged_prices):
+                    continue
+                applied[symbol] = price
+            if changed:
+                self.version += 1
+            if persist:
+                if applied:
+                    self._unlogged_prices.difference_update(applied)
+                    self._log({"op": "prices", "prices": applied})
+            else:
+                self._unlogged_prices.update(applied)
+            return applied
+
+    def to_columns(self):
+        # Instantánea columnar de la cartera; los importes van en la divisa de cada activo.
+        with self.lock:
+            return {
+                'símbolo': [asset.simbolo for asset in self.assets],
+                'cantidad': [asset.cantidad for asset in self.assets],
+                'importe_total': [asset.importe_total for asset in self.assets],
+                'tipo_activo': [asset.tipo_activo for asset in self.assets],
+                'broker': [asset.broker for asset in self.assets],
+                'divisa': [asset.divisa for asset in self.assets],
+            }
 
     def get_all_assets(self):
         return self.assets
 
     def get_asset_by_symbol(self, symbol):
-        for asset in self.assets:
-            if asset.simbolo == symbol:
-                return asset
-        return None
+        i = self._index.get(symbol)
+        return self.assets[i] if i is not None else None
+
+    def get_assets_by_type(self, tipo):
+        return [self.assets[self._index[symbol]] for symbol in self._by_type.get(tipo, ())]
+
+    def get_assets_by_broker(self, broker):
+        return [self.assets[self._index[symbol]] for symbol in self._by_broker.get(broker, ())]
@@ -0,0 +1,134 @@
+import weakref
+
+import numpy as np
+
+# Agrupaciones calculadas: nombre -> columnas de la instantánea que forman la clave.
+AGRUPACIONES = {
+    'tipo': ('tipo_activo',),
+    'broker': ('broker',),
+    'tipo_broker': ('tipo_activo', 'broker'),
+    'divisa': ('divisa',),
+}
+
+# Valor de una columna cuando la fila no la trae (carteras guardadas antes de la divisa).
+VALORES_POR_DEFECTO = {'divisa': 'EUR'}
+
+_cache = weakref.WeakKeyDictionary()
+
+
+def _codificar(columna):
+    categorias, codigos = np.unique(np.asarray(columna, dtype=object).astype(str), return_inverse=True)
+    return categorias.tolist(), codigos
+
+
+def calcular_parciales(columnas):
+    # Sumas por agrupación y divisa, en la divisa de cada activo: una matriz
+    # [grupos x divisas] por agrupación. Convertirlas a la divisa base es un producto
+    # matriz-vector, así que un cambio de tipos no obliga a recorrer las posiciones.
+    importes = np.asarray(columnas['importe_total'], dtype=float)
+    cantidades = np.asarray(columnas['cantidad'], dtype=float)
+    divisas, codigos_divisa = _codificar(columnas['divisa'])
+    parciales = {
+        'divisas': divisas,
+        'general': np.bincount(codigos_divisa, weights=importes, minlength=len(divisas)),
+        'acciones': int(cantidades.sum()),
+    }
+
+    # Cada columna categórica se codifica una sola vez; las agrupaciones compuestas
+    # combinan códigos y se suman con un único bincount por medida.
+    codificadas = {'divisa': (divisas, codigos_divisa)}
+    for claves in AGRUPACIONES.values():
+        for clave in claves:
+            if clave not in codificadas:
+                codificadas[clave] = _codificar(columnas[clave])
+
+    for nombre, claves in AGRUPACIONES.items():
+        codigos = np.zeros(len(importes), dtype=np.int64)
+        etiquetas = [()]
+        for clave in claves:
+            categorias, codigos_clave = codificadas[clave]
+            codigos = codigos * len(categorias) + codigos_clave
+            etiquetas = [anterior + (categoria,) for anterior in etiquetas for categoria in categorias]
+        grupos = len(etiquetas)
+        matriz = np.bincount(codigos * len(divisas) + codigos_divisa, weights=importes,
+                             minlength=grupos * len(divisas)).reshape(grupos, len(divisas))
+        suma_cantidades = np.bincount(codigos, weights=cantidades, minlength=grupos)
+        presentes = np.bincount(codigos, minlength=grupos) > 0
+        etiquetas = [e[0] if len(e) == 1 else e for e, p in zip(etiquetas, presentes) if p]
+        parciales[nombre] = (etiquetas, matriz[presentes], suma_cantidades[presentes])
+    return parciales
+
+
+def convertir(parciales, tipos=None):
+    # tipos: {divisa: factor a la base}. Sin tipos, los importes se suman tal cual; una
+    # divisa sin tipo conocido no suma y se informa en 'sin_tipo'.
+    divisas = parciales['divisas']
+    if tipos is None:
+        factores = np.ones(len(divisas))
+    else:
+        factores = np.array([tipos.get(divisa, np.nan) for divisa in divisas], dtype=float)
+    sin_tipo = [divisa for divisa, factor in zip(divisas, factores) if np.isnan(factor)]
+    factores = np.nan_to_num(factores)
+    totales = {
+        'general': float(parciales['general'] @ factores),
+        'acciones': parciales['acciones'],
+        'tipos': dict(tipos) if tipos is not None else None,
+        'sin_tipo': sin_tipo,
+    }
+    for nombre in AGRUPACIONES:
+        etiquetas, matriz, cantidades = parciales[nombre]
+        totales[nombre] = {e: float(v) for e, v in zip(etiquetas, matriz @ factores)}
+        totales[nombre + '_cant'] = {e: int(v) for e, v in zip(etiquetas, cantidades)}
+    return totales
+
+
+def calcular_agregados(columnas, tipos=None):
+    return convertir(calcular_parciales(columnas), tipos)
+
+
+def agregados_cartera(portfolio, tipos=None):
+    # Parciales cacheados por cartera y versión; si solo cambian los tipos de cambio,
+    # se reutilizan y únicamente se repite la conversión.
+    clave_tipos = None if tipos is None else tuple(sorted(tipos.items()))
+    entrada = _cache.get(portfolio)
+    if entrada is not None and entrada[0] == portfolio.version:
+        _, parciales, clave_anterior, resultado = entrada
+        if clave_anterior == clave_tipos:
+            return resultado
+    else:
+        parciales = calcular_parciales(portfolio.to_columns())
+    version = portfolio.version
+    resultado = convertir(parciales, tipos)
+    _cache[portfolio] = (version, parciales, clave_tipos, resultado)
+    return resultado
+
+
+def acumular(totales, fila, signo):
+    # Aplica (signo=1) o retira (signo=-1) una fila de unos totales ya calculados.
+    tipos = totales.get('tipos')
+    divisa = fila.get('divisa', VALORES_POR_DEFECTO['divisa'])
+    importe = signo * fila['importe_total'] * (1.0 if tipos is None else tipos.get(divisa, 0.0))
+    cantidad = signo * fila['cantidad']
+    totales['general'] += importe
+    totales['acciones'] += cantidad
+    for nombre, claves in AGRUPACIONES.items():
+        valores = tuple(fila.get(clave, VALORES_POR_DEFECTO.get(clave, '')) for clave in claves)
+        etiqueta = valores[0] if len(valores) == 1 else valores
+        totales[nombre][etiqueta] = totales[nombre].get(etiqueta, 0.0) + importe
+        totales[nombre + '_cant'][etiqueta] = totales[nombre + '_cant'].get(etiqueta, 0) + cantidad
+
+
+def ajustar_importe(totales, fila, delta):
+    # Variante de acumular para un cambio de precio: cantidades y grupos no cambian,
+    # solo se suma la diferencia de importe (en la divisa del activo) a cada grupo.
+    tipos = totales.get('tipos')
+    divisa = fila.get('divisa', VALORES_POR_DEFECTO['divisa'])
+    importe = delta * (1.0 if tipos is None else tipos.get(divisa, 0.0))
+    totales['general'] += importe
+    for nombre, claves in AGRUPACIONES.items():
+        if len(claves) == 1:
+            etiqueta = fila.get(claves[0], VALORES_POR_DEFECTO.get(claves[0], ''))
+        else:
+            etiqueta = tuple(fila.get(clave, VALORES_POR_DEFECTO.get(clave, '')) for clave in claves)
+        grupo = totales[nombre]
+        grupo[etiqueta] = grupo.get(etiqueta, 0.0) + importe
@@ -0,0 +1,142 @@
+import numpy as np
+
+SESIONES_ANO = 252
+VENTANA_VOLATILIDAD = 21
+
+
+def serie_valor(cierres, cantidades):
+    # cierres[T, N] por cantidades[N] (posiciones fijas) o cantidades[T, N] (variables).
+    # Un símbolo sin cotización todavía no aporta valor.
+    cierres = np.nan_to_num(cierres, nan=0.0)
+    cantidades = np.asarray(cantidades, dtype=np.float64)
+    if cantidades.ndim == 1:
+        return cierres @ cantidades
+    return np.einsum('tn,tn->t', cierres, cantidades)
+
+
+def flujos_por_altas(cierres, cantidades):
+    # Con cantidades fijas, un símbolo que empieza a cotizar a mitad de periodo haría saltar
+    # el valor; su entrada se trata como una aportación para no contarla como rentabilidad.
+    cierres = np.asarray(cierres, dtype=np.float64)
+    cantidades = np.broadcast_to(np.asarray(cantidades, dtype=np.float64), cierres.shape)
+    alta = np.zeros(cierres.shape, dtype=bool)
+    alta[1:] = np.isnan(cierres[:-1]) & ~np.isnan(cierres[1:])
+    return np.where(alta, cierres * cantidades, 0.0).sum(axis=1)
+
+
+def rentabilidades_periodo(valor, flujos=None):
+    # Los flujos (aportaciones > 0, retiradas < 0) se consideran al inicio de cada sesión:
+    # r_t = V_t / (V_{t-1} + F_t) - 1.
+    valor = np.asarray(valor, dtype=np.float64)
+    base = valor[:-1].copy()
+    if flujos is not None:
+        base += np.asarray(flujos, dtype=np.float64)[1:]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r = valor[1:] / base - 1
+    r[~np.isfinite(r)] = 0.0
+    return r
+
+
+def twr(valor, flujos=None):
+    if len(valor) < 2:
+        return 0.0
+    return float(np.prod(1 + rentabilidades_periodo(valor, flujos)) - 1)
+
+
+def mwr(fechas, valor, flujos=None, iteraciones=100, tolerancia=1e-10):
+    # TIR anualizada: valor inicial y aportaciones como salidas, valor final como entrada.
+    valor = np.asarray(valor, dtype=np.float64)
+    if len(valor) < 2 or valor[0] <= 0:
+        return 0.0
+    importes = np.zeros(len(valor))
+    if flujos is not None:
+        importes -= np.asarray(flujos, dtype=np.float64)
+    importes[0] = -valor[0]
+    importes[-1] += valor[-1]
+    anos = (np.asarray(fechas, dtype='datetime64[D]') - np.datetime64(fechas[0], 'D')).astype(np.float64) / 365.0
+    con_flujo = importes != 0
+    importes, anos = importes[con_flujo], anos[con_flujo]
+
+    def vpn(tasa):
+        return np.sum(importes * (1 + tasa) ** -anos)
+
+    # Bisección: robusta aunque haya varios cambios de signo. En periodos cortos la tasa
+    # anualizada puede ser enorme, así que el extremo superior se amplía si hace falta.
+    bajo, alto = -0.9999, 10.0
+    while vpn(bajo) * vpn(alto) > 0:
+        if alto > 1e6:
+            return float('nan')
+        alto *= 10
+    for _ in range(iteraciones):
+        medio = (bajo + alto) / 2
+        if vpn(bajo) * vpn(medio) <= 0:
+            alto = medio
+        else:
+            bajo = medio
+        if alto - bajo < tolerancia:
+            break
+    return (bajo + alto) / 2
+
+
+def max_drawdown(valor):
+    # Devuelve (caída máxima como fracción negativa, índice del pico, índice del valle).
+    valor = np.asarray(valor, dtype=np.float64)
+    if not len(valor):
+        return 0.0, 0, 0
+    picos = np.maximum.accumulate(valor)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        caidas = np.where(picos > 0, valor / picos - 1, 0.0)
+    valle = int(np.argmin(caidas))
+    pico = int(np.argmax(valor[:valle + 1])) if valle else 0
+    return float(caidas[valle]), pico, valle
+
+
+def volatilidad_movil(rentabilidades, ventana=VENTANA_VOLATILIDAD, anualizar=SESIONES_ANO):
+    # Desviación típica móvil con sumas acumuladas: O(T) sea cual sea la ventana.
+    # Las primeras ventana-1 posiciones quedan a NaN.
+    r = np.asarray(rentabilidades, dtype=np.float64)
+    resultado = np.full(len(r), np.nan)
+    if len(r) < ventana or ventana < 2:
+        return resultado
+    s1 = np.concatenate([[0.0], np.cumsum(r)])
+    s2 = np.concatenate([[0.0], np.cumsum(r * r)])
+    suma = s1[ventana:] - s1[:-ventana]
+    suma2 = s2[ventana:] - s2[:-ventana]
+    varianza = np.maximum((suma2 - suma * suma / ventana) / (ventana - 1), 0.0)
+    resultado[ventana - 1:] = np.sqrt(varianza * anualizar)
+    return resultado
+
+
+def analizar(fechas, cierres, cantidades, flujos=None, ventana=VENTANA_VOLATILIDAD):
+    valor = serie_valor(cierres, cantidades)
+    if flujos is None:
+        flujos = flujos_por_altas(cierres, cantidades)
+    rentabilidades = rentabilidades_periodo(valor, flujos)
+    caida, pico, valle = max_drawdown(valor)
+    return {
+        'fechas': fechas,
+        'valor': valor,
+        'rentabilidades': rentabilidades,
+        'twr': twr(valor, flujos),
+        'mwr': mwr(fechas, valor, flujos),
+        'max_drawdown': caida,
+        'drawdown_desde': fechas[pico] if len(fechas) else None,
+        'drawdown_hasta': fechas[valle] if len(fechas) else None,
+        'volatilidad': volatilidad_movil(rentabilidades, ventana),
+    }
+
+
+def analizar_cartera(portfolio, almacen=None, tipos=None, desde=None, hasta=None, ventana=VENTANA_VOLATILIDAD):
+    # Valora las posiciones actuales sobre el histórico guardado (cantidades constantes).
+    # El histórico está en la divisa de cotización de cada activo; tipos ({divisa: factor},
+    # ver services/divisas.py) lo pasa a la base. Los activos sin tipo quedan fuera.
+    from services.historico import obtener_almacen
+
+    almacen = almacen or obtener_almacen()
+    activos = portfolio.get_all_assets()
+    fechas, cierres = almacen.matriz([asset.simbolo for asset in activos], desde, hasta)
+    factores = np.array([1.0 if tipos is None else tipos.get(asset.divisa, np.nan) for asset in activos])
+    cantidades = np.array([asset.cantidad for asset in activos], dtype=np.float64) * factores
+    resultado = analizar(fechas, cierres, np.nan_to_num(cantidades), ventana=ventana)
+    resultado['sin_tipo'] = [asset.simbolo for asset, factor in zip(activos, factores) if np.isnan(factor)]
+    return resultado
@@ -0,0 +1,270 @@
+import datetime
+import json
+import os
+import sqlite3
+import threading
+
+from services.instrumentacion import medido, contar
+
+DIVIDENDOS_DB = "data/dividendos.db"
+DIVIDENDOS_JSON = "data/dividendos.json"
+
+
+# Libro de dividendos en SQLite: solo se guardan los pagos distintos de cero, uno por
+# símbolo y mes, con importe numérico. La conexión se comparte entre el hilo de Tk
+# y los hilos de guardado, por eso todas las operaciones pasan por un lock.
+# 'origen' distingue lo tecleado en la rejilla (manual) de lo descargado (auto): la
+# descarga nunca pisa una celda manual, y vaciar a mano una celda descargada deja una
+# marca manual con importe 0 para que no vuelva a rellenarse.
+class LibroDividendos:
+    def __init__(self, ruta=DIVIDENDOS_DB):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self._conexion = sqlite3.connect(ruta, check_same_thread=False)
+        with self._conexion:
+            self._conexion.execute("""
+                CREATE TABLE IF NOT EXISTS pagos (
+                    simbolo TEXT NOT NULL,
+                    ano INTEGER NOT NULL,
+                    mes INTEGER NOT NULL,
+                    fecha TEXT NOT NULL,
+                    importe REAL NOT NULL,
+                    divisa TEXT NOT NULL DEFAULT 'EUR',
+                    PRIMARY KEY (simbolo, ano, mes)
+                ) WITHOUT ROWID
+            """)
+            self._conexion.execute("CREATE INDEX IF NOT EXISTS pagos_ano_mes ON pagos (ano, mes)")
+            columnas = [fila[1] for fila in self._conexion.execute("PRAGMA table_info(pagos)")]
+            if 'origen' not in columnas:
+                # Libros anteriores a la descarga automática: todo lo que hay es manual.
+                self._conexion.execute("ALTER TABLE pagos ADD COLUMN origen TEXT NOT NULL DEFAULT 'manual'")
+            # Fecha ex-dividendo del último pago descargado de cada símbolo.
+            self._conexion.execute("""
+                CREATE TABLE IF NOT EXISTS ingesta (
+                    simbolo TEXT PRIMARY KEY,
+                    hasta TEXT NOT NULL
+                ) WITHOUT ROWID
+            """)
+            # Marcas del propio libro; 'migrado' indica que ya se importó dividendos.json.
+            nueva = self._conexion.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'meta'").fetchone() is None
+            self._conexion.execute("""
+                CREATE TABLE IF NOT EXISTS meta (
+                    clave TEXT PRIMARY KEY,
+                    valor TEXT NOT NULL
+                ) WITHOUT ROWID
+            """)
+            if nueva and self._conexion.execute("SELECT 1 FROM pagos LIMIT 1").fetchone():
+                # Libros anteriores a la marca: si ya tienen pagos, la migración se hizo.
+                self._conexion.execute("INSERT INTO meta (clave, valor) VALUES ('migrado', '1')")
+
+    def cerrar(self):
+        with self._lock:
+            self._conexion.close()
+
+    def migrado(self):
+        with self._lock:
+            return self._conexion.execute("SELECT 1 FROM meta WHERE clave = 'migrado'").fetchone() is not None
+
+    def marcar_migrado(self):
+        with self._lock, self._conexion:
+            self._conexion.execute("INSERT OR REPLACE INTO meta (clave, valor) VALUES ('migrado', '1')")
+
+    def vacio(self):
+        with self._lock:
+            return self._conexion.execute("SELECT 1 FROM pagos LIMIT 1").fetchone() is None
+
+    @medido("dividendos.registrar_lote")
+    def registrar_lote(self, pagos):
+        # pagos: iterable de (simbolo, ano, mes, importe[, divisa]); un importe 0 borra la celda.
+        altas = []
+        bajas = []
+        for pago in pagos:
+            simbolo, ano, mes, importe = pago[:4]
+            divisa = pago[4] if len(pago) > 4 else 'EUR'
+            if importe:
+                altas.append((simbolo, ano, mes, f"{ano:04d}-{mes:02d}-01", float(importe), divisa))
+            else:
+                bajas.append((simbolo, ano, mes))
+        with self._lock, self._conexion:
+            self._conexion.executemany(
+                "INSERT INTO pagos (simbolo, ano, mes, fecha, importe, divisa, origen) VALUES (?, ?, ?, ?, ?, ?, 'manual') "
+                "ON CONFLICT (simbolo, ano, mes) DO UPDATE SET importe = excluded.importe, divisa = excluded.divisa, "
+                "origen = 'manual'",
+                altas)
+            self._conexion.executemany(
+                "DELETE FROM pagos WHERE simbolo = ? AND ano = ? AND mes = ? AND origen = 'manual'", bajas)
+            self._conexion.executemany(
+                "UPDATE pagos SET importe = 0, origen = 'manual' WHERE simbolo = ? AND ano = ? AND mes = ?", bajas)
+
+    @medido("dividendos.registrar_automaticos")
+    def registrar_automaticos(self, pagos, hasta):
+        # pagos: (simbolo, fecha ex 'AAAA-MM-DD', importe, divisa) descargados; hasta:
+        # {simbolo: fecha ex}. La fila guarda la fecha ex real (las manuales, el día 1).
+        # Se suman a lo descargado antes en el mismo mes (dos pagos en un mes, con la fecha
+        # del último) y se ignoran si la celda es manual. Pagos y fechas de ingesta se
+        # guardan en la misma transacción.
+        filas = [(simbolo, int(fecha[:4]), int(fecha[5:7]), fecha, float(importe), divisa)
+                 for simbolo, fecha, importe, divisa in pagos if importe]
+        with self._lock, self._conexion:
+            self._conexion.executemany(
+                "INSERT INTO pagos (simbolo, ano, mes, fecha, importe, divisa, origen) VALUES (?, ?, ?, ?, ?, ?, 'auto') "
+                "ON CONFLICT (simbolo, ano, mes) DO UPDATE SET importe = pagos.importe + excluded.importe, "
+                "fecha = MAX(pagos.fecha, excluded.fecha) WHERE pagos.origen = 'auto'",
+                filas)
+            self._conexion.executemany(
+                "INSERT INTO ingesta (simbolo, hasta) VALUES (?, ?) "
+                "ON CONFLICT (simbolo) DO UPDATE SET hasta = excluded.hasta", list(hasta.items()))
+
+    def ultimas_ingestas(self):
+        with self._lock:
+            return dict(self._conexion.execute("SELECT simbolo, hasta FROM ingesta").fetchall())
+
+    def automaticos(self, ano):
+        # Celdas (simbolo, mes) del año que vienen de la descarga automática.
+        with self._lock:
+            return set(self._conexion.execute(
+                "SELECT simbolo, mes FROM pagos WHERE ano = ? AND origen = 'auto'", (ano,)).fetchall())
+
+    def registrar(self, simbolo, ano, mes, importe, divisa='EUR'):
+        self.registrar_lote([(simbolo, ano, mes, importe, divisa)])
+
+    def pagos(self, simbolo=None, ano=None, mes=None):
+        condiciones = []
+        parametros = []
+        for columna, valor in (("simbolo", simbolo), ("ano", ano), ("mes", mes)):
+            if valor is not None:
+                condiciones.append(f"{columna} = ?")
+                parametros.append(valor)
+        condiciones.append("importe != 0")
+        consulta = "SELECT fecha, simbolo, importe, divisa FROM pagos WHERE " + " AND ".join(condiciones)
+        with self._lock:
+            return self._conexion.execute(consulta + " ORDER BY fecha, simbolo", parametros).fetchall()
+
+    def rejilla(self, ano):
+        # {simbolo: [importe de ene..dic]} para un año.
+        with self._lock:
+            filas = self._conexion.execute("SELECT simbolo, mes, importe FROM pagos WHERE ano = ?", (ano,)).fetchall()
+        rejilla = {}
+        for simbolo, mes, importe in filas:
+            rejilla.setdefault(simbolo, [0.0] * 12)[mes - 1] = importe
+        return rejilla
+
+    def anos(self):
+        with self._lock:
+            return [fila[0] for fila in self._conexion.execute(
+                "SELECT DISTINCT ano FROM pagos WHERE importe != 0 ORDER BY ano")]
+
+    @medido("dividendos.resumen")
+    def resumen(self):
+        # {(simbolo, ano): total} en una sola consulta agregada.
+        with self._lock:
+            filas = self._conexion.execute("SELECT simbolo, ano, SUM(importe) FROM pagos GROUP BY simbolo, ano").fetchall()
+        return {(simbolo, ano): total for simbolo, ano, total in filas}
+
+
+@medido("dividendos.migrar_json")
+def migrar_desde_json(ruta_json, libro):
+    # Formato anterior: {"2024": {"HDLV.DE": ["", "", "7.71", ...]}} con importes como texto.
+    with open(ruta_json, "r") as archivo:
+        datos = json.load(archivo)
+    pagos = []
+    for ano, simbolos in datos.items():
+        for simbolo, meses in simbolos.items():
+            for mes, texto in enumerate(meses, start=1):
+                try:
+                    importe = float(texto or 0)
+                except (TypeError, ValueError):
+                    continue
+                if importe:
+                    pagos.append((simbolo, int(ano), mes, importe))
+    libro.registrar_lote(pagos)
+    return len(pagos)
+
+
+@medido("dividendos.ingerir")
+def ingerir_dividendos(portfolio, libro=None, proveedor=None, desde=None, libro_operaciones=None, tipos=None):
+    # Descarga los dividendos por acción de los activos con dividendos == 'Sí' y anota en el
+    # libro el importe cobrado (por la cantidad en cartera) en el mes de la fecha ex.
+    # El importe se convierte a la divisa base, como lo tecleado en la rejilla, para que
+    # las sumas del libro no mezclen divisas; se usa el tipo de cambio actual ("tipos",
+    # {divisa: factor}, o el de services/divisas.py). Sin tipo para su divisa, un símbolo
+    # no se anota y se vuelve a pedir en la próxima descarga.
+    # Cada símbolo se pide desde el día siguiente a su último pago descargado; sin pagos
+    # previos, desde "desde" (por defecto el 1 de enero del año en curso).
+    # La cantidad sale del libro de operaciones en la fecha ex cuando lo cubre, y si no,
+    # de la cantidad actual.
+    from services.divisas import DIVISA_BASE, tipos_cambio
+    from services.market_data import obtener_dividendos
+    from services.operaciones import cantidades_historicas, cantidad_en
+
+    libro = libro or obtener_libro()
+    desde = str(desde or datetime.date(datetime.date.today().year, 1, 1))
+    activos = {asset.simbolo: asset for asset in portfolio.get_all_assets() if asset.dividendos == 'Sí'}
+    ultimas = libro.ultimas_ingestas()
+    desde_por_simbolo = {}
+    for simbolo in activos:
+        ultima = ultimas.get(simbolo)
+        desde_por_simbolo[simbolo] = (
+            (datetime.date.fromisoformat(ultima) + datetime.timedelta(days=1)).isoformat() if ultima else desde)
+
+    descargados = obtener_dividendos(desde_por_simbolo, proveedor)
+    historial = cantidades_historicas(libro_operaciones, list(descargados)) if libro_operaciones else {}
+    if tipos is None:
+        tipos = tipos_cambio({activos[simbolo].divisa for simbolo in descargados})
+
+    pagos = []
+    hasta = {}
+    sin_tipo = []
+    for simbolo, eventos in descargados.items():
+        asset = activos[simbolo]
+        factor = tipos.get(asset.divisa)
+        if factor is None:
+            sin_tipo.append(simbolo)
+            continue
+        for fecha, por_accion in eventos:
+            # Un proveedor puede devolver el último pago conocido aunque sea anterior.
+            if fecha < desde_por_simbolo[simbolo]:
+                continue
+            cantidad = cantidad_en(historial[simbolo], fecha) if simbolo in historial else None
+            if cantidad is None:
+                cantidad = asset.cantidad
+            pagos.append((simbolo, fecha, round(por_accion * cantidad * factor, 2), DIVISA_BASE))
+            hasta[simbolo] = max(fecha, hasta.get(simbolo, fecha))
+    libro.registrar_automaticos(pagos, hasta)
+    contar("dividendos.pagos_descargados", len(pagos))
+    return {
+        'simbolos': len(activos),
+        'sin_respuesta': sorted(set(activos) - set(descargados)),
+        'sin_tipo': sorted(sin_tipo),
+        'pagos': len(pagos),
+    }
+
+
+def formatear_importe(importe):
+    return "" if not importe else format(importe, ".10g")
+
+
+def abrir_libro(ruta=DIVIDENDOS_DB, ruta_json=DIVIDENDOS_JSON):
+    # Hasta que el libro tenga la marca de migrado se importa el JSON antiguo si existe;
+    # si la importación falla, se reintenta la próxima vez que se abra.
+    libro = LibroDividendos(ruta)
+    if not libro.migrado():
+        if ruta_json and os.path.exists(ruta_json):
+            try:
+                migrar_desde_json(ruta_json, libro)
+            except Exception:
+                libro.cerrar()
+                raise
+        libro.marcar_migrado()
+    return libro
+
+
+_libro_por_defecto = None
+
+
+def obtener_libro():
+    global _libro_por_defecto
+    if _libro_por_defecto is None:
+        _libro_por_defecto = abrir_libro()
+    return _libro_por_defecto
@@ -0,0 +1,68 @@
+from services.market_data import CacheCotizaciones, ESTADO_MISSING
+
+DIVISA_BASE = "EUR"
+DIVISAS = ['EUR', 'USD', 'CHF', 'GBP', 'GBp']
+
+TIPOS_CAMBIO_ARCHIVO = "data/tipos_cambio.json"
+
+# Los tipos de cambio se mueven más despacio que las cotizaciones que convierten.
+TTL_TIPOS_CAMBIO = 3600
+
+# Cotizaciones en subunidades (peniques en Londres): divisa real y factor.
+SUBUNIDADES = {'GBp': ('GBP', 0.01), 'GBX': ('GBP', 0.01), 'ZAc': ('ZAR', 0.01), 'ILA': ('ILS', 0.01)}
+
+
+def simbolo_par(divisa, base=DIVISA_BASE):
+    # Convención de Yahoo: "USDEUR=X" es el precio de 1 USD en EUR.
+    return f"{divisa}{base}=X"
+
+
+def pares_necesarios(divisas, base=DIVISA_BASE):
+    necesarios = {}
+    for divisa in dict.fromkeys(divisas):
+        real, _ = SUBUNIDADES.get(divisa, (divisa, 1.0))
+        if real != base:
+            necesarios[real] = simbolo_par(real, base)
+    return necesarios
+
+
+def componer_tipos(divisas, precios, base=DIVISA_BASE):
+    # precios: {simbolo_par: precio}. Devuelve {divisa: factor a la base} solo para las
+    # divisas con tipo conocido; la base y sus subunidades no necesitan petición.
+    tipos = {}
+    for divisa in dict.fromkeys(divisas):
+        real, factor = SUBUNIDADES.get(divisa, (divisa, 1.0))
+        if real == base:
+            tipos[divisa] = factor
+            continue
+        precio = precios.get(simbolo_par(real, base))
+        if precio:
+            tipos[divisa] = precio * factor
+    return tipos
+
+
+_cache_por_defecto = None
+
+
+def obtener_cache_divisas():
+    global _cache_por_defecto
+    if _cache_por_defecto is None:
+        _cache_por_defecto = CacheCotizaciones(TIPOS_CAMBIO_ARCHIVO, ttl=TTL_TIPOS_CAMBIO)
+    return _cache_por_defecto
+
+
+def tipos_cambio(divisas, base=DIVISA_BASE, cache=None, solo_cache=False):
+    # Todos los pares en una sola consulta por lotes, a través de una caché con TTL propia.
+    # Con solo_cache no hay red: los últimos tipos guardados, aunque hayan caducado.
+    pares = pares_necesarios(divisas, base)
+    precios = {}
+    if pares:
+        cache = cache or obtener_cache_divisas()
+        simbolos = list(pares.values())
+        cotizaciones = cache.consultar(simbolos) if solo_cache else cache.obtener(simbolos)
+        precios = {par: c.precio for par, c in cotizaciones.items() if c.estado != ESTADO_MISSING}
+    return componer_tipos(divisas, precios, base)
+
+
+def tipos_cartera(portfolio, base=DIVISA_BASE, cache=None, solo_cache=False):
+    return tipos_cambio({asset.divisa for asset in portfolio.get_all_assets()}, base, cache, solo_cache)
@@ -0,0 +1,137 @@
+import os
+
+import numpy as np
+
+from services.market_data import obtener_proveedor, _pedir_lote
+
+HISTORICO_DIR = "data/historico"
+
+# Profundidad de la primera descarga de un símbolo sin histórico local.
+ANOS_INICIALES = 10
+
+# Un fichero .npy por símbolo con los cierres diarios ordenados por fecha. Se leen con
+# mmap_mode='r', así que abrir cientos de símbolos no copia los datos a memoria.
+DTYPE_BARRA = np.dtype([('fecha', 'datetime64[D]'), ('cierre', 'f8')])
+
+
+def _hoy():
+    return np.datetime64('today', 'D')
+
+
+class AlmacenHistorico:
+    def __init__(self, directorio=HISTORICO_DIR):
+        self.directorio = directorio
+        os.makedirs(directorio, exist_ok=True)
+
+    def _archivo(self, simbolo):
+        return os.path.join(self.directorio, simbolo.replace("/", "_").replace(os.sep, "_") + ".npy")
+
+    def cargar(self, simbolo):
+        try:
+            return np.load(self._archivo(simbolo), mmap_mode='r')
+        except FileNotFoundError:
+            return None
+
+    def ultima_fecha(self, simbolo):
+        barras = self.cargar(simbolo)
+        if barras is None or not len(barras):
+            return None
+        return barras['fecha'][-1]
+
+    def anadir(self, simbolo, fechas, cierres):
+        # Solo se añaden las barras posteriores a la última guardada; el fichero se
+        # reescribe con temporal + os.replace para que un lector nunca vea uno a medias.
+        fechas = np.asarray(fechas, dtype='datetime64[D]')
+        cierres = np.asarray(cierres, dtype=np.float64)
+        orden = np.argsort(fechas, kind='stable')
+        fechas, cierres = fechas[orden], cierres[orden]
+        validas = np.isfinite(cierres)
+        fechas, cierres = fechas[validas], cierres[validas]
+
+        existentes = self.cargar(simbolo)
+        if existentes is not None and len(existentes):
+            nuevas = fechas > existentes['fecha'][-1]
+            fechas, cierres = fechas[nuevas], cierres[nuevas]
+        if not len(fechas):
+            return 0
+        nuevas = np.empty(len(fechas), dtype=DTYPE_BARRA)
+        nuevas['fecha'] = fechas
+        nuevas['cierre'] = cierres
+        barras = nuevas if existentes is None else np.concatenate([existentes, nuevas])
+
+        ruta = self._archivo(simbolo)
+        temporal = ruta + ".tmp"
+        with open(temporal, 'wb') as f:
+            np.save(f, barras)
+        del existentes
+        os.replace(temporal, ruta)
+        return len(nuevas)
+
+    def actualizar(self, simbolos, proveedor=None, tamano_lote=50, reintentos=2, espera=0.5):
+        # Los símbolos se agrupan por la fecha desde la que faltan datos, y cada grupo
+        # se pide en lotes: una petición por lote, no una por símbolo.
+        proveedor = proveedor or obtener_proveedor()
+        inicio_defecto = _hoy() - np.timedelta64(365 * ANOS_INICIALES, 'D')
+        grupos = {}
+        for simbolo in dict.fromkeys(simbolos):
+            ultima = self.ultima_fecha(simbolo)
+            desde = inicio_defecto if ultima is None else ultima + np.timedelta64(1, 'D')
+            if desde <= _hoy():
+                grupos.setdefault(desde, []).append(simbolo)
+
+        anadidas = {}
+        for desde, grupo in grupos.items():
+            for i in range(0, len(grupo), tamano_lote):
+                lote = grupo[i:i + tamano_lote]
+                datos = _pedir_historico(proveedor, lote, desde, reintentos, espera)
+                for simbolo, (fechas, cierres) in datos.items():
+                    anadidas[simbolo] = self.anadir(simbolo, fechas, cierres)
+        return anadidas
+
+    def matriz(self, simbolos, desde=None, hasta=None):
+        # Alinea los cierres de varios símbolos sobre la unión de fechas:
+        # devuelve (fechas[T], cierres[T, N]). Los huecos se rellenan con el último cierre
+        # conocido; antes de la primera barra de un símbolo queda NaN.
+        series = [self.cargar(simbolo) for simbolo in simbolos]
+        todas = [s['fecha'] for s in series if s is not None and len(s)]
+        if not todas:
+            return np.empty(0, dtype='datetime64[D]'), np.empty((0, len(simbolos)))
+        fechas = np.unique(np.concatenate(todas))
+        if desde is not None:
+            fechas = fechas[fechas >= np.datetime64(desde, 'D')]
+        if hasta is not None:
+            fechas = fechas[fechas <= np.datetime64(hasta, 'D')]
+
+        cierres = np.full((len(fechas), len(simbolos)), np.nan)
+        for j, serie in enumerate(series):
+            if serie is None or not len(serie):
+                continue
+            # Índice de la última barra con fecha <= cada fecha de la rejilla.
+            posicion = np.searchsorted(serie['fecha'], fechas, side='right') - 1
+            hay_dato = posicion >= 0
+            cierres[hay_dato, j] = serie['cierre'][posicion[hay_dato]]
+        return fechas, cierres
+
+
+def _pedir_historico(proveedor, lote, desde, reintentos, espera):
+    return _pedir_lote(_Historico(proveedor, desde), lote, reintentos, espera)
+
+
+# Adapta obtener_historico a la interfaz de obtener_lote para reutilizar los reintentos.
+class _Historico:
+    def __init__(self, proveedor, desde):
+        self.proveedor = proveedor
+        self.desde = desde
+
+    def obtener_lote(self, simbolos):
+        return self.proveedor.obtener_historico(simbolos, self.desde)
+
+
+_almacen_por_defecto = None
+
+
+def obtener_almacen():
+    global _almacen_por_defecto
+    if _almacen_por_defecto is None:
+        _almacen_por_defecto = AlmacenHistorico()
+    return _almacen_por_defecto
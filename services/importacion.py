@@ -0,0 +1,297 @@
+import csv
+import datetime
+import os
+from itertools import islice
+
+from models.asset import Asset
+from services.market_data import obtener_cotizaciones, ESTADO_MISSING
+
+TAMANO_BLOQUE = 5000
+
+# Filas que se examinan buscando la cabecera (la hoja de carteraAAF.xlsx la tiene en la 8).
+FILAS_BUSQUEDA_CABECERA = 50
+
+# Formatos de exportación: para cada campo, los nombres de columna aceptados (en minúsculas).
+# 'secciones' asigna el tipo de activo según filas separadoras como "ACCIONES" en la hoja.
+FORMATOS = {
+    'aaf': {
+        'broker': None,
+        'tipo_activo': None,
+        'columnas': {
+            'simbolo': ('symbol',),
+            'titulo': ('title',),
+            'cantidad': ('shares',),
+            'precio': ('precio actual',),
+            'dividendos': ('dividend',),
+        },
+        'secciones': {'etfs y pp': 'ETF', 'acciones': 'ACC'},
+    },
+    'degiro': {
+        'broker': 'degiro',
+        'tipo_activo': None,
+        'columnas': {
+            'simbolo': ('símbolo/isin', 'symbol/isin', 'símbolo', 'symbol'),
+            'titulo': ('producto', 'product'),
+            'cantidad': ('cantidad', 'quantity'),
+            'precio': ('precio de cierre', 'closing price', 'precio'),
+            'divisa': ('divisa', 'currency'),
+        },
+    },
+    'ocean': {
+        'broker': 'ocean',
+        'tipo_activo': 'ACC',
+        'columnas': {
+            'simbolo': ('ticker', 'símbolo', 'symbol'),
+            'titulo': ('nombre', 'name', 'valor'),
+            'cantidad': ('títulos', 'cantidad', 'quantity'),
+            'precio': ('precio', 'price', 'cotización'),
+        },
+    },
+    'cxbank': {
+        'broker': 'cxbank',
+        'tipo_activo': 'PP',
+        'columnas': {
+            'simbolo': ('código', 'isin'),
+            'titulo': ('nombre', 'plan'),
+            'cantidad': ('participaciones', 'títulos'),
+            'precio': ('valor liquidativo', 'precio'),
+        },
+    },
+    'bbva': {
+        'broker': 'bbva',
+        'tipo_activo': 'FON',
+        'columnas': {
+            'simbolo': ('ticker', 'isin', 'código'),
+            'titulo': ('nombre', 'fondo', 'valor'),
+            'cantidad': ('participaciones', 'títulos'),
+            'precio': ('valor liquidativo', 'cotización', 'precio'),
+        },
+    },
+    'sant': {
+        'broker': 'sant',
+        'tipo_activo': 'PP',
+        'columnas': {
+            'simbolo': ('isin', 'código'),
+            'titulo': ('nombre', 'fondo', 'plan'),
+            'cantidad': ('participaciones', 'títulos'),
+            'precio': ('valor liquidativo', 'precio'),
+        },
+    },
+}
+
+SI = {'sí', 'si', 'yes', 'y', 's', 'true', '1'}
+
+
+class ErrorImportacion(ValueError):
+    pass
+
+
+def _texto(valor):
+    if valor is None:
+        return ''
+    texto = str(valor).strip()
+    # Celdas con error de Excel (#VALUE!, #N/A...) cuentan como vacías.
+    return '' if texto.startswith('#') else texto
+
+
+def _numero(valor):
+    if isinstance(valor, (int, float)):
+        return float(valor)
+    texto = _texto(valor).replace('€', '').replace(' ', '').replace('\xa0', '')
+    if not texto:
+        return None
+    # Formato español (1.234,56) o inglés (1,234.56): el último separador es el decimal.
+    if ',' in texto and '.' in texto:
+        if texto.rfind(',') > texto.rfind('.'):
+            texto = texto.replace('.', '').replace(',', '.')
+        else:
+            texto = texto.replace(',', '')
+    elif ',' in texto:
+        texto = texto.replace(',', '.')
+    try:
+        return float(texto)
+    except ValueError:
+        return None
+
+
+def _buscar_columnas(cabecera, formato):
+    nombres = [_texto(celda).lower() for celda in cabecera]
+    columnas = {}
+    for campo, alias in formato['columnas'].items():
+        for nombre in alias:
+            if nombre in nombres:
+                columnas[campo] = nombres.index(nombre)
+                break
+    if 'simbolo' not in columnas or 'cantidad' not in columnas:
+        return None
+    return columnas
+
+
+def _leer_csv(ruta):
+    with open(ruta, newline='', encoding='utf-8-sig') as f:
+        muestra = f.read(4096)
+        f.seek(0)
+        try:
+            dialecto = csv.Sniffer().sniff(muestra, delimiters=',;\t')
+        except csv.Error:
+            dialecto = csv.excel
+        yield from csv.reader(f, dialecto)
+
+
+def _leer_xlsx(ruta, hoja=None):
+    from openpyxl import load_workbook
+
+    # read_only recorre la hoja en streaming; data_only devuelve el valor calculado de las fórmulas.
+    libro = load_workbook(ruta, read_only=True, data_only=True)
+    try:
+        hoja = libro[hoja] if hoja else libro.worksheets[0]
+        yield from hoja.iter_rows(values_only=True)
+    finally:
+        libro.close()
+
+
+def leer_filas(ruta, formato='aaf', hoja=None):
+    # Genera dicts {simbolo, titulo, cantidad, precio, dividendos, tipo_activo, divisa, fila} a
+    # partir de la cabecera, sin cargar el fichero completo.
+    formato = FORMATOS[formato] if isinstance(formato, str) else formato
+    extension = os.path.splitext(ruta)[1].lower()
+    filas = _leer_xlsx(ruta, hoja) if extension in ('.xlsx', '.xlsm') else _leer_csv(ruta)
+
+    columnas = None
+    for numero, fila in enumerate(filas, start=1):
+        columnas = _buscar_columnas(fila, formato)
+        if columnas:
+            break
+        if numero >= FILAS_BUSQUEDA_CABECERA:
+            break
+    if not columnas:
+        raise ErrorImportacion(f"No se encontró la cabecera del formato en '{ruta}'.")
+
+    secciones = formato.get('secciones', {})
+    tipo_seccion = None
+    for numero, fila in enumerate(filas, start=numero + 1):
+        def campo(nombre):
+            i = columnas.get(nombre)
+            return fila[i] if i is not None and i < len(fila) else None
+
+        simbolo = _texto(campo('simbolo'))
+        if not simbolo:
+            # Fila separadora de sección: cualquier celda con un nombre de sección conocido.
+            for celda in fila:
+                tipo = secciones.get(_texto(celda).lower())
+                if tipo:
+                    tipo_seccion = tipo
+                    break
+            continue
+        dividendos = _texto(campo('dividendos')).lower()
+        yield {
+            'fila': numero,
+            'simbolo': simbolo,
+            'titulo': _texto(campo('titulo')),
+            'cantidad': _numero(campo('cantidad')),
+            'precio': _numero(campo('precio')),
+            'dividendos': ('Sí' if dividendos in SI else 'No') if dividendos else None,
+            'tipo_activo': tipo_seccion or formato.get('tipo_activo'),
+            'divisa': _texto(campo('divisa')) or None,
+        }
+
+
+def _tipo_fondo(simbolo, titulo, tipo):
+    # En la sección "ETFs y PP" conviven ETF, planes y fondos.
+    if tipo != 'ETF':
+        return tipo
+    palabras = titulo.upper().replace(',', ' ').split()
+    if 'PP' in palabras or 'PPE' in palabras or simbolo.upper().endswith('PPE'):
+        return 'PP'
+    if simbolo.upper().startswith('0P') or 'FI' in palabras:
+        return 'FON'
+    return tipo
+
+
+def importar(portfolio, ruta, formato='aaf', hoja=None, broker=None, tipo_activo=None,
+             proveedor=None, resolver_precios=True, tamano_bloque=TAMANO_BLOQUE,
+             progreso=None, comprobar=None, libro=None):
+    # 1) lee y valida por bloques, descartando símbolos repetidos; 2) resuelve todos los
+    # precios en una sola consulta por lotes; 3) aplica altas y cambios en una transacción.
+    # Con un libro de operaciones, cada cambio de cantidad se anota como compra o venta.
+    nombre_formato = formato
+    formato = FORMATOS[formato] if isinstance(formato, str) else formato
+    broker = broker or formato.get('broker')
+    posiciones = {}
+    descartadas = []
+    leidas = 0
+
+    filas = leer_filas(ruta, formato, hoja)
+    while True:
+        bloque = list(islice(filas, tamano_bloque))
+        if not bloque:
+            break
+        if comprobar:
+            comprobar()
+        for fila in bloque:
+            simbolo = fila['simbolo']
+            if fila['cantidad'] is None or fila['cantidad'] < 0:
+                descartadas.append((fila['fila'], simbolo, "cantidad no válida"))
+            elif simbolo in posiciones:
+                descartadas.append((fila['fila'], simbolo, "símbolo repetido"))
+            elif portfolio.get_asset_by_symbol(simbolo) is None and not broker:
+                descartadas.append((fila['fila'], simbolo, "activo nuevo sin broker"))
+            else:
+                posiciones[simbolo] = fila
+        leidas += len(bloque)
+        if progreso:
+            progreso(leidas, None)
+
+    precios = {}
+    sin_precio = []
+    if resolver_precios and posiciones:
+        for simbolo, cotizacion in obtener_cotizaciones(list(posiciones), proveedor).items():
+            if cotizacion.estado != ESTADO_MISSING:
+                precios[simbolo] = cotizacion.precio
+
+    nuevas = actualizadas = 0
+    operaciones = []
+    hoy = datetime.date.today().isoformat()
+    with portfolio.transaction():
+        for simbolo, fila in posiciones.items():
+            precio = precios.get(simbolo, fila['precio'])
+            existente = portfolio.get_asset_by_symbol(simbolo)
+            if precio is None:
+                precio = existente.precio_actual if existente else 0.0
+                sin_precio.append(simbolo)
+            cantidad = fila['cantidad']
+            if cantidad.is_integer():
+                cantidad = int(cantidad)
+            if existente is None:
+                tipo = _tipo_fondo(simbolo, fila['titulo'], tipo_activo or fila['tipo_activo'] or 'ACC')
+                portfolio.add_asset(Asset(simbolo, fila['titulo'] or simbolo, cantidad, precio,
+                                          cantidad * precio, fila['dividendos'] or 'No', tipo, broker,
+                                          fila['divisa'] or 'EUR'))
+                if cantidad > 0:
+                    operaciones.append((hoy, simbolo, broker, 'compra', cantidad, precio, 0.0, fila['divisa'] or 'EUR'))
+                nuevas += 1
+            else:
+                # Solo se actualiza lo que trae el fichero; el resto de campos se conserva.
+                portfolio.update_asset(simbolo, Asset(
+                    simbolo, fila['titulo'] or existente.titulo, cantidad, precio, cantidad * precio,
+                    fila['dividendos'] or existente.dividendos, existente.tipo_activo, existente.broker,
+                    fila['divisa'] or existente.divisa))
+                diferencia = cantidad - existente.cantidad
+                if diferencia:
+                    operaciones.append((hoy, simbolo, existente.broker, 'compra' if diferencia > 0 else 'venta',
+                                        abs(diferencia), precio, 0.0, fila['divisa'] or existente.divisa))
+                actualizadas += 1
+    if libro is not None and operaciones:
+        libro.registrar_lote(operaciones)
+    if progreso:
+        progreso(leidas, leidas)
+
+    return {
+        'formato': nombre_formato if isinstance(nombre_formato, str) else None,
+        'leidas': leidas,
+        'nuevas': nuevas,
+        'actualizadas': actualizadas,
+        'descartadas': descartadas,
+        'sin_precio': sin_precio,
+        'operaciones': len(operaciones) if libro is not None else 0,
+    }
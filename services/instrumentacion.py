@@ -0,0 +1,157 @@
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# CARTERA_PERFIL activa el informe al salir. Admite una lista separada por comas:
+#   "1" o "tiempos"  -> solo latencias y contadores
+#   "memoria"        -> además, memoria asignada por operación (tracemalloc)
+#   "cprofile"       -> además, perfil completo con cProfile
+# El informe se escribe en CARTERA_PERFIL_SALIDA (prefijo de ruta, por defecto "perfil").
+VARIABLE_ENTORNO = "CARTERA_PERFIL"
+VARIABLE_SALIDA = "CARTERA_PERFIL_SALIDA"
+SALIDA_POR_DEFECTO = "perfil"
+
+# Duraciones recientes que se guardan por operación para los percentiles.
+MUESTRAS = 1000
+
+
+class _Estadistica:
+    __slots__ = ("n", "total", "maximo", "memoria", "muestras")
+
+    def __init__(self):
+        self.n = 0
+        self.total = 0.0
+        self.maximo = 0.0
+        self.memoria = 0
+        self.muestras = deque(maxlen=MUESTRAS)
+
+    def resumen(self):
+        ordenadas = sorted(self.muestras)
+
+        def percentil(p):
+            return ordenadas[min(len(ordenadas) - 1, int(p * len(ordenadas)))] * 1000 if ordenadas else 0.0
+
+        return {
+            'n': self.n,
+            'total_ms': self.total * 1000,
+            'media_ms': self.total / self.n * 1000 if self.n else 0.0,
+            'p50_ms': percentil(0.5),
+            'p95_ms': percentil(0.95),
+            'max_ms': self.maximo * 1000,
+            'memoria_kb': self.memoria / 1024,
+        }
+
+
+_lock = threading.Lock()
+_operaciones = {}
+_contadores = {}
+_memoria = False
+_perfilador = None
+_informe_registrado = False
+
+
+def _registrar(nombre, duracion, memoria):
+    with _lock:
+        estadistica = _operaciones.get(nombre)
+        if estadistica is None:
+            estadistica = _operaciones[nombre] = _Estadistica()
+        estadistica.n += 1
+        estadistica.total += duracion
+        estadistica.maximo = max(estadistica.maximo, duracion)
+        estadistica.memoria += memoria
+        estadistica.muestras.append(duracion)
+
+
+@contextmanager
+def tramo(nombre):
+    if _memoria:
+        import tracemalloc
+        antes = tracemalloc.get_traced_memory()[0]
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        duracion = time.perf_counter() - inicio
+        memoria = tracemalloc.get_traced_memory()[0] - antes if _memoria else 0
+        _registrar(nombre, duracion, memoria)
+
+
+def medido(nombre):
+    def decorador(funcion):
+        @functools.wraps(funcion)
+        def envoltorio(*args, **kwargs):
+            with tramo(nombre):
+                return funcion(*args, **kwargs)
+        return envoltorio
+    return decorador
+
+
+def contar(nombre, n=1):
+    with _lock:
+        _contadores[nombre] = _contadores.get(nombre, 0) + n
+
+
+def informe():
+    with _lock:
+        return {
+            'operaciones': {nombre: e.resumen() for nombre, e in sorted(_operaciones.items())},
+            'contadores': dict(sorted(_contadores.items())),
+        }
+
+
+def reiniciar():
+    with _lock:
+        _operaciones.clear()
+        _contadores.clear()
+
+
+def formatear_informe(datos):
+    lineas = [f"{'operación':<36}{'n':>7}{'media ms':>11}{'p95 ms':>10}{'máx ms':>10}{'total ms':>11}{'mem KB':>10}"]
+    for nombre, e in datos['operaciones'].items():
+        lineas.append(f"{nombre:<36}{e['n']:>7}{e['media_ms']:>11.2f}{e['p95_ms']:>10.2f}"
+                      f"{e['max_ms']:>10.2f}{e['total_ms']:>11.1f}{e['memoria_kb']:>10.1f}")
+    if datos['contadores']:
+        lineas.append("")
+        lineas.extend(f"{nombre:<36}{valor:>7}" for nombre, valor in datos['contadores'].items())
+    return "\n".join(lineas)
+
+
+def volcar_informe(prefijo=None):
+    # Escribe <prefijo>.json y <prefijo>.txt (y <prefijo>.prof si cProfile está activo).
+    prefijo = prefijo or os.environ.get(VARIABLE_SALIDA) or SALIDA_POR_DEFECTO
+    datos = informe()
+    with open(prefijo + ".json", "w", encoding="utf-8") as f:
+        json.dump(datos, f, indent=2, ensure_ascii=False)
+    with open(prefijo + ".txt", "w", encoding="utf-8") as f:
+        f.write(formatear_informe(datos) + "\n")
+    if _perfilador is not None:
+        _perfilador.disable()
+        _perfilador.dump_stats(prefijo + ".prof")
+        _perfilador.enable()
+    return datos
+
+
+def activar(modos):
+    global _memoria, _perfilador, _informe_registrado
+    if "memoria" in modos and not _memoria:
+        import tracemalloc
+        tracemalloc.start()
+        _memoria = True
+    if "cprofile" in modos and _perfilador is None:
+        import cProfile
+        _perfilador = cProfile.Profile()
+        _perfilador.enable()
+    # Se puede activar más de una vez (modos añadidos después); el informe, solo uno.
+    if not _informe_registrado:
+        atexit.register(volcar_informe)
+        _informe_registrado = True
+
+
+_modos = {m.strip() for m in os.environ.get(VARIABLE_ENTORNO, "").lower().split(",") if m.strip()}
+if _modos - {"0"}:
+    activar(_modos)
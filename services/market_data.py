@@ -1,20 +1,479 @@
-import yfinance as yf
+import json
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
 
-def obtener_precios_actuales(simbolos):
-    print("Obteniendo precios de mercado actuales...")
-    tickers = yf.Tickers(" ".join(simbolos))
-    precios = {}
+from services.instrumentacion import medido, tramo, contar
+
+ESTADO_OK = "ok"
+ESTADO_STALE = "stale"
+ESTADO_MISSING = "missing"
+
+# Un cierre con más de 4 días de antigüedad (fin de semana largo incluido) se considera desfasado.
+MAX_ANTIGUEDAD = 4 * 24 * 3600
+
+COTIZACIONES_ARCHIVO = "data/cotizaciones.json"
+
+
+class Cotizacion:
+    __slots__ = ("simbolo", "precio", "estado", "marca_tiempo")
+
+    def __init__(self, simbolo, precio, estado, marca_tiempo=None):
+        self.simbolo = simbolo
+        self.precio = precio
+        self.estado = estado
+        self.marca_tiempo = marca_tiempo
+
+    def __repr__(self):
+        return f"Cotizacion({self.simbolo!r}, {self.precio!r}, {self.estado!r})"
+
+
+# El proveedor nos está limitando (HTTP 429). reintentar_en: segundos sugeridos, si se conocen.
+class LimiteExcedido(ConnectionError):
+    def __init__(self, mensaje="límite de peticiones excedido", reintentar_en=None):
+        super().__init__(mensaje)
+        self.reintentar_en = reintentar_en
+
+
+def _es_limite(error):
+    # yfinance no expone su excepción de límite en todas las versiones; se reconoce por nombre/texto.
+    return type(error).__name__ == "YFRateLimitError" or "rate limit" in str(error).lower()
+
+
+# Interfaz de proveedor: obtener_lote(simbolos) -> {simbolo: (precio, marca_tiempo)}.
+# Los símbolos sin dato simplemente no aparecen en el resultado.
+# obtener_historico(simbolos, desde) -> {simbolo: (fechas datetime64[D], cierres float64)}
+# con los cierres diarios a partir de la fecha "desde" (incluida).
+# obtener_dividendos(simbolos, desde) -> {simbolo: [(fecha ex-dividendo 'AAAA-MM-DD', importe
+# por acción)]} con los pagos a partir de "desde" (incluida), en la divisa de cotización.
+class ProveedorCotizaciones:
+    def obtener_lote(self, simbolos):
+        raise NotImplementedError
+
+    def obtener_historico(self, simbolos, desde):
+        raise NotImplementedError
+
+    def obtener_dividendos(self, simbolos, desde):
+        raise NotImplementedError
+
+
+class ProveedorYahoo(ProveedorCotizaciones):
+    def obtener_lote(self, simbolos):
+        import yfinance as yf
+
+        # Una sola petición de histórico para todo el lote en vez de un .info por símbolo.
+        try:
+            datos = yf.download(list(simbolos), period="5d", interval="1d", group_by="column",
+                                auto_adjust=False, progress=False, threads=False)
+        except Exception as e:
+            if _es_limite(e):
+                raise LimiteExcedido(str(e)) from e
+            raise
+        if datos is None or datos.empty:
+            # download() no propaga los errores por símbolo: se revisan para detectar un 429.
+            errores = getattr(getattr(yf, "shared", None), "_ERRORS", None) or {}
+            if any(_es_limite(error) for error in errores.values()):
+                raise LimiteExcedido()
+            return {}
+        cierres = datos["Close"]
+        resultado = {}
+        for simbolo in simbolos:
+            if simbolo not in cierres:
+                continue
+            serie = cierres[simbolo].dropna()
+            if serie.empty:
+                continue
+            resultado[simbolo] = (float(serie.iloc[-1]), serie.index[-1].timestamp())
+        return resultado
+
+    def obtener_historico(self, simbolos, desde):
+        import numpy as np
+        import yfinance as yf
+
+        try:
+            datos = yf.download(list(simbolos), start=str(desde), interval="1d", group_by="column",
+                                auto_adjust=False, progress=False, threads=False)
+        except Exception as e:
+            if _es_limite(e):
+                raise LimiteExcedido(str(e)) from e
+            raise
+        if datos is None or datos.empty:
+            return {}
+        cierres = datos["Close"]
+        resultado = {}
+        for simbolo in simbolos:
+            if simbolo not in cierres:
+                continue
+            serie = cierres[simbolo].dropna()
+            if serie.empty:
+                continue
+            fechas = serie.index.tz_localize(None).values.astype("datetime64[D]")
+            resultado[simbolo] = (fechas, serie.to_numpy(dtype=np.float64))
+        return resultado
+
+    def obtener_dividendos(self, simbolos, desde):
+        import yfinance as yf
+
+        # actions=True añade la columna de dividendos a la descarga: una petición por lote.
+        try:
+            datos = yf.download(list(simbolos), start=str(desde), interval="1d", group_by="column",
+                                actions=True, auto_adjust=False, progress=False, threads=False)
+        except Exception as e:
+            if _es_limite(e):
+                raise LimiteExcedido(str(e)) from e
+            raise
+        if datos is None or datos.empty or "Dividends" not in datos:
+            return {}
+        dividendos = datos["Dividends"]
+        resultado = {}
+        for simbolo in simbolos:
+            if simbolo not in dividendos:
+                continue
+            serie = dividendos[simbolo]
+            serie = serie[serie > 0]
+            resultado[simbolo] = [(fecha.strftime("%Y-%m-%d"), float(importe)) for fecha, importe in serie.items()]
+        return resultado
+
+
+# Proveedor local para pruebas: precios fijos, latencia inyectada y fallos opcionales.
+# historicos: {simbolo: (fechas, cierres)} y dividendos: {simbolo: [(fecha, importe)]},
+# servidos desde la fecha pedida.
+class ProveedorFalso(ProveedorCotizaciones):
+    def __init__(self, precios, latencia=0.0, fallos=0, marca_tiempo=None, historicos=None, dividendos=None):
+        self.precios = dict(precios)
+        self.historicos = dict(historicos or {})
+        self.dividendos = dict(dividendos or {})
+        self.latencia = latencia
+        self.fallos = fallos
+        self.marca_tiempo = marca_tiempo
+        self.peticiones = 0
+
+    def obtener_lote(self, simbolos):
+        self.peticiones += 1
+        if self.latencia:
+            time.sleep(self.latencia)
+        if self.fallos > 0:
+            self.fallos -= 1
+            raise ConnectionError("fallo simulado")
+        marca = self.marca_tiempo if self.marca_tiempo is not None else time.time()
+        return {s: (self.precios[s], marca) for s in simbolos if s in self.precios}
+
+    def obtener_historico(self, simbolos, desde):
+        self.peticiones += 1
+        if self.latencia:
+            time.sleep(self.latencia)
+        resultado = {}
+        for simbolo in simbolos:
+            if simbolo not in self.historicos:
+                continue
+            fechas, cierres = self.historicos[simbolo]
+            mascara = fechas >= desde
+            if mascara.any():
+                resultado[simbolo] = (fechas[mascara], cierres[mascara])
+        return resultado
+
+    def obtener_dividendos(self, simbolos, desde):
+        self.peticiones += 1
+        if self.latencia:
+            time.sleep(self.latencia)
+        desde = str(desde)
+        return {s: [(fecha, importe) for fecha, importe in self.dividendos[s] if fecha >= desde]
+                for s in simbolos if s in self.dividendos}
+
+
+# Proveedor falso que además simula limitación (429) y tiempos de espera agotados,
+# con un generador con semilla para que las pruebas sean reproducibles.
+class ProveedorInestable(ProveedorFalso):
+    def __init__(self, precios, prob_limite=0.0, prob_timeout=0.0, espera_timeout=0.05,
+                 reintentar_en=None, semilla=0, **kwargs):
+        super().__init__(precios, **kwargs)
+        self.prob_limite = prob_limite
+        self.prob_timeout = prob_timeout
+        self.espera_timeout = espera_timeout
+        self.reintentar_en = reintentar_en
+        self._azar = random.Random(semilla)
+        self._lock = threading.Lock()
+
+    def _fallar(self):
+        with self._lock:
+            tirada = self._azar.random()
+        if tirada < self.prob_limite:
+            raise LimiteExcedido(reintentar_en=self.reintentar_en)
+        if tirada < self.prob_limite + self.prob_timeout:
+            time.sleep(self.espera_timeout)
+            raise TimeoutError("timeout simulado")
+
+    def obtener_lote(self, simbolos):
+        self._fallar()
+        return super().obtener_lote(simbolos)
+
+    def obtener_historico(self, simbolos, desde):
+        self._fallar()
+        return super().obtener_historico(simbolos, desde)
+
+    def obtener_dividendos(self, simbolos, desde):
+        self._fallar()
+        return super().obtener_dividendos(simbolos, desde)
+
+
+_proveedor_por_defecto = None
+
+
+def obtener_proveedor():
+    global _proveedor_por_defecto
+    if _proveedor_por_defecto is None:
+        from services.resiliencia import ProveedorResiliente
+
+        _proveedor_por_defecto = ProveedorResiliente(ProveedorYahoo())
+    return _proveedor_por_defecto
+
+
+def _pedir_lote(proveedor, lote, reintentos, espera):
+    from services.resiliencia import CircuitoAbierto
+
+    for intento in range(reintentos + 1):
+        try:
+            with tramo("cotizaciones.lote"):
+                return proveedor.obtener_lote(lote)
+        except CircuitoAbierto:
+            # El proveedor está caído: no tiene sentido reintentar ahora.
+            contar("cotizaciones.lotes_rechazados")
+            return {}
+        except Exception as e:
+            if intento == reintentos:
+                contar("cotizaciones.lotes_fallidos")
+                return {}
+            contar("cotizaciones.reintentos")
+            # Backoff exponencial con jitter completo, para que los lotes no reintenten a la vez.
+            pausa = random.uniform(0, espera * (2 ** intento))
+            if isinstance(e, LimiteExcedido) and e.reintentar_en:
+                pausa = max(pausa, e.reintentar_en)
+            time.sleep(pausa)
+    return {}
+
+
+@medido("cotizaciones.obtener")
+def obtener_cotizaciones(simbolos, proveedor=None, tamano_lote=50, max_hilos=4,
+                         timeout=15.0, reintentos=2, espera=0.5, max_antiguedad=MAX_ANTIGUEDAD):
+    proveedor = proveedor or obtener_proveedor()
+    simbolos = list(dict.fromkeys(s for s in simbolos if s))
+    lotes = [simbolos[i:i + tamano_lote] for i in range(0, len(simbolos), tamano_lote)]
+    crudos = {}
+    if lotes:
+        pool = ThreadPoolExecutor(max_workers=min(max_hilos, len(lotes)))
+        futuros = [pool.submit(_pedir_lote, proveedor, lote, reintentos, espera) for lote in lotes]
+        hechos, _ = wait(futuros, timeout=timeout)
+        # Los lotes que no terminan a tiempo se abandonan y sus símbolos quedan como "missing".
+        pool.shutdown(wait=False, cancel_futures=True)
+        for futuro in hechos:
+            crudos.update(futuro.result())
+
+    ahora = time.time()
+    cotizaciones = {}
     for simbolo in simbolos:
+        dato = crudos.get(simbolo)
+        if dato is None or not dato[0]:
+            cotizaciones[simbolo] = Cotizacion(simbolo, None, ESTADO_MISSING)
+            continue
+        precio, marca = dato
+        estado = ESTADO_STALE if marca is not None and ahora - marca > max_antiguedad else ESTADO_OK
+        cotizaciones[simbolo] = Cotizacion(simbolo, precio, estado, marca)
+    contar("cotizaciones.simbolos", len(simbolos))
+    contar("cotizaciones.sin_precio", sum(1 for c in cotizaciones.values() if c.estado == ESTADO_MISSING))
+    return cotizaciones
+
+
+# Adapta obtener_dividendos a la interfaz de obtener_lote para reutilizar los reintentos.
+class _Dividendos:
+    def __init__(self, proveedor, desde):
+        self.proveedor = proveedor
+        self.desde = desde
+
+    def obtener_lote(self, simbolos):
+        return self.proveedor.obtener_dividendos(simbolos, self.desde)
+
+
+@medido("dividendos.obtener")
+def obtener_dividendos(desde_por_simbolo, proveedor=None, tamano_lote=50, max_hilos=4,
+                       timeout=60.0, reintentos=2, espera=0.5):
+    # desde_por_simbolo: {simbolo: fecha 'AAAA-MM-DD'}. Los símbolos con la misma fecha de
+    # inicio se piden juntos en lotes, y todos los lotes van en una sola pasada concurrente.
+    # Los símbolos cuyo lote falla no aparecen en el resultado.
+    proveedor = proveedor or obtener_proveedor()
+    grupos = {}
+    for simbolo, desde in desde_por_simbolo.items():
+        grupos.setdefault(desde, []).append(simbolo)
+    peticiones = [(desde, grupo[i:i + tamano_lote])
+                  for desde, grupo in grupos.items() for i in range(0, len(grupo), tamano_lote)]
+    resultado = {}
+    if peticiones:
+        pool = ThreadPoolExecutor(max_workers=min(max_hilos, len(peticiones)))
+        futuros = [pool.submit(_pedir_lote, _Dividendos(proveedor, desde), lote, reintentos, espera)
+                   for desde, lote in peticiones]
+        hechos, _ = wait(futuros, timeout=timeout)
+        pool.shutdown(wait=False, cancel_futures=True)
+        for futuro in hechos:
+            resultado.update(futuro.result())
+    contar("dividendos.simbolos", len(desde_por_simbolo))
+    return resultado
+
+
+# Caché de cotizaciones con TTL por símbolo, expulsión LRU y copia en disco.
+# Una entrada caducada se sirve al momento (como "stale") mientras un hilo la refresca.
+class CacheCotizaciones:
+    def __init__(self, archivo=None, ttl=300, ttl_por_simbolo=None, capacidad=2000, proveedor=None):
+        self.archivo = archivo
+        self.ttl = ttl
+        self.ttl_por_simbolo = dict(ttl_por_simbolo or {})
+        self.capacidad = capacidad
+        self.proveedor = proveedor
+        self.aciertos = 0
+        self.fallos = 0
+        self.caducados = 0
+        self._entradas = OrderedDict()
+        self._refrescando = set()
+        self._lock = threading.Lock()
+        # Serializa las escrituras a disco: el refresco en segundo plano y obtener() pueden
+        # guardar a la vez y compartirían el mismo fichero temporal.
+        self._lock_disco = threading.Lock()
+        self._cargar()
+
+    @medido("cotizaciones.cargar_cache")
+    def _cargar(self):
+        if not self.archivo:
+            return
+        try:
+            with open(self.archivo, 'r') as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        for simbolo, (precio, marca, obtenido) in data.items():
+            self._entradas[simbolo] = (precio, marca, obtenido)
+        while len(self._entradas) > self.capacidad:
+            self._entradas.popitem(last=False)
+
+    def guardar(self):
+        if not self.archivo:
+            return
+        with self._lock:
+            data = {simbolo: list(entrada) for simbolo, entrada in self._entradas.items()}
+        temporal = self.archivo + ".tmp"
+        with self._lock_disco:
+            with open(temporal, 'w') as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(temporal, self.archivo)
+
+    def _ttl(self, simbolo):
+        return self.ttl_por_simbolo.get(simbolo, self.ttl)
+
+    def _almacenar(self, cotizaciones):
+        ahora = time.time()
+        with self._lock:
+            for simbolo, cotizacion in cotizaciones.items():
+                if cotizacion.estado == ESTADO_MISSING:
+                    continue
+                self._entradas[simbolo] = (cotizacion.precio, cotizacion.marca_tiempo, ahora)
+                self._entradas.move_to_end(simbolo)
+            while len(self._entradas) > self.capacidad:
+                self._entradas.popitem(last=False)
+
+    def _refrescar(self, simbolos):
         try:
-            ticker_info = tickers.tickers[simbolo].info
-            precio = ticker_info.get('regularMarketPrice')
-            if precio:
-                precios[simbolo] = precio
+            self._almacenar(obtener_cotizaciones(simbolos, self.proveedor))
+            self.guardar()
+        finally:
+            with self._lock:
+                self._refrescando.difference_update(simbolos)
+
+    def obtener(self, simbolos):
+        ahora = time.time()
+        resultado = {}
+        ausentes = []
+        caducados = []
+        with self._lock:
+            for simbolo in dict.fromkeys(simbolos):
+                entrada = self._entradas.get(simbolo)
+                if entrada is None:
+                    self.fallos += 1
+                    ausentes.append(simbolo)
+                    continue
+                self._entradas.move_to_end(simbolo)
+                precio, marca, obtenido = entrada
+                if ahora - obtenido <= self._ttl(simbolo):
+                    self.aciertos += 1
+                    resultado[simbolo] = Cotizacion(simbolo, precio, ESTADO_OK, marca)
+                else:
+                    self.caducados += 1
+                    resultado[simbolo] = Cotizacion(simbolo, precio, ESTADO_STALE, marca)
+                    if simbolo not in self._refrescando:
+                        self._refrescando.add(simbolo)
+                        caducados.append(simbolo)
+
+        if caducados:
+            threading.Thread(target=self._refrescar, args=(caducados,), daemon=True).start()
+        if ausentes:
+            nuevas = obtener_cotizaciones(ausentes, self.proveedor)
+            self._almacenar(nuevas)
+            self.guardar()
+            resultado.update(nuevas)
+        return resultado
+
+    def consultar(self, simbolos):
+        # Solo lo que ya hay en caché, caducado o no, sin ir a la red ni refrescar.
+        ahora = time.time()
+        resultado = {}
+        with self._lock:
+            for simbolo in dict.fromkeys(simbolos):
+                entrada = self._entradas.get(simbolo)
+                if entrada is not None:
+                    precio, marca, obtenido = entrada
+                    estado = ESTADO_OK if ahora - obtenido <= self._ttl(simbolo) else ESTADO_STALE
+                    resultado[simbolo] = Cotizacion(simbolo, precio, estado, marca)
+        return resultado
+
+    def invalidar(self, simbolo=None):
+        with self._lock:
+            if simbolo is None:
+                self._entradas.clear()
             else:
-                print(f"  - Advertencia: No se pudo obtener el precio para '{simbolo}'. Se omitirá.")
-                precios[simbolo] = 0.0
-        except Exception:
-            print(f"  - Advertencia: Símbolo '{simbolo}' no encontrado o error al obtener datos.")
-            precios[simbolo] = 0.0
+                self._entradas.pop(simbolo, None)
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "caducados": self.caducados,
+                "entradas": len(self._entradas),
+            }
+
+
+_cache_por_defecto = None
+
+
+def obtener_cache():
+    global _cache_por_defecto
+    if _cache_por_defecto is None:
+        _cache_por_defecto = CacheCotizaciones(COTIZACIONES_ARCHIVO)
+    return _cache_por_defecto
+
+
+def obtener_precios_actuales(simbolos, proveedor=None, cache=None):
+    print("Obteniendo precios de mercado actuales...")
+    if proveedor is not None:
+        cotizaciones = obtener_cotizaciones(simbolos, proveedor)
+    else:
+        cotizaciones = (cache or obtener_cache()).obtener(simbolos)
+    precios = {}
+    for simbolo, cotizacion in cotizaciones.items():
+        if cotizacion.estado == ESTADO_MISSING:
+            print(f"  - Advertencia: No se pudo obtener el precio para '{simbolo}'. Se omitirá.")
+            continue
+        if cotizacion.estado == ESTADO_STALE:
+            print(f"  - Advertencia: El precio de '{simbolo}' está desfasado.")
+        precios[simbolo] = cotizacion.precio
     print("Precios obtenidos.")
     return precios
@@ -0,0 +1,463 @@
+import json
+import os
+import sqlite3
+import threading
+from collections import deque
+
+from services.instrumentacion import medido, contar
+
+OPERACIONES_DB = "data/operaciones.db"
+
+TIPOS_OPERACION = ('compra', 'venta', 'split', 'comision')
+METODOS = ('fifo', 'medio')
+
+# Operaciones procesadas desde el último punto de control antes de guardar otro.
+PUNTO_CONTROL_CADA = 10000
+
+# Filas leídas de SQLite por bloque al recorrer el libro.
+TAMANO_LECTURA = 10000
+
+# Cantidades por debajo de este valor se consideran cero (restos de coma flotante).
+EPSILON = 1e-9
+
+
+class ErrorOperacion(ValueError):
+    pass
+
+
+def _validar(operacion):
+    fecha, simbolo, broker, tipo, cantidad = operacion[:5]
+    precio = operacion[5] if len(operacion) > 5 else 0.0
+    comision = operacion[6] if len(operacion) > 6 else 0.0
+    divisa = operacion[7] if len(operacion) > 7 else 'EUR'
+    if tipo not in TIPOS_OPERACION:
+        raise ErrorOperacion(f"Tipo de operación desconocido: '{tipo}'.")
+    if not simbolo or not broker:
+        raise ErrorOperacion("La operación necesita símbolo y broker.")
+    cantidad = float(cantidad or 0)
+    if tipo in ('compra', 'venta', 'split') and cantidad <= 0:
+        raise ErrorOperacion(f"Cantidad no válida en {tipo} de '{simbolo}': {cantidad}.")
+    return (str(fecha)[:10], simbolo, broker, tipo, cantidad, float(precio or 0), float(comision or 0), divisa)
+
+
+# Libro de operaciones en SQLite, de solo inserción: una corrección es otra operación,
+# nunca un UPDATE/DELETE. Así el id creciente marca hasta dónde ha llegado cada motor de
+# coste y basta con leer lo nuevo (sin borrados, el rowid ya es creciente y no hace falta
+# AUTOINCREMENT). No hay índice por posición: encarecía la inserción al doble y solo lo
+# usaría la reconstrucción de una posición con operaciones atrasadas.
+# En un split, 'cantidad' es el factor (2 para un 2x1); una 'comision' suelta (custodia,
+# cambio de divisa) se anota como pérdida realizada.
+class LibroOperaciones:
+    def __init__(self, ruta=OPERACIONES_DB):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self._conexion = sqlite3.connect(ruta, check_same_thread=False)
+        with self._conexion:
+            self._conexion.execute("""
+                CREATE TABLE IF NOT EXISTS operaciones (
+                    id INTEGER PRIMARY KEY,
+                    fecha TEXT NOT NULL,
+                    simbolo TEXT NOT NULL,
+                    broker TEXT NOT NULL,
+                    tipo TEXT NOT NULL,
+                    cantidad REAL NOT NULL,
+                    precio REAL NOT NULL DEFAULT 0,
+                    comision REAL NOT NULL DEFAULT 0,
+                    divisa TEXT NOT NULL DEFAULT 'EUR'
+                )
+            """)
+            # Puntos de control del motor de coste: estado serializado hasta un id.
+            self._conexion.execute("""
+                CREATE TABLE IF NOT EXISTS estado_coste (
+                    metodo TEXT PRIMARY KEY,
+                    ultimo_id INTEGER NOT NULL,
+                    datos TEXT NOT NULL
+                )
+            """)
+
+    def cerrar(self):
+        with self._lock:
+            self._conexion.close()
+
+    def vacio(self):
+        with self._lock:
+            return self._conexion.execute("SELECT 1 FROM operaciones LIMIT 1").fetchone() is None
+
+    @medido("operaciones.registrar_lote")
+    def registrar_lote(self, operaciones):
+        # operaciones: iterable de (fecha, simbolo, broker, tipo, cantidad[, precio, comision, divisa]).
+        filas = [_validar(operacion) for operacion in operaciones]
+        with self._lock, self._conexion:
+            self._conexion.executemany(
+                "INSERT INTO operaciones (fecha, simbolo, broker, tipo, cantidad, precio, comision, divisa) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", filas)
+        contar("operaciones.registradas", len(filas))
+        return len(filas)
+
+    def registrar(self, fecha, simbolo, broker, tipo, cantidad, precio=0.0, comision=0.0, divisa='EUR'):
+        self.registrar_lote([(fecha, simbolo, broker, tipo, cantidad, precio, comision, divisa)])
+
+    def ultimo_id(self):
+        with self._lock:
+            return self._conexion.execute("SELECT COALESCE(MAX(id), 0) FROM operaciones").fetchone()[0]
+
+    def _recorrer(self, consulta, parametros):
+        # Lectura por bloques: el lock solo se retiene mientras se lee cada bloque.
+        with self._lock:
+            cursor = self._conexion.execute(consulta, parametros)
+            filas = cursor.fetchmany(TAMANO_LECTURA)
+        while filas:
+            yield from filas
+            with self._lock:
+                filas = cursor.fetchmany(TAMANO_LECTURA)
+
+    def operaciones(self, desde_id=0, simbolo=None, broker=None, hasta_id=None):
+        # (id, fecha, simbolo, broker, tipo, cantidad, precio, comision) en orden de registro,
+        # o en orden de fecha si se pide una posición concreta.
+        consulta = ("SELECT id, fecha, simbolo, broker, tipo, cantidad, precio, comision "
+                    "FROM operaciones WHERE id > ?")
+        parametros = [desde_id]
+        if hasta_id is not None:
+            consulta += " AND id <= ?"
+            parametros.append(hasta_id)
+        if simbolo is not None:
+            consulta += " AND simbolo = ? AND broker = ? ORDER BY fecha, id"
+            parametros += [simbolo, broker]
+        else:
+            consulta += " ORDER BY id"
+        return self._recorrer(consulta, parametros)
+
+    def operaciones_de(self, simbolos):
+        # (fecha, simbolo, tipo, cantidad) de los símbolos dados, en orden de fecha.
+        simbolos = list(simbolos)
+        filas = []
+        for i in range(0, len(simbolos), 500):
+            bloque = simbolos[i:i + 500]
+            consulta = (f"SELECT fecha, simbolo, tipo, cantidad FROM operaciones "
+                        f"WHERE simbolo IN ({', '.join('?' * len(bloque))})")
+            with self._lock:
+                filas.extend(self._conexion.execute(consulta, bloque).fetchall())
+        filas.sort(key=lambda fila: fila[0])
+        return filas
+
+    def leer_estado(self, metodo):
+        with self._lock:
+            fila = self._conexion.execute(
+                "SELECT ultimo_id, datos FROM estado_coste WHERE metodo = ?", (metodo,)).fetchone()
+        return (fila[0], json.loads(fila[1])) if fila else None
+
+    def guardar_estado(self, metodo, ultimo_id, datos):
+        with self._lock, self._conexion:
+            self._conexion.execute(
+                "INSERT INTO estado_coste (metodo, ultimo_id, datos) VALUES (?, ?, ?) "
+                "ON CONFLICT (metodo) DO UPDATE SET ultimo_id = excluded.ultimo_id, datos = excluded.datos",
+                (metodo, ultimo_id, json.dumps(datos)))
+
+
+# Estado de una posición (símbolo, broker): cantidad y coste pendientes, lotes abiertos
+# (solo FIFO, [cantidad, coste unitario] del más antiguo al más reciente) y resultado realizado.
+class _Posicion:
+    __slots__ = ("cantidad", "coste", "lotes", "realizado", "comisiones", "ultima_fecha", "descubierto")
+
+    def __init__(self):
+        self.cantidad = 0.0
+        self.coste = 0.0
+        self.lotes = deque()
+        self.realizado = 0.0
+        self.comisiones = 0.0
+        self.ultima_fecha = ""
+        # Cantidad vendida sin lotes que la cubran (falta historial de compras).
+        self.descubierto = 0.0
+
+    def a_lista(self):
+        return [self.cantidad, self.coste, list(self.lotes), self.realizado, self.comisiones,
+                self.ultima_fecha, self.descubierto]
+
+    @classmethod
+    def de_lista(cls, datos):
+        posicion = cls()
+        (posicion.cantidad, posicion.coste, lotes, posicion.realizado, posicion.comisiones,
+         posicion.ultima_fecha, posicion.descubierto) = datos
+        posicion.lotes = deque(lotes)
+        return posicion
+
+
+# Motor de coste incremental: mantiene los lotes abiertos de cada posición y procesa solo
+# las operaciones con id posterior a la última vista, así que una consulta cuesta lo que
+# las posiciones, no lo que el historial. Si llega una operación con fecha anterior a la
+# última aplicada en su posición, se rehace solo esa posición en orden de fecha.
+class MotorCoste:
+    def __init__(self, libro, metodo='fifo'):
+        if metodo not in METODOS:
+            raise ValueError(f"Método de coste desconocido: '{metodo}'.")
+        self.libro = libro
+        self.metodo = metodo
+        self.posiciones = {}
+        self.ultimo_id = 0
+        self._lock = threading.RLock()
+        self._sin_guardar = 0
+        self._cargar_estado()
+
+    def _cargar_estado(self):
+        estado = self.libro.leer_estado(self.metodo)
+        # El libro solo crece: un punto de control más avanzado que el libro es de otro fichero.
+        if estado and estado[0] <= self.libro.ultimo_id():
+            self.ultimo_id = estado[0]
+            self.posiciones = {tuple(clave.split("\x1f", 1)): _Posicion.de_lista(datos)
+                               for clave, datos in estado[1].items()}
+
+    def guardar(self):
+        with self._lock:
+            datos = {f"{simbolo}\x1f{broker}": posicion.a_lista()
+                     for (simbolo, broker), posicion in self.posiciones.items()}
+            self.libro.guardar_estado(self.metodo, self.ultimo_id, datos)
+            self._sin_guardar = 0
+
+    def _aplicar(self, posicion, tipo, cantidad, precio, comision):
+        if tipo == 'compra':
+            coste = cantidad * precio + comision
+            posicion.cantidad += cantidad
+            posicion.coste += coste
+            posicion.comisiones += comision
+            if self.metodo == 'fifo':
+                posicion.lotes.append([cantidad, coste / cantidad])
+        elif tipo == 'venta':
+            vendida = min(cantidad, posicion.cantidad)
+            if self.metodo == 'fifo':
+                coste = 0.0
+                pendiente = vendida
+                lotes = posicion.lotes
+                while pendiente > EPSILON and lotes:
+                    lote = lotes[0]
+                    tomada = min(pendiente, lote[0])
+                    coste += tomada * lote[1]
+                    pendiente -= tomada
+                    lote[0] -= tomada
+                    if lote[0] <= EPSILON:
+                        lotes.popleft()
+            else:
+                coste = posicion.coste * vendida / posicion.cantidad if posicion.cantidad > EPSILON else 0.0
+            # La parte sin lotes no tiene coste conocido: se deja fuera del resultado y se anota.
+            proporcion = vendida / cantidad
+            posicion.realizado += (cantidad * precio - comision) * proporcion - coste
+            posicion.comisiones += comision
+            posicion.descubierto += cantidad - vendida
+            posicion.cantidad -= vendida
+            posicion.coste -= coste
+            if posicion.cantidad <= EPSILON:
+                posicion.cantidad = posicion.coste = 0.0
+                posicion.lotes.clear()
+        elif tipo == 'split':
+            posicion.cantidad *= cantidad
+            for lote in posicion.lotes:
+                lote[0] *= cantidad
+                lote[1] /= cantidad
+        elif tipo == 'comision':
+            posicion.realizado -= comision
+            posicion.comisiones += comision
+
+    def _rehacer(self, clave):
+        posicion = _Posicion()
+        # Hasta el último id visto: lo posterior se incorporará en el siguiente actualizar().
+        for _, fecha, _, _, tipo, cantidad, precio, comision in self.libro.operaciones(
+                0, *clave, hasta_id=self.ultimo_id):
+            self._aplicar(posicion, tipo, cantidad, precio, comision)
+            posicion.ultima_fecha = fecha
+        self.posiciones[clave] = posicion
+
+    @medido("operaciones.actualizar")
+    def actualizar(self):
+        # Incorpora las operaciones nuevas del libro; devuelve cuántas ha procesado.
+        with self._lock:
+            procesadas = 0
+            atrasadas = set()
+            posiciones = self.posiciones
+            aplicar = self._aplicar
+            id_ = self.ultimo_id
+            for id_, fecha, simbolo, broker, tipo, cantidad, precio, comision in self.libro.operaciones(id_):
+                procesadas += 1
+                clave = (simbolo, broker)
+                posicion = posiciones.get(clave)
+                if posicion is None:
+                    posicion = posiciones[clave] = _Posicion()
+                elif fecha < posicion.ultima_fecha or (atrasadas and clave in atrasadas):
+                    atrasadas.add(clave)
+                    continue
+                aplicar(posicion, tipo, cantidad, precio, comision)
+                posicion.ultima_fecha = fecha
+            self.ultimo_id = id_
+            for clave in atrasadas:
+                self._rehacer(clave)
+            contar("operaciones.procesadas", procesadas)
+            contar("operaciones.posiciones_rehechas", len(atrasadas))
+            self._sin_guardar += procesadas
+            if self._sin_guardar >= PUNTO_CONTROL_CADA:
+                self.guardar()
+            return procesadas
+
+    def cantidades(self):
+        # {(simbolo, broker): cantidad} de todas las posiciones con historial (0 si está cerrada).
+        with self._lock:
+            return {clave: posicion.cantidad for clave, posicion in self.posiciones.items()}
+
+    def lotes(self, simbolo, broker):
+        # Lotes abiertos [(cantidad, coste unitario)]; con coste medio, uno solo.
+        with self._lock:
+            posicion = self.posiciones.get((simbolo, broker))
+            if posicion is None or posicion.cantidad <= EPSILON:
+                return []
+            if self.metodo == 'fifo':
+                return [tuple(lote) for lote in posicion.lotes]
+            return [(posicion.cantidad, posicion.coste / posicion.cantidad)]
+
+    def resultados(self, precios):
+        # precios: {simbolo: precio}. Devuelve {(simbolo, broker): {...}} con coste, valor y
+        # resultados latente y realizado, en la divisa de cada posición.
+        with self._lock:
+            resultado = {}
+            for (simbolo, broker), posicion in self.posiciones.items():
+                precio = precios.get(simbolo)
+                valor = posicion.cantidad * precio if precio is not None else None
+                resultado[(simbolo, broker)] = {
+                    'cantidad': posicion.cantidad,
+                    'coste': posicion.coste,
+                    'valor': valor,
+                    'latente': valor - posicion.coste if valor is not None else None,
+                    'realizado': posicion.realizado,
+                    'comisiones': posicion.comisiones,
+                    'descubierto': posicion.descubierto,
+                }
+            return resultado
+
+
+def cantidades_historicas(libro, simbolos):
+    # {simbolo: ([fechas], [cantidad tras las operaciones de esa fecha])}, sumando brokers.
+    historial = {}
+    cantidades = {}
+    for fecha, simbolo, tipo, cantidad in libro.operaciones_de(simbolos):
+        actual = cantidades.get(simbolo, 0.0)
+        if tipo == 'compra':
+            actual += cantidad
+        elif tipo == 'venta':
+            actual = max(0.0, actual - cantidad)
+        elif tipo == 'split':
+            actual *= cantidad
+        else:
+            continue
+        cantidades[simbolo] = actual
+        fechas, valores = historial.setdefault(simbolo, ([], []))
+        if fechas and fechas[-1] == fecha:
+            valores[-1] = actual
+        else:
+            fechas.append(fecha)
+            valores.append(actual)
+    return historial
+
+
+def cantidad_en(historial, fecha):
+    # Cantidad en cartera antes del día dado (la que cobra un dividendo con esa fecha ex);
+    # None si la fecha es anterior a la primera operación conocida.
+    from bisect import bisect_left
+
+    fechas, valores = historial
+    i = bisect_left(fechas, fecha)
+    return valores[i - 1] if i else None
+
+
+def resultados_cartera(portfolio, motor, tipos=None):
+    # Resultados latente y realizado de toda la cartera en la divisa base; tipos es
+    # {divisa: factor} como en agregados. Las posiciones sin tipo de cambio se omiten.
+    activos = {asset.simbolo: asset for asset in portfolio.get_all_assets()}
+    latente = realizado = 0.0
+    for (simbolo, _), fila in motor.resultados({s: a.precio_actual for s, a in activos.items()}).items():
+        asset = activos.get(simbolo)
+        factor = 1.0 if tipos is None else tipos.get(asset.divisa if asset else 'EUR')
+        if factor is None:
+            continue
+        if fila['latente'] is not None:
+            latente += fila['latente'] * factor
+        realizado += fila['realizado'] * factor
+    return {'latente': latente, 'realizado': realizado}
+
+
+def conciliar(portfolio, motor):
+    # Compara la cantidad de cada activo con la que resulta del libro (sumando brokers).
+    # Devuelve [(simbolo, cantidad_cartera, cantidad_libro)] de las que no coinciden;
+    # cantidad_libro es None si el activo no tiene ninguna operación registrada.
+    del_libro = {}
+    for (simbolo, _), cantidad in motor.cantidades().items():
+        del_libro[simbolo] = del_libro.get(simbolo, 0.0) + cantidad
+    diferencias = []
+    for asset in portfolio.get_all_assets():
+        cantidad = del_libro.pop(asset.simbolo, None)
+        if cantidad is None or abs(asset.cantidad - cantidad) > EPSILON:
+            diferencias.append((asset.simbolo, asset.cantidad, cantidad))
+    diferencias.extend((simbolo, 0, cantidad) for simbolo, cantidad in del_libro.items() if cantidad > EPSILON)
+    return diferencias
+
+
+def sincronizar_cartera(portfolio, motor):
+    # Deja en la cartera las cantidades del libro; los activos que solo están en el libro
+    # se dan de alta con los datos mínimos y los que no tienen historial no se tocan.
+    # Un alta va al broker con más cantidad del símbolo (a igualdad, el primero por nombre).
+    # Devuelve las diferencias corregidas.
+    from models.asset import Asset
+
+    brokers = {}
+    for (simbolo, broker), cantidad in sorted(motor.cantidades().items(), key=lambda x: (x[0][0], -x[1], x[0][1])):
+        brokers.setdefault(simbolo, broker)
+    diferencias = [d for d in conciliar(portfolio, motor) if d[2] is not None]
+    with portfolio.transaction():
+        for simbolo, _, cantidad in diferencias:
+            if cantidad.is_integer():
+                cantidad = int(cantidad)
+            existente = portfolio.get_asset_by_symbol(simbolo)
+            if existente is None:
+                portfolio.add_asset(Asset(simbolo, simbolo, cantidad, 0.0, 0.0, 'No', 'ACC', brokers[simbolo]))
+            else:
+                datos = existente.to_dict()
+                datos.update({'cantidad': cantidad, 'importe_total': cantidad * existente.precio_actual})
+                portfolio.update_asset(simbolo, Asset.from_dict(datos))
+    return diferencias
+
+
+def registrar_saldos_iniciales(portfolio, libro, fecha, motor=None):
+    # Abre en el libro las posiciones de la cartera que aún no tienen historial, como una
+    # compra al precio actual: sin las compras reales, es el único coste disponible.
+    # Sin motor se crea uno FIFO, que parte del último punto de control del libro.
+    if motor is None:
+        motor = MotorCoste(libro)
+    motor.actualizar()
+    con_historial = {simbolo for simbolo, _ in motor.cantidades()}
+    return libro.registrar_lote(
+        (fecha, asset.simbolo, asset.broker, 'compra', asset.cantidad, asset.precio_actual, 0.0, asset.divisa)
+        for asset in portfolio.get_all_assets()
+        if asset.simbolo not in con_historial and asset.cantidad > 0)
+
+
+def abrir_libro_operaciones(portfolio, ruta=OPERACIONES_DB, fecha=None):
+    # La primera vez que se abre el libro se parte de las posiciones actuales de la cartera.
+    import datetime
+
+    nuevo = not os.path.exists(ruta)
+    libro = LibroOperaciones(ruta)
+    if nuevo:
+        registrar_saldos_iniciales(portfolio, libro, fecha or datetime.date.today().isoformat())
+    return libro
+
+
+_libro_por_defecto = None
+_motores = {}
+
+
+def obtener_libro_operaciones(portfolio):
+    global _libro_por_defecto
+    if _libro_por_defecto is None:
+        _libro_por_defecto = abrir_libro_operaciones(portfolio)
+    return _libro_por_defecto
+
+
+def obtener_motor(portfolio, metodo='fifo'):
+    if metodo not in _motores:
+        _motores[metodo] = MotorCoste(obtener_libro_operaciones(portfolio), metodo)
+    return _motores[metodo]
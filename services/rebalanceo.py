@@ -0,0 +1,300 @@
+import json
+import os
+
+import numpy as np
+
+OBJETIVOS_ARCHIVO = "data/objetivos.json"
+# Múltiplo de cada operación si no hay uno por símbolo o por tipo: la cartera guarda
+# cantidades enteras.
+LOTE_POR_DEFECTO = 1
+ITERACIONES_MAXIMAS = 500
+# Error admitido en los importes objetivo por tipo, relativo al total a repartir.
+TOLERANCIA = 1e-9
+# Fracción de lote con la que toda posición operable entra en el reparto: así una
+# posición a cero puede recibir compras sin alterar el peso de las demás.
+SEMILLA_LOTE = 1e-6
+# Factor mínimo de una celda al partir de la solución anterior, para que una celda que
+# quedó a cero pueda volver a crecer.
+AJUSTE_MINIMO = 1e-9
+
+
+def objetivos_vacios():
+    # tipo y broker: pesos (en % o fracción; se normalizan). efectivo: disponible por
+    # broker. lotes: múltiplo mínimo por símbolo o tipo. minimo: importe mínimo por operación.
+    return {'tipo': {}, 'broker': {}, 'efectivo': {}, 'lotes': {}, 'minimo': 0.0}
+
+
+def cargar_objetivos(ruta=OBJETIVOS_ARCHIVO):
+    objetivos = objetivos_vacios()
+    if os.path.exists(ruta):
+        with open(ruta, encoding="utf-8") as f:
+            objetivos.update(json.load(f))
+    return objetivos
+
+
+def guardar_objetivos(objetivos, ruta=OBJETIVOS_ARCHIVO):
+    # Temporal + os.replace, como las instantáneas de la cartera.
+    directorio = os.path.dirname(ruta)
+    if directorio:
+        os.makedirs(directorio, exist_ok=True)
+    temporal = ruta + ".tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump(objetivos, f, indent=4, ensure_ascii=False)
+    os.replace(temporal, ruta)
+
+
+def _acumulado_por_grupo(grupos, prioridad, importes):
+    # Suma acumulada de "importes" dentro de cada grupo, recorriéndolo por prioridad
+    # descendente; devuelta en el orden original.
+    orden = np.lexsort((-prioridad, grupos))
+    ordenados = importes[orden]
+    acumulado = np.cumsum(ordenados)
+    g = grupos[orden]
+    primeros = np.ones(len(g), dtype=bool)
+    primeros[1:] = g[1:] != g[:-1]
+    inicio = np.maximum.accumulate(np.where(primeros, acumulado - ordenados, 0.0))
+    resultado = np.empty(len(orden))
+    resultado[orden] = acumulado - inicio
+    return resultado
+
+
+class Rebalanceo:
+    # Reparto de la cartera hacia pesos objetivo por tipo de activo (y, opcionalmente, por
+    # broker) con lotes enteros y el efectivo de cada broker. La codificación de
+    # posiciones y los factores del reparto se conservan entre llamadas: resolver() con
+    # precios nuevos parte de la solución anterior.
+    def __init__(self, simbolos, cantidades, precios, tipos_activo, brokers, objetivos_tipo=None,
+                 objetivos_broker=None, efectivo=None, lotes=None, minimo=0.0, factores=None):
+        self.simbolos = list(simbolos)
+        self._indice = {simbolo: i for i, simbolo in enumerate(self.simbolos)}
+        self.cantidades = np.asarray(cantidades, dtype=np.float64)
+        self.precios = np.asarray(precios, dtype=np.float64)
+        # Factor de la divisa de cada activo a la base (NaN si no hay tipo de cambio).
+        self.factores = np.ones(len(self.simbolos)) if factores is None else np.asarray(factores, dtype=np.float64)
+        self.tipos_activo = np.asarray(tipos_activo, dtype=object)
+        self.brokers_activo = np.asarray(brokers, dtype=object)
+
+        tipos, self.codigo_tipo = np.unique(self.tipos_activo.astype(str), return_inverse=True)
+        self.tipos = tipos.tolist()
+        brokers_cartera, self.codigo_broker = np.unique(self.brokers_activo.astype(str), return_inverse=True)
+        # Brokers con efectivo u objetivo pero sin posiciones: figuran en el resultado.
+        extra = set(efectivo or {}) | set(objetivos_broker or {})
+        self.brokers = brokers_cartera.tolist() + sorted(extra - set(brokers_cartera.tolist()))
+        self.celda = self.codigo_tipo * len(self.brokers) + self.codigo_broker
+
+        self.fijar_lotes(lotes, minimo)
+        self.efectivo = np.zeros(len(self.brokers))
+        self.objetivos(objetivos_tipo or {}, objetivos_broker or {}, efectivo or {})
+        self.firma = None
+        self._ajuste = None
+
+    def fijar_lotes(self, lotes=None, minimo=0.0):
+        lotes = lotes or {}
+        self.lotes = np.array([float(lotes.get(s, lotes.get(t, LOTE_POR_DEFECTO)))
+                               for s, t in zip(self.simbolos, self.tipos_activo)])
+        if (self.lotes <= 0).any():
+            raise ValueError("Los lotes deben ser positivos.")
+        self.minimo = float(minimo or 0.0)
+
+    def objetivos(self, objetivos_tipo=None, objetivos_broker=None, efectivo=None):
+        # Tipos sin objetivo no se tocan; sin ningún objetivo por tipo se mantienen los
+        # pesos actuales (solo se invierte el efectivo o se reparte entre brokers).
+        if objetivos_tipo is not None:
+            self.objetivos_tipo = {t: float(p) for t, p in objetivos_tipo.items() if p is not None}
+            self.pesos_tipo = np.array([self.objetivos_tipo.get(t, 0.0) for t in self.tipos])
+            self.con_objetivo = np.array([t in self.objetivos_tipo for t in self.tipos], dtype=bool)
+            if not self.objetivos_tipo:
+                self.con_objetivo[:] = True
+        if objetivos_broker is not None:
+            self.objetivos_broker = {b: float(p) for b, p in objetivos_broker.items() if p is not None}
+        if efectivo is not None:
+            for broker in efectivo:
+                if broker not in self.brokers:
+                    raise ValueError(f"Broker desconocido: {broker}")
+            self.efectivo = np.array([float(efectivo.get(b, 0.0)) for b in self.brokers])
+
+    def actualizar_precios(self, precios):
+        # precios: {símbolo: precio} o vector alineado, en la divisa de cada activo.
+        if isinstance(precios, dict):
+            for simbolo, precio in precios.items():
+                i = self._indice.get(simbolo)
+                if i is not None:
+                    self.precios[i] = precio
+        else:
+            self.precios = np.asarray(precios, dtype=np.float64)
+
+    def _repartir(self, celdas, filas, columnas):
+        # Ajuste proporcional iterativo sobre la matriz (tipo x broker): importes lo más
+        # parecidos a los actuales con los totales por broker exactos y los de cada tipo
+        # tan cerca del objetivo como permita dónde está cada tipo. Devuelve el factor de
+        # cada celda; la siguiente llamada parte del último.
+        T, B = celdas.shape
+        ocupadas = celdas > 0
+        x = celdas
+        if self._ajuste is not None and self._ajuste.shape == celdas.shape:
+            x = celdas * np.where(ocupadas, np.maximum(self._ajuste, AJUSTE_MINIMO), 0.0)
+        total = max(float(filas.sum()), 1e-12)
+        anteriores = x.sum(axis=1)
+        for iteraciones in range(1, ITERACIONES_MAXIMAS + 1):
+            suma = x.sum(axis=1)
+            x = x * np.divide(filas, suma, out=np.zeros(T), where=suma > 0)[:, None]
+            suma = x.sum(axis=0)
+            x = x * np.divide(columnas, suma, out=np.zeros(B), where=suma > 0)
+            sumas = x.sum(axis=1)
+            # Sin solución exacta el ajuste no llega a la tolerancia pero sí se estabiliza.
+            if np.abs(sumas - anteriores).sum() / total < TOLERANCIA:
+                break
+            anteriores = sumas
+        self._ajuste = np.divide(x, celdas, out=np.zeros((T, B)), where=ocupadas)
+        return self._ajuste, float(np.abs(sumas - filas).sum() / total), iteraciones
+
+    def resolver(self, precios=None, objetivos_tipo=None, objetivos_broker=None, efectivo=None, detalle=True):
+        # detalle=False omite la lista de operaciones (queda 'cantidades', alineado con los
+        # símbolos): para encadenar escenarios sin construir miles de diccionarios.
+        if precios is not None:
+            self.actualizar_precios(precios)
+        self.objetivos(objetivos_tipo, objetivos_broker, efectivo)
+        T, B = len(self.tipos), len(self.brokers)
+
+        precio = self.precios * self.factores
+        operable = np.isfinite(precio) & (precio > 0)
+        precio = np.where(operable, precio, 0.0)
+        valor = self.cantidades * precio
+        libre = operable & self.con_objetivo[self.codigo_tipo]
+        base = np.where(libre, valor + precio * self.lotes * SEMILLA_LOTE, 0.0)
+        celdas = np.bincount(self.celda, weights=base, minlength=T * B).reshape(T, B)
+        # Los totales salen de los importes reales, sin la semilla.
+        invertido = np.bincount(self.celda, weights=np.where(libre, valor, 0.0), minlength=T * B).reshape(T, B)
+
+        # El efectivo de un broker sin posiciones operables no tiene dónde invertirse.
+        brokers_validos = celdas.sum(axis=0) > 0
+        efectivo = np.where(brokers_validos, self.efectivo, 0.0)
+        disponible = invertido.sum(axis=0) + efectivo
+        total = float(disponible.sum())
+
+        tipos_validos = celdas.sum(axis=1) > 0
+        pesos = self.pesos_tipo * tipos_validos if self.objetivos_tipo else invertido.sum(axis=1)
+        filas = pesos / pesos.sum() * total if pesos.sum() > 0 else np.zeros(T)
+        if self.objetivos_broker:
+            pesos_broker = np.array([self.objetivos_broker.get(b, 0.0) for b in self.brokers]) * brokers_validos
+            columnas = pesos_broker / pesos_broker.sum() * total if pesos_broker.sum() > 0 else disponible
+        else:
+            columnas = disponible
+        ajuste, desviacion, iteraciones = self._repartir(celdas, filas, columnas)
+
+        # Dentro de cada celda, en proporción a la posición actual.
+        objetivo = base * ajuste.ravel()[self.celda]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            continua = np.where(libre, (objetivo - valor) / precio / self.lotes, 0.0)
+        # Compras por defecto y ventas al lote más cercano, sin vender más de lo que hay.
+        operacion = np.where(continua < 0, np.round(continua), np.floor(continua)) * self.lotes
+        operacion = np.maximum(operacion, -self.cantidades)
+        operacion[np.abs(operacion * precio) < self.minimo] = 0.0
+
+        saldo = efectivo + (columnas - disponible) - np.bincount(
+            self.codigo_broker, weights=operacion * precio, minlength=B)
+        coste_lote = self.lotes * precio
+        # Si el redondeo de las ventas deja algún broker en negativo, se quitan lotes de
+        # las compras que menos falta hacen hasta cubrirlo; sin compras (un broker que
+        # transfiere), se vende un lote más de lo que más sobra.
+        while (saldo < -1e-9).any():
+            en_deficit = (saldo < -1e-9)[self.codigo_broker]
+            candidatas = np.flatnonzero((operacion > 0) & en_deficit)
+            if not len(candidatas):
+                candidatas = np.flatnonzero(libre & en_deficit & (self.cantidades + operacion > 0))
+                if not len(candidatas):
+                    break
+            pendiente = continua[candidatas] * self.lotes[candidatas] - operacion[candidatas]
+            acumulado = _acumulado_por_grupo(self.codigo_broker[candidatas], -pendiente * precio[candidatas],
+                                             coste_lote[candidatas])
+            deficit = -saldo[self.codigo_broker[candidatas]]
+            quitar = candidatas[acumulado - coste_lote[candidatas] < deficit]
+            anterior = operacion[quitar]
+            operacion[quitar] = np.maximum(anterior - self.lotes[quitar], -self.cantidades[quitar])
+            saldo += np.bincount(self.codigo_broker[quitar], weights=(anterior - operacion[quitar]) * precio[quitar],
+                                 minlength=B)
+        # Y con lo que sobra, un lote más a las compras que más se quedaron cortas (no a la
+        # venta de una posición completa que no sea múltiplo del lote).
+        pendiente = (continua * self.lotes - operacion) * precio
+        en_lotes = np.round(operacion / self.lotes) * self.lotes == operacion
+        candidatas = np.flatnonzero(libre & en_lotes & (pendiente > 0) & (saldo[self.codigo_broker] > 0)
+                                    & (np.abs(operacion + self.lotes) * precio >= self.minimo))
+        if len(candidatas):
+            acumulado = _acumulado_por_grupo(self.codigo_broker[candidatas], pendiente[candidatas],
+                                             coste_lote[candidatas])
+            anadir = candidatas[acumulado <= saldo[self.codigo_broker[candidatas]] + 1e-9]
+            operacion[anadir] += self.lotes[anadir]
+            saldo -= np.bincount(self.codigo_broker[anadir], weights=coste_lote[anadir], minlength=B)
+        # Lo que haya quedado por debajo del mínimo al quitar lotes.
+        pequenas = (operacion != 0) & (np.abs(operacion * precio) < self.minimo)
+        if pequenas.any():
+            saldo += np.bincount(self.codigo_broker[pequenas], weights=(operacion * precio)[pequenas], minlength=B)
+            operacion[pequenas] = 0.0
+
+        final = valor + operacion * precio
+        return {
+            'cantidades': operacion,
+            'operaciones': self._operaciones(operacion, precio) if detalle else None,
+            'compras': float((operacion * precio)[operacion > 0].sum()),
+            'ventas': float((-operacion * precio)[operacion < 0].sum()),
+            'pesos_actuales': self._pesos(valor, libre, total),
+            'pesos_finales': self._pesos(final, libre, total),
+            'pesos_objetivo': {t: float(f / total) for t, f in zip(self.tipos, filas) if total and f},
+            'efectivo_restante': {b: float(s) for b, s in zip(self.brokers, saldo) if abs(s) > 1e-6},
+            'transferencias': {b: float(t) for b, t in zip(self.brokers, columnas - disponible) if abs(t) > 1e-6},
+            'sin_activos': sorted(set(self.objetivos_tipo) - {t for t, v in zip(self.tipos, tipos_validos) if v}),
+            'sin_precio': [self.simbolos[i] for i in np.flatnonzero(~operable)],
+            'desviacion': desviacion,
+            'iteraciones': iteraciones,
+        }
+
+    def _pesos(self, valores, libre, total):
+        sumas = np.bincount(self.codigo_tipo[libre], weights=valores[libre], minlength=len(self.tipos))
+        return {t: float(s / total) for t, s in zip(self.tipos, sumas) if total and s}
+
+    def _operaciones(self, operacion, precio):
+        indices = np.flatnonzero(operacion)
+        importes = np.abs(operacion[indices] * precio[indices])
+        orden = np.argsort(-importes)
+        indices = indices[orden]
+        cantidades = operacion[indices]
+        enteras = cantidades == np.round(cantidades)
+        return [{
+            'símbolo': self.simbolos[i],
+            'operacion': 'compra' if cantidad > 0 else 'venta',
+            'cantidad': int(abs(cantidad)) if entera else abs(cantidad),
+            'tipo_activo': self.tipos_activo[i],
+            'broker': self.brokers_activo[i],
+            'precio': cotizacion,
+            'importe': importe,
+        } for i, cantidad, entera, cotizacion, importe in zip(
+            indices.tolist(), cantidades.tolist(), enteras.tolist(), self.precios[indices].tolist(),
+            importes[orden].tolist())]
+
+
+def firma_cartera(activos):
+    # Lo que no puede cambiar para reutilizar un Rebalanceo: solo pueden variar los precios.
+    return tuple((a.simbolo, a.cantidad, a.tipo_activo, a.broker, a.divisa) for a in activos)
+
+
+def rebalancear_cartera(portfolio, objetivos, tipos=None, anterior=None):
+    # Devuelve (rebalanceo, resultado). Si "anterior" se creó sobre las mismas posiciones,
+    # se reutiliza con los precios actuales y parte de su última solución. Importes en la
+    # divisa base; los activos sin tipo de cambio quedan en 'sin_precio'.
+    activos = list(portfolio.get_all_assets())
+    firma = firma_cartera(activos)
+    precios = [asset.precio_actual for asset in activos]
+    factores = [1.0 if tipos is None else tipos.get(asset.divisa, np.nan) for asset in activos]
+    brokers = set(objetivos['efectivo']) | set(objetivos['broker'])
+    if anterior is not None and anterior.firma == firma and brokers <= set(anterior.brokers):
+        rebalanceo = anterior
+        rebalanceo.factores = np.asarray(factores, dtype=np.float64)
+        rebalanceo.fijar_lotes(objetivos['lotes'], objetivos['minimo'])
+        resultado = rebalanceo.resolver(precios, objetivos['tipo'], objetivos['broker'], objetivos['efectivo'])
+        return rebalanceo, resultado
+    rebalanceo = Rebalanceo([a.simbolo for a in activos], [a.cantidad for a in activos], precios,
+                            [a.tipo_activo for a in activos], [a.broker for a in activos],
+                            objetivos['tipo'], objetivos['broker'], objetivos['efectivo'],
+                            objetivos['lotes'], objetivos['minimo'], factores)
+    rebalanceo.firma = firma
+    return rebalanceo, rebalanceo.resolver()
@@ -0,0 +1,166 @@
+import bisect
+import threading
+import time
+
+from services.market_data import ProveedorCotizaciones, LimiteExcedido
+
+# Límites superiores (segundos) de las cubetas del histograma de latencias.
+CUBETAS_LATENCIA = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+CERRADO = "cerrado"
+ABIERTO = "abierto"
+SEMIABIERTO = "semiabierto"
+
+
+class CircuitoAbierto(ConnectionError):
+    pass
+
+
+# Cubo de fichas: admite ráfagas de hasta "capacidad" peticiones y, de media, "tasa" por segundo.
+class LimitadorTasa:
+    def __init__(self, tasa=2.0, capacidad=5):
+        self.tasa = tasa
+        self.capacidad = capacidad
+        self._fichas = float(capacidad)
+        self._ultima = time.monotonic()
+        self._pausa_hasta = 0.0
+        self._lock = threading.Lock()
+
+    def _reponer(self, ahora):
+        self._fichas = min(self.capacidad, self._fichas + (ahora - self._ultima) * self.tasa)
+        self._ultima = ahora
+
+    def adquirir(self, timeout=None):
+        # Bloquea hasta obtener una ficha; devuelve False si no llega antes del timeout.
+        limite = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                ahora = time.monotonic()
+                self._reponer(ahora)
+                if ahora >= self._pausa_hasta and self._fichas >= 1:
+                    self._fichas -= 1
+                    return True
+                espera = max(self._pausa_hasta - ahora, (1 - self._fichas) / self.tasa)
+            if limite is not None and time.monotonic() + espera > limite:
+                return False
+            time.sleep(espera)
+
+    def pausar(self, segundos):
+        # Tras un 429 nadie pide nada durante "segundos", y el cubo se vacía.
+        with self._lock:
+            self._pausa_hasta = max(self._pausa_hasta, time.monotonic() + segundos)
+            self._fichas = 0.0
+
+
+# Tras "umbral" fallos seguidos se abre y rechaza las peticiones al momento; pasado
+# "reapertura" deja pasar una de prueba (semiabierto) y se cierra si sale bien.
+class Cortacircuitos:
+    def __init__(self, umbral=5, reapertura=30.0):
+        self.umbral = umbral
+        self.reapertura = reapertura
+        self.estado = CERRADO
+        self._fallos = 0
+        self._abierto_desde = 0.0
+        self._lock = threading.Lock()
+
+    def permitir(self):
+        with self._lock:
+            if self.estado == ABIERTO and time.monotonic() - self._abierto_desde >= self.reapertura:
+                self.estado = SEMIABIERTO
+                return True
+            return self.estado == CERRADO
+
+    def abandonar(self):
+        # La petición de prueba no llegó a hacerse (sin ficha): vuelve a abierto, pero la
+        # siguiente llamada puede probar sin esperar otra reapertura completa.
+        with self._lock:
+            if self.estado == SEMIABIERTO:
+                self.estado = ABIERTO
+                self._abierto_desde = time.monotonic() - self.reapertura
+
+    def exito(self):
+        with self._lock:
+            self._fallos = 0
+            self.estado = CERRADO
+
+    def fallo(self):
+        with self._lock:
+            self._fallos += 1
+            if self.estado == SEMIABIERTO or self._fallos >= self.umbral:
+                self.estado = ABIERTO
+                self._abierto_desde = time.monotonic()
+
+
+class Metricas:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.peticiones = 0
+        self.rechazadas = 0
+        self.errores = {}
+        self.histograma = [0] * len(CUBETAS_LATENCIA)
+        self.latencia_total = 0.0
+
+    def registrar(self, latencia, error=None):
+        with self._lock:
+            self.peticiones += 1
+            self.latencia_total += latencia
+            self.histograma[bisect.bisect_left(CUBETAS_LATENCIA, latencia)] += 1
+            if error is not None:
+                nombre = type(error).__name__
+                self.errores[nombre] = self.errores.get(nombre, 0) + 1
+
+    def rechazo(self):
+        with self._lock:
+            self.rechazadas += 1
+
+    def instantanea(self):
+        with self._lock:
+            return {
+                'peticiones': self.peticiones,
+                'rechazadas': self.rechazadas,
+                'errores': dict(self.errores),
+                'latencia_media': self.latencia_total / self.peticiones if self.peticiones else 0.0,
+                'histograma': {f"<={cubeta:g}s": n for cubeta, n in zip(CUBETAS_LATENCIA, self.histograma)},
+            }
+
+
+# Envuelve cualquier proveedor con limitador de tasa, cortacircuitos y métricas.
+# Los reintentos con backoff siguen en _pedir_lote; aquí cada llamada es un solo intento.
+class ProveedorResiliente(ProveedorCotizaciones):
+    def __init__(self, proveedor, limitador=None, cortacircuitos=None, pausa_limite=10.0, timeout_ficha=30.0):
+        self.proveedor = proveedor
+        self.limitador = limitador or LimitadorTasa()
+        self.cortacircuitos = cortacircuitos or Cortacircuitos()
+        self.metricas = Metricas()
+        self.pausa_limite = pausa_limite
+        self.timeout_ficha = timeout_ficha
+
+    def _llamar(self, funcion, *args):
+        if not self.cortacircuitos.permitir():
+            self.metricas.rechazo()
+            raise CircuitoAbierto("proveedor de cotizaciones no disponible")
+        if not self.limitador.adquirir(self.timeout_ficha):
+            self.cortacircuitos.abandonar()
+            self.metricas.rechazo()
+            raise TimeoutError("sin cupo de peticiones")
+        inicio = time.perf_counter()
+        try:
+            resultado = funcion(*args)
+        except Exception as e:
+            self.metricas.registrar(time.perf_counter() - inicio, e)
+            self.cortacircuitos.fallo()
+            if isinstance(e, LimiteExcedido):
+                self.limitador.pausar(e.reintentar_en or self.pausa_limite)
+            raise
+        self.metricas.registrar(time.perf_counter() - inicio)
+        self.cortacircuitos.exito()
+        return resultado
+
+    def obtener_lote(self, simbolos):
+        return self._llamar(self.proveedor.obtener_lote, simbolos)
+
+    def obtener_historico(self, simbolos, desde):
+        return self._llamar(self.proveedor.obtener_historico, simbolos, desde)
+
+    def obtener_dividendos(self, simbolos, desde):
+        return self._llamar(self.proveedor.obtener_dividendos, simbolos, desde)
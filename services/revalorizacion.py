@@ -0,0 +1,86 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from models.portfolio import Portfolio
+from services.market_data import obtener_cotizaciones, ESTADO_MISSING
+from services.divisas import pares_necesarios, componer_tipos
+
+# Precios y tipos de cambio compartidos por todas las valoraciones de un proceso trabajador;
+# se reciben una sola vez en el inicializador en lugar de serializarlos con cada cartera.
+_precios = {}
+_tipos = {}
+
+
+def _iniciar_trabajador(precios, tipos):
+    global _precios, _tipos
+    _precios = precios
+    _tipos = tipos
+
+
+def _leer_simbolos(ruta):
+    activos = Portfolio(ruta).get_all_assets()
+    return [asset.simbolo for asset in activos], {asset.divisa for asset in activos}
+
+
+def _revalorizar(ruta):
+    from services.agregados import agregados_cartera
+
+    portfolio = Portfolio(ruta)
+    simbolos = [asset.simbolo for asset in portfolio.get_all_assets()]
+    portfolio.update_prices({s: _precios[s] for s in simbolos if s in _precios})
+    # compact() escribe la instantánea con fichero temporal + os.replace y vacía el diario.
+    portfolio.compact()
+    return {
+        'cartera': ruta,
+        'posiciones': len(simbolos),
+        'sin_precio': [s for s in simbolos if s not in _precios],
+        'agregados': agregados_cartera(portfolio, _tipos),
+    }
+
+
+def _tamano_bloque(n, procesos):
+    return max(1, n // (procesos * 4))
+
+
+def revalorizar_carteras(rutas, proveedor=None, procesos=None, tamano_lote=50):
+    # 1) símbolos y divisas de cada cartera, 2) una sola consulta de cotizaciones para la
+    # unión sin duplicados más los pares de divisas, 3) valoración y guardado de cada
+    # cartera en el pool de procesos.
+    # El número de peticiones depende de los símbolos distintos, no del número de carteras.
+    rutas = list(rutas)
+    procesos = procesos or os.cpu_count() or 1
+    if not rutas:
+        return {'simbolos': 0, 'sin_precio': [], 'tipos': {}, 'carteras': []}
+
+    with ProcessPoolExecutor(max_workers=procesos) as pool:
+        listas = list(pool.map(_leer_simbolos, rutas, chunksize=_tamano_bloque(len(rutas), procesos)))
+    simbolos = list(dict.fromkeys(s for lista, _ in listas for s in lista))
+    divisas = set().union(*(divisas for _, divisas in listas))
+    pares = list(pares_necesarios(divisas).values())
+
+    cotizaciones = obtener_cotizaciones(simbolos + pares, proveedor, tamano_lote=tamano_lote)
+    precios = {s: c.precio for s, c in cotizaciones.items() if c.estado != ESTADO_MISSING}
+    tipos = componer_tipos(divisas, precios)
+
+    with ProcessPoolExecutor(max_workers=procesos, initializer=_iniciar_trabajador,
+                             initargs=(precios, tipos)) as pool:
+        carteras = list(pool.map(_revalorizar, rutas, chunksize=_tamano_bloque(len(rutas), procesos)))
+    return {
+        'simbolos': len(simbolos),
+        'sin_precio': [s for s in simbolos if s not in precios],
+        'tipos': tipos,
+        'carteras': carteras,
+    }
+
+
+def escribir_resumen(resultado, ruta):
+    # Mismo patrón que las instantáneas de la cartera: temporal + os.replace.
+    from services.valoracion import claves_a_texto
+
+    temporal = ruta + ".tmp"
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump(claves_a_texto(resultado), f, indent=4, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporal, ruta)
@@ -0,0 +1,196 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Sesiones de histórico con las que se estima el modelo (unos dos años).
+VENTANA_COVARIANZA = 504
+# Peso de la diagonal en la covarianza contraída: con cientos de activos y pocos años de
+# datos la muestral está mal condicionada; contraerla la hace definida positiva.
+CONTRACCION = 0.1
+NIVELES = (0.95, 0.99)
+CAMINOS = 100_000
+# Caminos por tarea del pool; cada tarea tiene su propia semilla derivada.
+CAMINOS_BLOQUE = 50_000
+# Memoria aproximada por lote de simulación dentro de un trabajador.
+MEMORIA_LOTE = 64 * 1024 * 1024
+
+
+def modelo_covarianza(cierres, ventana=VENTANA_COVARIANZA, contraccion=CONTRACCION):
+    # cierres[T, N] alineados (NaN antes de la primera cotización). Devuelve la media y la
+    # covarianza de las rentabilidades logarítmicas diarias y la máscara de símbolos con
+    # histórico suficiente; los demás quedan fuera de la simulación.
+    cierres = np.asarray(cierres, dtype=np.float64)[-(ventana + 1):]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r = np.diff(np.log(cierres), axis=0)
+    validas = np.isfinite(r)
+    con_historico = validas.sum(axis=0) >= max(2, len(r) // 2)
+    r = r[:, con_historico]
+    validas = validas[:, con_historico]
+    # Los huecos (antes de empezar a cotizar) cuentan como rentabilidad igual a la media.
+    media = np.nanmean(r, axis=0) if r.size else np.zeros(r.shape[1])
+    centradas = np.where(validas, r - media, 0.0)
+    observaciones = np.maximum(validas.astype(np.float64).T @ validas - 1, 1)
+    covarianza = (centradas.T @ centradas) / observaciones
+    covarianza = (1 - contraccion) * covarianza + contraccion * np.diag(np.diag(covarianza))
+    return media, covarianza, con_historico
+
+
+def _factor(covarianza):
+    # Cholesky con un pequeño refuerzo de la diagonal si hace falta.
+    refuerzo = 0.0
+    escala = float(np.mean(np.diag(covarianza))) if len(covarianza) else 0.0
+    for _ in range(6):
+        try:
+            return np.linalg.cholesky(covarianza + refuerzo * np.eye(len(covarianza)))
+        except np.linalg.LinAlgError:
+            refuerzo = max(refuerzo * 10, escala * 1e-8)
+    raise ValueError("La covarianza no es definida positiva.")
+
+
+# Parámetros compartidos por las tareas de un proceso trabajador (ver _iniciar_trabajador).
+_modelo = {}
+
+
+def _iniciar_trabajador(deriva, factor, valores, semilla):
+    global _modelo
+    _modelo = {'deriva': deriva, 'factor': factor, 'valores': valores, 'semilla': semilla}
+
+
+def _peores(pnl, filas, k):
+    # Las k filas con menor resultado (sin ordenar).
+    if len(pnl) <= k:
+        return pnl, filas
+    indices = np.argpartition(pnl, k - 1)[:k]
+    return pnl[indices], filas[indices]
+
+
+def _simular_bloque(indice, caminos, cola):
+    # Simula un bloque de caminos en lotes acotados en memoria. Devuelve el resultado de
+    # cada camino y, de los "cola" peores, el resultado por activo (para las contribuciones).
+    deriva = _modelo['deriva']
+    factor = _modelo['factor']
+    valores = _modelo['valores']
+    n = len(valores)
+    # La semilla depende solo del índice del bloque: mismo resultado con cualquier nº de procesos.
+    rng = np.random.default_rng(np.random.SeedSequence(_modelo['semilla'], spawn_key=(indice,)))
+    filas = max(1000, min(caminos, MEMORIA_LOTE // (8 * max(n, 1))))
+    pnl = np.empty(caminos)
+    cola_pnl = np.empty(0)
+    cola_activos = np.empty((0, n), dtype=np.float32)
+    for inicio in range(0, caminos, filas):
+        m = min(filas, caminos - inicio)
+        r = rng.standard_normal((m, n), dtype=np.float32) @ factor.T
+        r += deriva
+        np.expm1(r, out=r)
+        r *= valores
+        lote = r.sum(axis=1, dtype=np.float64)
+        pnl[inicio:inicio + m] = lote
+        # Primero la cola del lote, para no copiar el lote entero al combinarla.
+        lote, r = _peores(lote, r, cola)
+        cola_pnl, cola_activos = _peores(np.concatenate([cola_pnl, lote]),
+                                         np.concatenate([cola_activos, r]), cola)
+    return pnl, cola_pnl, cola_activos
+
+
+def simular(valores, media, covarianza, caminos=CAMINOS, horizonte=1, niveles=NIVELES, semilla=0,
+            procesos=None, caminos_bloque=CAMINOS_BLOQUE):
+    # Monte Carlo de rentabilidades logarítmicas normales multivariantes a "horizonte"
+    # sesiones sobre los valores actuales. VaR y CVaR se dan como pérdidas positivas;
+    # las contribuciones (descomposición de Euler del CVaR al nivel más alto) suman el CVaR.
+    # En memoria solo quedan el resultado de cada camino y las filas de la cola.
+    valores = np.asarray(valores, dtype=np.float64)
+    n = len(valores)
+    deriva = (np.asarray(media, dtype=np.float64) * horizonte).astype(np.float32)
+    factor = (_factor(np.asarray(covarianza, dtype=np.float64)) * np.sqrt(horizonte)).astype(np.float32)
+    nivel = max(niveles)
+    cola = max(1, int(np.ceil((1 - nivel) * caminos)))
+    bloques = [min(caminos_bloque, caminos - i) for i in range(0, caminos, caminos_bloque)]
+    argumentos = (range(len(bloques)), bloques, [cola] * len(bloques))
+    iniciales = (deriva, factor, valores.astype(np.float32), semilla)
+
+    procesos = min(procesos or os.cpu_count() or 1, len(bloques))
+    if procesos > 1:
+        # spawn: el pool puede lanzarse desde un hilo de la GUI, donde fork no es seguro.
+        pool = ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=_iniciar_trabajador, initargs=iniciales)
+        resultados = pool.map(_simular_bloque, *argumentos)
+    else:
+        pool = None
+        _iniciar_trabajador(*iniciales)
+        resultados = map(_simular_bloque, *argumentos)
+
+    try:
+        pnl = []
+        cola_pnl = np.empty(0)
+        cola_activos = np.empty((0, n), dtype=np.float32)
+        for bloque_pnl, bloque_cola, bloque_activos in resultados:
+            pnl.append(bloque_pnl)
+            cola_pnl, cola_activos = _peores(np.concatenate([cola_pnl, bloque_cola]),
+                                             np.concatenate([cola_activos, bloque_activos]), cola)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    pnl = np.concatenate(pnl)
+
+    var = {}
+    cvar = {}
+    for nivel_i in niveles:
+        k = max(1, int(np.ceil((1 - nivel_i) * caminos)))
+        peores = np.partition(pnl, k - 1)[:k]
+        var[nivel_i] = float(-peores.max())
+        cvar[nivel_i] = float(-peores.mean())
+    contribuciones = -cola_activos.astype(np.float64).mean(axis=0)
+    # Reescaladas para que sumen exactamente el CVaR (la suma por activo se hizo en float32).
+    if contribuciones.sum():
+        contribuciones *= cvar[nivel] / contribuciones.sum()
+    return {
+        'caminos': caminos,
+        'horizonte': horizonte,
+        'nivel_contribuciones': nivel,
+        'var': var,
+        'cvar': cvar,
+        'media': float(pnl.mean()),
+        'desviacion': float(pnl.std()),
+        'contribuciones': contribuciones,
+    }
+
+
+def riesgo_cartera(portfolio, almacen=None, tipos=None, caminos=CAMINOS, horizonte=1, niveles=NIVELES,
+                   semilla=0, procesos=None):
+    # Riesgo de las posiciones actuales sobre el histórico local (services/historico.py),
+    # en la divisa base. Quedan fuera los activos sin histórico o sin tipo de cambio.
+    from services.historico import obtener_almacen
+
+    almacen = almacen or obtener_almacen()
+    activos = portfolio.get_all_assets()
+    _, cierres = almacen.matriz([asset.simbolo for asset in activos])
+    if not len(cierres):
+        cierres = np.full((0, len(activos)), np.nan)
+    media, covarianza, con_historico = modelo_covarianza(cierres)
+    factores = np.array([1.0 if tipos is None else tipos.get(asset.divisa, np.nan) for asset in activos])
+    valores = np.array([asset.importe_total for asset in activos], dtype=np.float64) * factores
+    incluidos = con_historico & np.isfinite(valores)
+    seleccion = incluidos[con_historico]
+
+    simulados = [asset for asset, incluido in zip(activos, incluidos) if incluido]
+    resultado = {
+        'sin_historico': [asset.simbolo for asset, ok in zip(activos, con_historico) if not ok],
+        'sin_tipo': [asset.simbolo for asset, valor in zip(activos, valores) if not np.isfinite(valor)],
+        'valor': float(valores[incluidos].sum()),
+    }
+    if not simulados:
+        return dict(resultado, var={}, cvar={}, por_activo={}, por_tipo={}, por_broker={})
+    simulacion = simular(valores[incluidos], media[seleccion], covarianza[np.ix_(seleccion, seleccion)],
+                         caminos, horizonte, niveles, semilla, procesos)
+    contribuciones = simulacion.pop('contribuciones')
+    resultado.update(simulacion)
+    resultado['por_activo'] = {asset.simbolo: float(c) for asset, c in zip(simulados, contribuciones)}
+    for nombre, atributo in (('por_tipo', 'tipo_activo'), ('por_broker', 'broker')):
+        grupos = {}
+        for asset, c in zip(simulados, contribuciones):
+            clave = getattr(asset, atributo)
+            grupos[clave] = grupos.get(clave, 0.0) + float(c)
+        resultado[nombre] = grupos
+    return resultado
@@ -0,0 +1,150 @@
+import random
+import threading
+import time
+
+from services.market_data import obtener_cotizaciones, obtener_proveedor, ESTADO_MISSING
+from services.instrumentacion import contar
+
+
+# Interfaz de fuente: iniciar(simbolos, al_recibir) arranca un hilo que llama a
+# al_recibir({simbolo: precio}) con cada lote de ticks; detener() lo para.
+class FuenteCotizaciones:
+    def iniciar(self, simbolos, al_recibir):
+        raise NotImplementedError
+
+    def detener(self):
+        raise NotImplementedError
+
+
+class _FuenteHilo(FuenteCotizaciones):
+    def __init__(self):
+        self._parar = threading.Event()
+        self._hilo = None
+
+    def iniciar(self, simbolos, al_recibir):
+        self._parar.clear()
+        self._hilo = threading.Thread(target=self._bucle, args=(list(simbolos), al_recibir),
+                                      daemon=True, name=type(self).__name__)
+        self._hilo.start()
+
+    def detener(self):
+        # No se espera al hilo: si hay una petición en curso, terminará por su cuenta
+        # (es daemon) y lo que entregue después ya no se aplica.
+        self._parar.set()
+        self._hilo = None
+
+
+# Sondeo periódico del proveedor de cotizaciones: solo se emiten los precios que cambian.
+class FuenteSondeo(_FuenteHilo):
+    def __init__(self, proveedor=None, intervalo=30.0, tamano_lote=50):
+        super().__init__()
+        self.proveedor = proveedor
+        self.intervalo = intervalo
+        self.tamano_lote = tamano_lote
+
+    def _bucle(self, simbolos, al_recibir):
+        proveedor = self.proveedor or obtener_proveedor()
+        ultimos = {}
+        while not self._parar.is_set():
+            cotizaciones = obtener_cotizaciones(simbolos, proveedor, tamano_lote=self.tamano_lote)
+            cambios = {s: c.precio for s, c in cotizaciones.items()
+                       if c.estado != ESTADO_MISSING and ultimos.get(s) != c.precio}
+            if cambios:
+                ultimos.update(cambios)
+                al_recibir(cambios)
+            self._parar.wait(self.intervalo)
+
+
+# Fuente local para pruebas y benchmarks: paseo aleatorio sobre los precios iniciales,
+# a un ritmo dado de ticks por segundo repartido en ráfagas cada "periodo" segundos.
+class FuenteSimulada(_FuenteHilo):
+    def __init__(self, precios, ticks_por_segundo=1000, volatilidad=0.001, periodo=0.01, semilla=0):
+        super().__init__()
+        self.precios = dict(precios)
+        self.ticks_por_segundo = ticks_por_segundo
+        self.volatilidad = volatilidad
+        self.periodo = periodo
+        self._azar = random.Random(semilla)
+        self.emitidos = 0
+
+    def _bucle(self, simbolos, al_recibir):
+        simbolos = [s for s in simbolos if s in self.precios]
+        if not simbolos:
+            return
+        por_rafaga = max(1, int(self.ticks_por_segundo * self.periodo))
+        siguiente = time.perf_counter()
+        while not self._parar.is_set():
+            rafaga = {}
+            for simbolo in self._azar.choices(simbolos, k=por_rafaga):
+                precio = self.precios[simbolo] * (1 + self._azar.gauss(0, self.volatilidad))
+                self.precios[simbolo] = rafaga[simbolo] = round(precio, 4)
+            self.emitidos += por_rafaga
+            al_recibir(rafaga)
+            siguiente += self.periodo
+            self._parar.wait(max(0.0, siguiente - time.perf_counter()))
+
+
+# Recibe ticks desde el hilo de la fuente y se queda solo con el último precio de cada
+# símbolo; el hilo de la GUI los recoge a su ritmo con aplicar(), así que el coste por
+# fotograma depende de los símbolos que han cambiado, no de los ticks recibidos.
+class MotorTiempoReal:
+    def __init__(self, portfolio, fuente):
+        self.portfolio = portfolio
+        self.fuente = fuente
+        self.recibidos = 0
+        self.aplicados = 0
+        self._pendientes = {}
+        self._lock = threading.Lock()
+        self._ultimos = {}
+        self.activo = False
+
+    def _recibir(self, ticks):
+        with self._lock:
+            self._pendientes.update(ticks)
+            self.recibidos += len(ticks)
+
+    def iniciar(self):
+        self.activo = True
+        self.fuente.iniciar([asset.simbolo for asset in self.portfolio.get_all_assets()], self._recibir)
+
+    def drenar(self):
+        with self._lock:
+            pendientes, self._pendientes = self._pendientes, {}
+        return pendientes
+
+    def aplicar(self, totales=None):
+        # Aplica los precios pendientes en memoria y, si se pasan, ajusta los totales con
+        # el delta de cada fila. Devuelve [(fila_anterior, fila_nueva)] para la vista.
+        from services.agregados import ajustar_importe
+
+        pendientes = self.drenar()
+        if not pendientes:
+            return []
+        cambios = []
+        anteriores = {}
+        for simbolo in pendientes:
+            asset = self.portfolio.get_asset_by_symbol(simbolo)
+            if asset is not None and asset.precio_actual != pendientes[simbolo]:
+                anteriores[simbolo] = asset.to_dict()
+        aplicados = self.portfolio.update_prices({s: pendientes[s] for s in anteriores}, persist=False)
+        for simbolo in aplicados:
+            anterior = anteriores[simbolo]
+            nuevo = self.portfolio.get_asset_by_symbol(simbolo).to_dict()
+            if totales is not None:
+                # Un tick solo cambia el precio: basta con sumar la diferencia de importe.
+                ajustar_importe(totales, nuevo, nuevo['importe_total'] - anterior['importe_total'])
+            cambios.append((anterior, nuevo))
+        self._ultimos.update(aplicados)
+        self.aplicados += len(aplicados)
+        contar("tiempo_real.ticks_aplicados", len(aplicados))
+        return cambios
+
+    def detener(self, totales=None):
+        # Los precios en vivo solo se persisten al salir del modo: una entrada de diario.
+        self.fuente.detener()
+        self.activo = False
+        cambios = self.aplicar(totales)
+        if self._ultimos:
+            self.portfolio.update_prices(self._ultimos)
+            self._ultimos = {}
+        return cambios
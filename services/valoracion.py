@@ -0,0 +1,143 @@
+import csv
+import json
+
+from services.market_data import obtener_cotizaciones, ESTADO_MISSING
+
+ORDEN_TIPOS = ['ACC', 'ETF', 'PP', 'FON']
+
+CAMPOS_POSICION = ['símbolo', 'título', 'cantidad', 'precio_actual', 'importe_total', 'divisa',
+                   'importe_base', '% Activo', 'dividendos', 'tipo_activo', 'broker']
+
+# Filas por bloque al escribir Parquet, para no materializar toda la cartera a la vez.
+FILAS_POR_BLOQUE = 50000
+
+
+def ordenar_posiciones(filas):
+    orden_tipos = {tipo: i for i, tipo in enumerate(ORDEN_TIPOS)}
+    return sorted(filas, key=lambda fila: (orden_tipos.get(fila['tipo_activo'], len(orden_tipos)), fila['símbolo']))
+
+
+def refrescar_precios(portfolio, proveedor=None, tamano_lote=50, progreso=None, comprobar=None):
+    # Pide las cotizaciones por bloques, aplica las obtenidas y devuelve el estado de cada símbolo.
+    simbolos = [asset.simbolo for asset in portfolio.get_all_assets()]
+    precios = {}
+    estados = {}
+    for i in range(0, len(simbolos), tamano_lote):
+        if comprobar:
+            comprobar()
+        for simbolo, cotizacion in obtener_cotizaciones(simbolos[i:i + tamano_lote], proveedor).items():
+            estados[simbolo] = cotizacion.estado
+            if cotizacion.estado != ESTADO_MISSING:
+                precios[simbolo] = cotizacion.precio
+        if progreso:
+            progreso(min(i + tamano_lote, len(simbolos)), len(simbolos))
+    if comprobar:
+        comprobar()
+    portfolio.update_prices(precios)
+    return estados
+
+
+def iterar_posiciones(portfolio, total, tipos=None):
+    # importe_base: importe convertido a la divisa base (None si falta el tipo de cambio).
+    for asset in portfolio.get_all_assets():
+        fila = asset.to_dict()
+        factor = 1.0 if tipos is None else tipos.get(asset.divisa)
+        fila['importe_base'] = fila['importe_total'] * factor if factor is not None else None
+        fila['% Activo'] = (fila['importe_base'] / total * 100) if total > 0 and factor is not None else 0
+        yield fila
+
+
+def resumen_dividendos(libro, simbolos, anos=None):
+    simbolos = set(simbolos)
+    resumen = {clave: total for clave, total in libro.resumen().items() if clave[0] in simbolos}
+    if anos is None:
+        anos = sorted({ano for _, ano in resumen})
+    por_activo_ano = {simbolo: {ano: 0 for ano in anos} for simbolo in simbolos}
+    por_ano = {ano: 0 for ano in anos}
+    for (simbolo, ano), total in resumen.items():
+        if ano in por_ano:
+            por_activo_ano[simbolo][ano] = total
+            por_ano[ano] += total
+    por_activo = {simbolo: sum(totales.values()) for simbolo, totales in por_activo_ano.items()}
+    return {
+        'anos': anos,
+        'por_activo_ano': por_activo_ano,
+        'por_ano': por_ano,
+        'por_activo': por_activo,
+        'total': sum(por_ano.values()),
+    }
+
+
+def valorar_cartera(portfolio, refrescar=False, proveedor=None, libro=None, tipos=None):
+    from services.agregados import agregados_cartera
+    from services.divisas import tipos_cartera
+
+    estados = refrescar_precios(portfolio, proveedor) if refrescar else {}
+    if tipos is None:
+        tipos = tipos_cartera(portfolio)
+    agregados = agregados_cartera(portfolio, tipos)
+    valoracion = {
+        'agregados': agregados,
+        'estados': estados,
+        'posiciones': iterar_posiciones(portfolio, agregados['general'], tipos),
+    }
+    if libro is not None:
+        simbolos = [asset.simbolo for asset in portfolio.get_all_assets() if asset.dividendos == 'Sí']
+        valoracion['dividendos'] = resumen_dividendos(libro, simbolos)
+    return valoracion
+
+
+def claves_a_texto(valor):
+    # JSON no admite claves tupla (tipo x broker) ni enteras (años): se aplanan a texto.
+    if isinstance(valor, dict):
+        return {("|".join(clave) if isinstance(clave, tuple) else str(clave)): claves_a_texto(v)
+                for clave, v in valor.items()}
+    if isinstance(valor, list):
+        return [claves_a_texto(v) for v in valor]
+    return valor
+
+
+def escribir_json(valoracion, salida):
+    # Las posiciones se escriben una a una para no construir el documento completo en memoria.
+    salida.write('{')
+    for clave in ('agregados', 'estados', 'dividendos'):
+        if clave in valoracion:
+            salida.write(f'{json.dumps(clave)}: {json.dumps(claves_a_texto(valoracion[clave]), ensure_ascii=False)}, ')
+    salida.write('"posiciones": [')
+    for i, fila in enumerate(valoracion['posiciones']):
+        salida.write((',\n' if i else '\n') + json.dumps(fila, ensure_ascii=False))
+    salida.write('\n]}\n')
+
+
+def escribir_csv(valoracion, salida):
+    escritor = csv.DictWriter(salida, fieldnames=CAMPOS_POSICION)
+    escritor.writeheader()
+    for fila in valoracion['posiciones']:
+        escritor.writerow(fila)
+
+
+def escribir_parquet(valoracion, ruta):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise RuntimeError("La salida Parquet necesita pyarrow (pip install pyarrow).") from e
+
+    escritor = None
+    bloque = []
+
+    def volcar():
+        nonlocal escritor
+        tabla = pa.Table.from_pylist(bloque)
+        if escritor is None:
+            escritor = pq.ParquetWriter(ruta, tabla.schema)
+        escritor.write_table(tabla)
+        bloque.clear()
+
+    for fila in valoracion['posiciones']:
+        bloque.append(fila)
+        if len(bloque) >= FILAS_POR_BLOQUE:
+            volcar()
+    if bloque or escritor is None:
+        volcar()
+    escritor.close()
@@ -14,4 +14,15 @@ try:
     import yfinance as yf
     print("✅ yfinance importado correctamente")
 except ImportError as e:
-    print(f"❌ Error importando yfinance: {e}")
\ No newline at end of file
+    print(f"❌ Error importando yfinance: {e}")
+try:
+    from benchmarks.bench_arranque import medir, comprobar
+    resultado = medir()
+    errores = comprobar(resultado)
+    if errores:
+        for error in errores:
+            print(f"❌ Arranque: {error}")
+    else:
+        print(f"✅ Arranque: gui.main_window importado en {resultado['importacion_ms']:.0f} ms sin módulos pesados")
+except Exception as e:
+    print(f"❌ Error midiendo el arranque: {e}")
@@ -0,0 +1,63 @@
+import random
+
+import pytest
+
+from models.asset import Asset
+from models.portfolio import Portfolio
+from services.agregados import acumular, agregados_cartera, ajustar_importe, calcular_parciales, convertir
+
+TIPOS = {'EUR': 1.0, 'USD': 0.9, 'GBp': 0.012}
+
+
+def comparar(incrementales, desde_cero):
+    assert incrementales['general'] == pytest.approx(desde_cero['general'])
+    assert incrementales['acciones'] == desde_cero['acciones']
+    for nombre in ('tipo', 'broker', 'tipo_broker', 'divisa'):
+        # Los grupos que se vacían siguen en los incrementales, con cantidad cero y un
+        # importe que es cero salvo redondeo.
+        cantidades = {k: v for k, v in incrementales[nombre + '_cant'].items() if v}
+        assert cantidades == desde_cero[nombre + '_cant']
+        importes = {k: incrementales[nombre][k] for k in cantidades}
+        assert importes == pytest.approx(desde_cero[nombre])
+        assert sum(incrementales[nombre].values()) == pytest.approx(desde_cero['general'])
+
+
+@pytest.mark.parametrize("tipos", [None, TIPOS])
+def test_incrementales_igual_que_desde_cero(tmp_path, tipos):
+    azar = random.Random(5)
+    portfolio = Portfolio(str(tmp_path / "cartera.json"))
+
+    def nuevo(i):
+        precio = round(azar.uniform(1, 100), 2)
+        cantidad = azar.randint(1, 50)
+        return Asset(f"S{i}", f"S{i}", cantidad, precio, cantidad * precio, 'No', azar.choice(['ACC', 'ETF', 'PP']),
+                     azar.choice(['degiro', 'ocean']), azar.choice(list(TIPOS)))
+
+    with portfolio.transaction():
+        for i in range(20):
+            portfolio.add_asset(nuevo(i))
+    totales = agregados_cartera(portfolio, tipos)
+    totales = {clave: dict(valor) if isinstance(valor, dict) else valor for clave, valor in totales.items()}
+
+    siguiente = 20
+    for _ in range(200):
+        operacion = azar.random()
+        simbolos = [asset.simbolo for asset in portfolio.get_all_assets()]
+        if operacion < 0.6 and simbolos:
+            cambios = {simbolo: round(azar.uniform(1, 100), 2) for simbolo in azar.sample(simbolos, 3)}
+            anteriores = {s: portfolio.get_asset_by_symbol(s).to_dict() for s in cambios}
+            for simbolo in portfolio.update_prices(cambios, persist=False):
+                fila = portfolio.get_asset_by_symbol(simbolo).to_dict()
+                ajustar_importe(totales, fila, fila['importe_total'] - anteriores[simbolo]['importe_total'])
+        elif operacion < 0.8:
+            asset = nuevo(siguiente)
+            siguiente += 1
+            portfolio.add_asset(asset)
+            acumular(totales, asset.to_dict(), 1)
+        elif simbolos:
+            simbolo = azar.choice(simbolos)
+            acumular(totales, portfolio.get_asset_by_symbol(simbolo).to_dict(), -1)
+            portfolio.delete_asset(simbolo)
+        comparar(totales, convertir(calcular_parciales(portfolio.to_columns()), tipos))
+
+    comparar(totales, agregados_cartera(portfolio, tipos))
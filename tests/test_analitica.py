@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from models.asset import Asset
+from models.portfolio import Portfolio
+from services.analitica import analizar_cartera
+from services.historico import AlmacenHistorico
+
+FECHAS = np.datetime64('2024-01-01') + np.arange(5)
+
+
+@pytest.fixture
+def cartera(tmp_path):
+    portfolio = Portfolio(str(tmp_path / "cartera.json"))
+    with portfolio.transaction():
+        portfolio.add_asset(Asset('SAN', 'Santander', 10, 4.0, 40.0, 'No', 'ACC', 'degiro', 'EUR'))
+        portfolio.add_asset(Asset('AAPL', 'Apple', 2, 200.0, 400.0, 'No', 'ACC', 'degiro', 'USD'))
+    return portfolio
+
+
+@pytest.fixture
+def almacen(tmp_path):
+    almacen = AlmacenHistorico(str(tmp_path / "historico"))
+    almacen.anadir('SAN', FECHAS, [4.0, 4.0, 4.0, 4.0, 4.0])
+    almacen.anadir('AAPL', FECHAS, [100.0, 110.0, 100.0, 90.0, 120.0])
+    return almacen
+
+
+def test_dos_divisas_en_la_base(cartera, almacen):
+    resultado = analizar_cartera(cartera, almacen, {'EUR': 1.0, 'USD': 0.5})
+    assert resultado['sin_tipo'] == []
+    # 10 SAN a 4 EUR más 2 AAPL a 0,5 EUR por dólar.
+    assert resultado['valor'] == pytest.approx([140.0, 150.0, 140.0, 130.0, 160.0])
+    assert resultado['twr'] == pytest.approx(160.0 / 140.0 - 1)
+    assert resultado['max_drawdown'] == pytest.approx(130.0 / 150.0 - 1)
+
+    # Sin tipos, los importes se suman tal cual en su divisa.
+    assert analizar_cartera(cartera, almacen)['valor'][0] == pytest.approx(240.0)
+
+
+def test_sin_tipo_de_cambio_queda_fuera(cartera, almacen):
+    resultado = analizar_cartera(cartera, almacen, {'EUR': 1.0})
+    assert resultado['sin_tipo'] == ['AAPL']
+    assert resultado['valor'] == pytest.approx([40.0] * 5)
+    assert resultado['twr'] == 0.0
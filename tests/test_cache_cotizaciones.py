@@ -0,0 +1,88 @@
+import json
+import threading
+import time
+
+from services.market_data import (ESTADO_MISSING, ESTADO_OK, ESTADO_STALE, CacheCotizaciones,
+                                  ProveedorFalso)
+
+
+def test_guardados_concurrentes(tmp_path):
+    archivo = str(tmp_path / "cotizaciones.json")
+    cache = CacheCotizaciones(archivo, proveedor=ProveedorFalso({'A': 1.0}))
+    cache.obtener(['A'])
+    errores = []
+
+    def guardar():
+        for _ in range(50):
+            try:
+                cache.guardar()
+            except Exception as e:
+                errores.append(e)
+
+    hilos = [threading.Thread(target=guardar) for _ in range(4)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert not errores
+    with open(archivo) as f:
+        assert json.load(f)['A'][0] == 1.0
+
+
+def test_caducada_se_sirve_y_se_refresca(tmp_path):
+    proveedor = ProveedorFalso({'A': 1.0})
+    cache = CacheCotizaciones(str(tmp_path / "cotizaciones.json"), ttl=0.05, proveedor=proveedor)
+    assert cache.obtener(['A'])['A'].estado == ESTADO_OK
+    proveedor.precios['A'] = 2.0
+    time.sleep(0.06)
+    caducada = cache.obtener(['A'])['A']
+    assert (caducada.estado, caducada.precio) == (ESTADO_STALE, 1.0)
+    for _ in range(100):
+        if cache.obtener(['A'])['A'].precio == 2.0:
+            break
+        time.sleep(0.01)
+    assert cache.obtener(['A'])['A'].precio == 2.0
+
+
+def test_persistencia_y_ausentes(tmp_path):
+    archivo = str(tmp_path / "cotizaciones.json")
+    CacheCotizaciones(archivo, proveedor=ProveedorFalso({'A': 1.0})).obtener(['A', 'B'])
+    proveedor = ProveedorFalso({})
+    resultado = CacheCotizaciones(archivo, proveedor=proveedor).obtener(['A', 'B'])
+    assert resultado['A'].precio == 1.0
+    assert resultado['B'].estado == ESTADO_MISSING
+
+
+def test_estadisticas_con_consultas_concurrentes(tmp_path):
+    cache = CacheCotizaciones(str(tmp_path / "cotizaciones.json"), proveedor=ProveedorFalso({'A': 1.0, 'B': 2.0}))
+    cache.obtener(['A', 'B'])
+
+    def consultar():
+        for _ in range(200):
+            cache.obtener(['A', 'B'])
+
+    hilos = [threading.Thread(target=consultar) for _ in range(4)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    estadisticas = cache.estadisticas()
+    assert estadisticas['entradas'] == 2
+    assert estadisticas['aciertos'] + estadisticas['fallos'] == 2 * (1 + 4 * 200)
+
+
+def test_consultar_no_va_a_la_red(tmp_path):
+    from services.divisas import tipos_cambio
+
+    proveedor = ProveedorFalso({'USDEUR=X': 0.9, 'GBPEUR=X': 1.2})
+    cache = CacheCotizaciones(str(tmp_path / "tipos.json"), ttl=0.05, proveedor=proveedor)
+    cache.obtener(['USDEUR=X'])
+    peticiones = proveedor.peticiones
+    time.sleep(0.06)
+    assert tipos_cambio(['EUR', 'USD', 'GBp'], cache=cache, solo_cache=True) == {'EUR': 1.0, 'USD': 0.9}
+    assert cache.consultar(['USDEUR=X'])['USDEUR=X'].estado == ESTADO_STALE
+    assert proveedor.peticiones == peticiones
+
+    tipos = tipos_cambio(['EUR', 'USD', 'GBp'], cache=cache)
+    assert tipos['GBp'] == 1.2 * 0.01
+    assert proveedor.peticiones > peticiones
@@ -0,0 +1,93 @@
+import datetime
+
+import pytest
+
+from models.asset import Asset
+from models.portfolio import Portfolio
+from services.dividendos import LibroDividendos, abrir_libro, ingerir_dividendos
+from services.market_data import ProveedorFalso
+
+ANO = datetime.date.today().year
+
+
+@pytest.fixture
+def cartera(tmp_path):
+    portfolio = Portfolio(str(tmp_path / "cartera.json"))
+    with portfolio.transaction():
+        portfolio.add_asset(Asset('EURO', 'Euro', 10, 10.0, 100.0, 'Sí', 'ACC', 'degiro'))
+        portfolio.add_asset(Asset('DOLAR', 'Dólar', 100, 50.0, 5000.0, 'Sí', 'ACC', 'degiro', 'USD'))
+        portfolio.add_asset(Asset('YEN', 'Yen', 100, 50.0, 5000.0, 'Sí', 'ACC', 'degiro', 'JPY'))
+    return portfolio
+
+
+@pytest.fixture
+def libro(tmp_path):
+    libro = LibroDividendos(str(tmp_path / "dividendos.db"))
+    yield libro
+    libro.cerrar()
+
+
+def proveedor():
+    return ProveedorFalso({}, dividendos={
+        'EURO': [(f"{ANO}-01-10", 0.5)],
+        'DOLAR': [(f"{ANO}-01-10", 0.25), (f"{ANO}-01-20", 0.25)],
+        'YEN': [(f"{ANO}-01-10", 10.0)],
+    })
+
+
+def test_ingesta_convierte_a_la_divisa_base(cartera, libro):
+    resultado = ingerir_dividendos(cartera, libro, proveedor(), tipos={'EUR': 1.0, 'USD': 0.9})
+    assert resultado['pagos'] == 3
+    assert resultado['sin_tipo'] == ['YEN']
+    rejilla = libro.rejilla(ANO)
+    assert rejilla['EURO'][0] == 5.0
+    # Dos pagos en el mes, 100 acciones a 0,25 USD cada uno, a 0,9 EUR por USD.
+    assert rejilla['DOLAR'][0] == pytest.approx(45.0)
+    assert {divisa for _, _, _, divisa in libro.pagos()} == {'EUR'}
+    # Fecha ex real; con dos pagos en el mes, la del último.
+    assert dict((simbolo, fecha) for fecha, simbolo, _, _ in libro.pagos()) == {
+        'EURO': f"{ANO}-01-10", 'DOLAR': f"{ANO}-01-20"}
+    assert 'YEN' not in libro.ultimas_ingestas()
+
+
+def test_ingesta_incremental_y_celdas_manuales(cartera, libro):
+    tipos = {'EUR': 1.0, 'USD': 1.0, 'JPY': 0.01}
+    ingerir_dividendos(cartera, libro, proveedor(), tipos=tipos)
+    libro.registrar('EURO', ANO, 1, 0)
+    assert ingerir_dividendos(cartera, libro, proveedor(), tipos=tipos)['pagos'] == 0
+    assert 'EURO' not in libro.rejilla(ANO) or libro.rejilla(ANO)['EURO'][0] == 0
+    assert libro.rejilla(ANO)['YEN'][0] == pytest.approx(10.0)
+
+
+def test_migracion_fallida_se_reintenta(tmp_path):
+    ruta = str(tmp_path / "dividendos.db")
+    ruta_json = tmp_path / "dividendos.json"
+    ruta_json.write_text('{"2023": {"SAN": ["", "1.5"', encoding="utf-8")
+    with pytest.raises(ValueError):
+        abrir_libro(ruta, str(ruta_json))
+
+    ruta_json.write_text('{"2023": {"SAN": ["", "1.5", ""]}}', encoding="utf-8")
+    libro = abrir_libro(ruta, str(ruta_json))
+    assert libro.rejilla(2023)['SAN'][1] == 1.5
+    assert libro.migrado()
+    libro.registrar('SAN', 2023, 2, 2.0)
+    libro.cerrar()
+
+    # Ya migrado: el JSON no vuelve a pisar lo editado después.
+    libro = abrir_libro(ruta, str(ruta_json))
+    assert libro.rejilla(2023)['SAN'][1] == 2.0
+    libro.cerrar()
+
+
+def test_libro_anterior_a_la_marca_no_se_remigra(tmp_path):
+    ruta = str(tmp_path / "dividendos.db")
+    libro = LibroDividendos(ruta)
+    libro.registrar('SAN', 2023, 2, 2.0)
+    libro._conexion.execute("DROP TABLE meta")
+    libro.cerrar()
+    ruta_json = tmp_path / "dividendos.json"
+    ruta_json.write_text('{"2023": {"SAN": ["", "1.5", ""]}}', encoding="utf-8")
+
+    libro = abrir_libro(ruta, str(ruta_json))
+    assert libro.rejilla(2023)['SAN'][1] == 2.0
+    libro.cerrar()
@@ -0,0 +1,102 @@
+import pytest
+
+from gui.main_window import leer_cantidad
+from models.asset import Asset
+from models.portfolio import Portfolio
+from services.importacion import ErrorImportacion, _numero, _tipo_fondo, importar, leer_filas
+from services.operaciones import LibroOperaciones
+
+# Hoja de carteraAAF.xlsx exportada a CSV: título y notas antes de la cabecera, y filas
+# separadoras de sección.
+AAF = """Cartera AAF,,,,,
+Actualizado,2024-05-01,,,,
+,,,,,
+,Symbol,Title,Shares,Precio actual,Dividend
+ACCIONES,,,,,
+,SAN,Banco Santander,"1.200,0","4,25",Sí
+ETFs y PP,,,,,
+,IWDA,iShares Core MSCI World,"607,4","85,10",No
+,N5137PPE,"Plan Pensiones PP Indexa",10,"12,5",No
+,0P0000IKFS,Fondo Renta Global FI,3,"100,0",No
+"""
+
+
+@pytest.mark.parametrize("valor, esperado", [
+    ("1.234,56", 1234.56),
+    ("1,234.56", 1234.56),
+    ("607,4", 607.4),
+    ("607.4", 607.4),
+    ("1 234,5 €", 1234.5),
+    ("\xa012\xa0", 12.0),
+    (7, 7.0),
+    ("", None),
+    ("#N/A", None),
+    ("abc", None),
+])
+def test_numero(valor, esperado):
+    assert _numero(valor) == (pytest.approx(esperado) if esperado is not None else None)
+
+
+@pytest.mark.parametrize("simbolo, titulo, tipo, esperado", [
+    ("N5137PPE", "Plan Indexa", 'ETF', 'PP'),
+    ("IND01", "Plan de pensiones PP", 'ETF', 'PP'),
+    ("0P0000IKFS", "Fondo global", 'ETF', 'FON'),
+    ("ES0000", "Renta fija, FI", 'ETF', 'FON'),
+    ("IWDA", "iShares Core MSCI World", 'ETF', 'ETF'),
+    ("0P0000IKFS", "Fondo global", 'ACC', 'ACC'),
+])
+def test_tipo_fondo(simbolo, titulo, tipo, esperado):
+    assert _tipo_fondo(simbolo, titulo, tipo) == esperado
+
+
+def test_cabecera_y_secciones(tmp_path):
+    ruta = tmp_path / "aaf.csv"
+    ruta.write_text(AAF, encoding="utf-8")
+    filas = {fila['simbolo']: fila for fila in leer_filas(str(ruta), 'aaf')}
+    assert list(filas) == ['SAN', 'IWDA', 'N5137PPE', '0P0000IKFS']
+    assert filas['SAN']['fila'] == 6
+    assert (filas['SAN']['cantidad'], filas['SAN']['precio']) == (1200.0, 4.25)
+    assert filas['SAN']['dividendos'] == 'Sí'
+    assert filas['SAN']['tipo_activo'] == 'ACC'
+    assert filas['IWDA']['cantidad'] == pytest.approx(607.4)
+    assert {filas[s]['tipo_activo'] for s in ('IWDA', 'N5137PPE', '0P0000IKFS')} == {'ETF'}
+
+
+def test_sin_cabecera(tmp_path):
+    ruta = tmp_path / "otro.csv"
+    ruta.write_text("a,b,c\n1,2,3\n", encoding="utf-8")
+    with pytest.raises(ErrorImportacion):
+        list(leer_filas(str(ruta), 'aaf'))
+
+
+def test_importar_tipos_y_operaciones(tmp_path):
+    ruta = tmp_path / "aaf.csv"
+    ruta.write_text(AAF, encoding="utf-8")
+    portfolio = Portfolio(str(tmp_path / "cartera.json"))
+    portfolio.add_asset(Asset('IWDA', 'iShares', 600, 80.0, 48000.0, 'No', 'ETF', 'degiro'))
+    libro = LibroOperaciones(str(tmp_path / "operaciones.db"))
+
+    resumen = importar(portfolio, str(ruta), 'aaf', broker='ocean', resolver_precios=False, libro=libro)
+    assert (resumen['nuevas'], resumen['actualizadas'], resumen['operaciones']) == (3, 1, 4)
+    tipos = {asset.simbolo: asset.tipo_activo for asset in portfolio.get_all_assets()}
+    assert tipos == {'IWDA': 'ETF', 'SAN': 'ACC', 'N5137PPE': 'PP', '0P0000IKFS': 'FON'}
+    assert portfolio.get_asset_by_symbol('IWDA').cantidad == pytest.approx(607.4)
+    assert portfolio.get_asset_by_symbol('SAN').cantidad == 1200
+
+    filas = {simbolo: (broker, tipo, cantidad, precio)
+             for _, _, simbolo, broker, tipo, cantidad, precio, _ in libro.operaciones()}
+    libro.cerrar()
+    # Activo existente: la diferencia, en su broker; altas: la cantidad entera, en el del fichero.
+    assert filas['IWDA'] == ('degiro', 'compra', pytest.approx(7.4), 85.1)
+    assert filas['SAN'] == ('ocean', 'compra', 1200, 4.25)
+    assert filas['N5137PPE'] == ('ocean', 'compra', 10, 12.5)
+
+
+@pytest.mark.parametrize("texto, esperado", [
+    ("607,4", 607.4), ("607.4", 607.4), (" 12 ", 12), ("0", 0), ("-1", None), ("abc", None), ("nan", None),
+])
+def test_cantidad_del_formulario(texto, esperado):
+    cantidad = leer_cantidad(texto)
+    assert cantidad == esperado
+    if esperado is not None:
+        assert type(cantidad) is type(esperado)
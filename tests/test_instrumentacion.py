@@ -0,0 +1,10 @@
+import services.instrumentacion as instrumentacion
+
+
+def test_activar_registra_el_informe_una_vez(monkeypatch):
+    registrados = []
+    monkeypatch.setattr(instrumentacion.atexit, 'register', registrados.append)
+    monkeypatch.setattr(instrumentacion, '_informe_registrado', False)
+    instrumentacion.activar({'tiempos'})
+    instrumentacion.activar({'tiempos'})
+    assert registrados == [instrumentacion.volcar_informe]
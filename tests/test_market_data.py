@@ -0,0 +1,69 @@
+import time
+
+import pytest
+
+from services.market_data import (ESTADO_MISSING, ESTADO_OK, ESTADO_STALE, LimiteExcedido, ProveedorFalso,
+                                  ProveedorInestable, obtener_cotizaciones)
+
+PRECIOS = {'A': 1.0, 'B': 2.0, 'C': 3.0, 'D': 4.0, 'E': 5.0}
+
+
+def estados(cotizaciones):
+    return {simbolo: cotizacion.estado for simbolo, cotizacion in cotizaciones.items()}
+
+
+def test_ok_y_missing():
+    cotizaciones = obtener_cotizaciones(['A', 'B', 'Z', 'A', ''], ProveedorFalso(PRECIOS))
+    assert estados(cotizaciones) == {'A': ESTADO_OK, 'B': ESTADO_OK, 'Z': ESTADO_MISSING}
+    assert cotizaciones['B'].precio == 2.0
+    assert cotizaciones['Z'].precio is None
+
+
+def test_precio_antiguo_es_stale():
+    antiguo = time.time() - 10 * 24 * 3600
+    cotizaciones = obtener_cotizaciones(['A'], ProveedorFalso(PRECIOS, marca_tiempo=antiguo))
+    assert cotizaciones['A'].estado == ESTADO_STALE
+    assert cotizaciones['A'].precio == 1.0
+    cotizaciones = obtener_cotizaciones(['A'], ProveedorFalso(PRECIOS, marca_tiempo=antiguo),
+                                        max_antiguedad=11 * 24 * 3600)
+    assert cotizaciones['A'].estado == ESTADO_OK
+
+
+def test_lotes():
+    proveedor = ProveedorFalso(PRECIOS)
+    cotizaciones = obtener_cotizaciones(list(PRECIOS), proveedor, tamano_lote=2)
+    assert proveedor.peticiones == 3
+    assert all(c.estado == ESTADO_OK for c in cotizaciones.values())
+
+
+def test_reintentos():
+    proveedor = ProveedorFalso(PRECIOS, fallos=2)
+    cotizaciones = obtener_cotizaciones(['A', 'B'], proveedor, reintentos=2, espera=0.0)
+    assert proveedor.peticiones == 3
+    assert estados(cotizaciones) == {'A': ESTADO_OK, 'B': ESTADO_OK}
+
+
+def test_reintentos_agotados_dejan_missing():
+    proveedor = ProveedorFalso(PRECIOS, fallos=3)
+    cotizaciones = obtener_cotizaciones(['A', 'B'], proveedor, reintentos=2, espera=0.0)
+    assert proveedor.peticiones == 3
+    assert estados(cotizaciones) == {'A': ESTADO_MISSING, 'B': ESTADO_MISSING}
+
+
+def test_limite_espera_lo_indicado():
+    proveedor = ProveedorInestable(PRECIOS, prob_limite=1.0, reintentar_en=0.1)
+    inicio = time.perf_counter()
+    cotizaciones = obtener_cotizaciones(['A'], proveedor, reintentos=1, espera=0.0)
+    assert time.perf_counter() - inicio >= 0.1
+    assert cotizaciones['A'].estado == ESTADO_MISSING
+    with pytest.raises(LimiteExcedido):
+        proveedor.obtener_lote(['A'])
+
+
+def test_timeout_global():
+    # Un lote lento no retrasa la respuesta más allá del timeout: sus símbolos quedan sin precio.
+    proveedor = ProveedorFalso(PRECIOS, latencia=0.5)
+    inicio = time.perf_counter()
+    cotizaciones = obtener_cotizaciones(['A', 'B'], proveedor, timeout=0.1)
+    assert time.perf_counter() - inicio < 0.4
+    assert estados(cotizaciones) == {'A': ESTADO_MISSING, 'B': ESTADO_MISSING}
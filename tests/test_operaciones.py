@@ -0,0 +1,195 @@
+import pytest
+
+from gui.main_window import anotar_edicion
+from models.asset import Asset
+from models.portfolio import Portfolio
+from services.importacion import importar
+from services.operaciones import (LibroOperaciones, MotorCoste, conciliar, registrar_saldos_iniciales,
+                                  sincronizar_cartera)
+
+
+@pytest.fixture
+def libro(tmp_path):
+    libro = LibroOperaciones(str(tmp_path / "operaciones.db"))
+    yield libro
+    libro.cerrar()
+
+
+@pytest.fixture
+def cartera(tmp_path):
+    portfolio = Portfolio(str(tmp_path / "cartera.json"))
+    with portfolio.transaction():
+        portfolio.add_asset(Asset('SAN', 'Santander', 100, 4.0, 400.0, 'Sí', 'ACC', 'degiro'))
+        portfolio.add_asset(Asset('BBVA', 'BBVA', 50, 9.0, 450.0, 'Sí', 'ACC', 'degiro'))
+    return portfolio
+
+
+def compras_y_venta(libro):
+    libro.registrar_lote([
+        ('2024-01-10', 'SAN', 'degiro', 'compra', 10, 10.0),
+        ('2024-02-10', 'SAN', 'degiro', 'compra', 10, 20.0),
+        ('2024-03-10', 'SAN', 'degiro', 'venta', 15, 30.0),
+    ])
+
+
+def test_fifo_vende_primero_los_lotes_antiguos(libro):
+    compras_y_venta(libro)
+    motor = MotorCoste(libro, 'fifo')
+    assert motor.actualizar() == 3
+    assert motor.lotes('SAN', 'degiro') == [(5, 20.0)]
+    fila = motor.resultados({'SAN': 25.0})[('SAN', 'degiro')]
+    # 10 a 10 € y 5 a 20 € vendidas a 30 €.
+    assert fila['realizado'] == pytest.approx(15 * 30 - (100 + 100))
+    assert fila['coste'] == pytest.approx(100)
+    assert fila['latente'] == pytest.approx(5 * 25 - 100)
+
+
+def test_coste_medio(libro):
+    compras_y_venta(libro)
+    motor = MotorCoste(libro, 'medio')
+    motor.actualizar()
+    assert motor.lotes('SAN', 'degiro') == [(5, pytest.approx(15.0))]
+    fila = motor.resultados({'SAN': 25.0})[('SAN', 'degiro')]
+    assert fila['realizado'] == pytest.approx(15 * 30 - 15 * 15)
+    assert fila['coste'] == pytest.approx(75)
+
+
+def test_split_multiplica_cantidad_y_divide_coste(libro):
+    libro.registrar_lote([
+        ('2024-01-10', 'SAN', 'degiro', 'compra', 10, 10.0),
+        ('2024-02-10', 'SAN', 'degiro', 'split', 2),
+        ('2024-03-10', 'SAN', 'degiro', 'venta', 5, 8.0),
+    ])
+    for metodo in ('fifo', 'medio'):
+        motor = MotorCoste(libro, metodo)
+        motor.actualizar()
+        assert motor.cantidades() == {('SAN', 'degiro'): 15}
+        assert motor.lotes('SAN', 'degiro') == [(15, pytest.approx(5.0))]
+        assert motor.resultados({})[('SAN', 'degiro')]['realizado'] == pytest.approx(5 * 8 - 5 * 5)
+
+
+def test_operacion_atrasada_rehace_la_posicion(libro):
+    libro.registrar_lote([
+        ('2024-01-10', 'SAN', 'degiro', 'compra', 10, 10.0),
+        ('2024-03-10', 'SAN', 'degiro', 'venta', 10, 30.0),
+        ('2024-01-10', 'BBVA', 'degiro', 'compra', 5, 9.0),
+    ])
+    motor = MotorCoste(libro, 'fifo')
+    motor.actualizar()
+    # Compra anterior a la venta ya aplicada: la venta debe consumir primero el lote de 5 €.
+    libro.registrar('2024-01-01', 'SAN', 'degiro', 'compra', 10, 5.0)
+    assert motor.actualizar() == 1
+    assert motor.lotes('SAN', 'degiro') == [(10, 10.0)]
+    assert motor.resultados({})[('SAN', 'degiro')]['realizado'] == pytest.approx(10 * 30 - 10 * 5)
+    assert motor.lotes('BBVA', 'degiro') == [(5, 9.0)]
+
+    reconstruido = MotorCoste(libro, 'fifo')
+    reconstruido.actualizar()
+    assert reconstruido.resultados({}) == motor.resultados({})
+
+
+def test_punto_de_control_solo_lee_lo_nuevo(libro):
+    compras_y_venta(libro)
+    motor = MotorCoste(libro, 'fifo')
+    motor.actualizar()
+    motor.guardar()
+    libro.registrar('2024-04-10', 'SAN', 'degiro', 'compra', 5, 40.0)
+
+    recargado = MotorCoste(libro, 'fifo')
+    assert recargado.ultimo_id == 3
+    assert recargado.actualizar() == 1
+    assert recargado.lotes('SAN', 'degiro') == [(5, 20.0), (5, 40.0)]
+    assert recargado.resultados({})[('SAN', 'degiro')]['realizado'] == pytest.approx(250)
+
+
+def test_punto_de_control_de_otro_libro_se_ignora(libro):
+    # Un punto de control más avanzado que el libro no puede ser de este fichero.
+    compras_y_venta(libro)
+    libro.guardar_estado('fifo', 99, {})
+    motor = MotorCoste(libro, 'fifo')
+    assert motor.ultimo_id == 0
+    assert motor.actualizar() == 3
+
+
+def test_conciliar_y_sincronizar(cartera, libro):
+    libro.registrar_lote([
+        ('2024-01-10', 'SAN', 'degiro', 'compra', 120, 4.0),
+        ('2024-01-10', 'TEF', 'degiro', 'compra', 30, 4.0),
+    ])
+    motor = MotorCoste(libro, 'fifo')
+    motor.actualizar()
+    assert sorted(conciliar(cartera, motor)) == [('BBVA', 50, None), ('SAN', 100, 120), ('TEF', 0, 30)]
+
+    sincronizar_cartera(cartera, motor)
+    assert cartera.get_asset_by_symbol('SAN').cantidad == 120
+    assert cartera.get_asset_by_symbol('TEF').cantidad == 30
+    # Sin historial no hay cantidad que aplicar.
+    assert conciliar(cartera, motor) == [('BBVA', 50, None)]
+
+
+def test_importar_anota_las_operaciones(tmp_path, cartera, libro):
+    ruta = tmp_path / "degiro.csv"
+    ruta.write_text("Producto,Símbolo/ISIN,Cantidad,Precio de cierre,Divisa\n"
+                    "Santander,SAN,80,5.0,EUR\n"
+                    "BBVA,BBVA,60,10.0,EUR\n"
+                    "Telefónica,TEF,20,4.0,EUR\n", encoding="utf-8")
+    resumen = importar(cartera, str(ruta), 'degiro', resolver_precios=False, libro=libro)
+    assert resumen['operaciones'] == 3
+
+    operaciones = sorted((simbolo, tipo, cantidad, precio)
+                         for _, _, simbolo, _, tipo, cantidad, precio, _ in libro.operaciones())
+    assert operaciones == [('BBVA', 'compra', 10, 10.0), ('SAN', 'venta', 20, 5.0), ('TEF', 'compra', 20, 4.0)]
+
+    # Partiendo de las posiciones anteriores, el libro y la cartera coinciden tras importar.
+    libro.registrar_lote([('2000-01-01', 'SAN', 'degiro', 'compra', 100, 4.0),
+                          ('2000-01-01', 'BBVA', 'degiro', 'compra', 50, 9.0)])
+    motor = MotorCoste(libro, 'fifo')
+    motor.actualizar()
+    assert conciliar(cartera, motor) == []
+
+
+def test_sincronizar_elige_el_broker_con_mas_cantidad(cartera, libro):
+    libro.registrar_lote([
+        ('2024-01-10', 'TEF', 'ocean', 'compra', 10, 4.0),
+        ('2024-01-10', 'TEF', 'degiro', 'compra', 30, 4.0),
+        ('2024-01-10', 'REP', 'sant', 'compra', 5, 4.0),
+        ('2024-01-10', 'REP', 'bbva', 'compra', 5, 4.0),
+    ])
+    motor = MotorCoste(libro, 'fifo')
+    motor.actualizar()
+    sincronizar_cartera(cartera, motor)
+    assert cartera.get_asset_by_symbol('TEF').broker == 'degiro'
+    assert cartera.get_asset_by_symbol('TEF').cantidad == 40
+    assert cartera.get_asset_by_symbol('REP').broker == 'bbva'
+
+
+def test_saldos_iniciales_parten_del_punto_de_control(cartera, libro, monkeypatch):
+    compras_y_venta(libro)
+    motor = MotorCoste(libro, 'fifo')
+    motor.actualizar()
+    motor.guardar()
+
+    desde = []
+    leer = libro.operaciones
+    monkeypatch.setattr(libro, 'operaciones', lambda desde_id=0, *args, **kwargs: (
+        desde.append(desde_id), leer(desde_id, *args, **kwargs))[1])
+    registrar_saldos_iniciales(cartera, libro, '2024-05-01')
+    assert desde == [3]
+    # SAN ya tiene historial; BBVA entra como saldo inicial.
+    assert [(s, t, c) for _, _, s, _, t, c, _, _ in leer(3)] == [('BBVA', 'compra', 50)]
+
+
+def test_edicion_con_cambio_de_broker_traspasa_la_posicion(libro):
+    libro.registrar('2024-01-10', 'SAN', 'degiro', 'compra', 100, 4.0)
+    anterior = Asset('SAN', 'Santander', 100, 4.0, 400.0, 'Sí', 'ACC', 'degiro').to_dict()
+    anotar_edicion(libro, anterior, Asset('SAN', 'Santander', 120, 5.0, 600.0, 'Sí', 'ACC', 'ocean'))
+    motor = MotorCoste(libro, 'fifo')
+    motor.actualizar()
+    assert motor.cantidades() == {('SAN', 'degiro'): 0, ('SAN', 'ocean'): 120}
+    assert motor.lotes('SAN', 'ocean') == [(120, 5.0)]
+
+    # Sin cambio de broker solo se anota la diferencia.
+    anterior = Asset('SAN', 'Santander', 120, 5.0, 600.0, 'Sí', 'ACC', 'ocean').to_dict()
+    anotar_edicion(libro, anterior, Asset('SAN', 'Santander', 90, 5.0, 450.0, 'Sí', 'ACC', 'ocean'))
+    assert motor.actualizar() == 1
+    assert motor.cantidades()[('SAN', 'ocean')] == 90
@@ -0,0 +1,124 @@
+import json
+import os
+
+import pytest
+
+import models.portfolio
+from models.asset import Asset
+from models.portfolio import Portfolio
+
+
+def activo(simbolo, cantidad=10, precio=1.0, tipo='ACC', broker='degiro'):
+    return Asset(simbolo, simbolo, cantidad, precio, cantidad * precio, 'No', tipo, broker)
+
+
+def simbolos(portfolio):
+    return [asset.simbolo for asset in portfolio.get_all_assets()]
+
+
+def lineas_diario(portfolio):
+    if not os.path.exists(portfolio.journal_file):
+        return []
+    with open(portfolio.journal_file) as f:
+        return f.readlines()
+
+
+@pytest.fixture
+def ruta(tmp_path):
+    return str(tmp_path / "cartera.json")
+
+
+@pytest.fixture
+def cartera(ruta):
+    portfolio = Portfolio(ruta)
+    for simbolo in ('A', 'B', 'C', 'D'):
+        portfolio.add_asset(activo(simbolo))
+    return portfolio
+
+
+def test_recargar_el_diario_conserva_el_orden(ruta, cartera):
+    cartera.update_asset('B', activo('B', cantidad=20))
+    cartera.update_asset('C', activo('X', tipo='ETF'))
+    cartera.delete_asset('A')
+    cartera.update_prices({'D': 2.0})
+    assert simbolos(cartera) == ['B', 'X', 'D']
+
+    recargada = Portfolio(ruta)
+    assert simbolos(recargada) == ['B', 'X', 'D']
+    assert [a.to_dict() for a in recargada.get_all_assets()] == [a.to_dict() for a in cartera.get_all_assets()]
+    assert recargada.get_asset_by_symbol('D').importe_total == 20.0
+    assert [a.simbolo for a in recargada.get_assets_by_type('ETF')] == ['X']
+
+
+def test_borrar_mantiene_los_indices(cartera):
+    cartera.delete_asset('B')
+    assert simbolos(cartera) == ['A', 'C', 'D']
+    assert [cartera.get_asset_by_symbol(s).simbolo for s in ('A', 'C', 'D')] == ['A', 'C', 'D']
+    assert cartera.get_asset_by_symbol('B') is None
+
+
+def test_linea_incompleta_se_recorta(ruta, cartera):
+    with open(cartera.journal_file, 'a') as f:
+        f.write('{"op": "delete", "sym')
+    recargada = Portfolio(ruta)
+    assert simbolos(recargada) == ['A', 'B', 'C', 'D']
+    assert len(lineas_diario(recargada)) == 4
+
+    # Las entradas nuevas no se pegan a la línea rota.
+    recargada.delete_asset('A')
+    assert simbolos(Portfolio(ruta)) == ['B', 'C', 'D']
+
+
+def test_transaccion_fallida_se_descarta(ruta, cartera):
+    version = cartera.version
+    with pytest.raises(RuntimeError):
+        with cartera.transaction():
+            cartera.add_asset(activo('E'))
+            cartera.delete_asset('A')
+            raise RuntimeError("fallo a mitad")
+    assert simbolos(cartera) == ['A', 'B', 'C', 'D']
+    assert cartera.version > version
+    assert len(lineas_diario(cartera)) == 4
+    assert simbolos(Portfolio(ruta)) == ['A', 'B', 'C', 'D']
+
+
+def test_transaccion_escribe_una_vez(cartera):
+    with cartera.transaction():
+        cartera.add_asset(activo('E'))
+        cartera.update_prices({'A': 3.0})
+    assert len(lineas_diario(cartera)) == 6
+
+
+def test_compactar(ruta, cartera, monkeypatch):
+    cartera.compact()
+    assert not os.path.exists(cartera.journal_file)
+    with open(ruta) as f:
+        assert [item['símbolo'] for item in json.load(f)] == ['A', 'B', 'C', 'D']
+
+    # Al llegar a COMPACT_EVERY entradas se vuelca una instantánea en lugar de añadir.
+    monkeypatch.setattr(models.portfolio, 'COMPACT_EVERY', 3)
+    cartera.update_prices({'A': 2.0})
+    cartera.update_prices({'B': 2.0})
+    assert len(lineas_diario(cartera)) == 2
+    cartera.update_prices({'C': 2.0})
+    assert not os.path.exists(cartera.journal_file)
+    assert [a.precio_actual for a in Portfolio(ruta).get_all_assets()] == [2.0, 2.0, 2.0, 1.0]
+
+
+def test_precios_sin_cambios_no_escriben(cartera):
+    version = cartera.version
+    assert cartera.update_prices({'A': 1.0, 'Z': 5.0}) == {}
+    assert cartera.version == version
+    assert len(lineas_diario(cartera)) == 4
+
+
+def test_precios_en_memoria_se_persisten_despues(ruta, cartera):
+    cartera.update_prices({'A': 2.0}, persist=False)
+    assert len(lineas_diario(cartera)) == 4
+    version = cartera.version
+
+    # El precio ya está en memoria, pero aún no en el diario.
+    assert cartera.update_prices({'A': 2.0}) == {'A': 2.0}
+    assert cartera.version == version
+    assert Portfolio(ruta).get_asset_by_symbol('A').precio_actual == 2.0
+    assert cartera.update_prices({'A': 2.0}) == {}
@@ -0,0 +1,105 @@
+import json
+import random
+
+import numpy as np
+import pytest
+
+from services.rebalanceo import Rebalanceo
+
+
+def rebalanceo(cantidades=(10, 10), precios=(10.0, 10.0), tipos=('ACC', 'ETF'), brokers=('degiro', 'degiro'),
+               **kwargs):
+    simbolos = [chr(ord('A') + i) for i in range(len(cantidades))]
+    return Rebalanceo(simbolos, cantidades, precios, tipos, brokers, **kwargs)
+
+
+def operaciones(resultado):
+    return {o['símbolo']: (o['operacion'], o['cantidad']) for o in resultado['operaciones']}
+
+
+def test_pesos_objetivo_sin_efectivo():
+    resultado = rebalanceo(objetivos_tipo={'ACC': 80, 'ETF': 20}).resolver()
+    assert operaciones(resultado) == {'A': ('compra', 6), 'B': ('venta', 6)}
+    assert resultado['pesos_finales'] == pytest.approx({'ACC': 0.8, 'ETF': 0.2})
+    assert resultado['compras'] == resultado['ventas'] == 60.0
+    assert resultado['efectivo_restante'] == {}
+
+
+def test_pesos_objetivo_con_efectivo():
+    resultado = rebalanceo(objetivos_tipo={'ACC': 50, 'ETF': 50}, efectivo={'degiro': 100.0}).resolver()
+    assert operaciones(resultado) == {'A': ('compra', 5), 'B': ('compra', 5)}
+    assert resultado['pesos_finales'] == pytest.approx({'ACC': 0.5, 'ETF': 0.5})
+    assert resultado['efectivo_restante'] == {}
+
+
+def test_sin_operaciones_las_ventas_no_son_cero_negativo():
+    resultado = rebalanceo(objetivos_tipo={'ACC': 50, 'ETF': 50}).resolver()
+    assert resultado['operaciones'] == []
+    assert json.dumps([resultado['compras'], resultado['ventas']]) == "[0.0, 0.0]"
+
+
+def test_posicion_a_cero_recibe_compras():
+    resultado = rebalanceo(cantidades=(10, 10, 0), precios=(10.0, 10.0, 5.0), tipos=('ACC', 'ETF', 'PP'),
+                           brokers=('degiro',) * 3, objetivos_tipo={'ACC': 40, 'ETF': 40, 'PP': 20}).resolver()
+    assert operaciones(resultado) == {'A': ('venta', 2), 'B': ('venta', 2), 'C': ('compra', 8)}
+    assert resultado['pesos_finales'] == pytest.approx({'ACC': 0.4, 'ETF': 0.4, 'PP': 0.2})
+
+
+def test_lotes_dan_la_asignacion_entera_mas_cercana():
+    # El 80/20 exacto pide comprar 6 y vender 6; con lotes de 7 las alternativas son no
+    # operar (50/50) o un lote de cada lado (85/15). Se elige la más cercana, sin dejar
+    # efectivo: el objetivo se pasa por menos de un lote.
+    resultado = rebalanceo(objetivos_tipo={'ACC': 80, 'ETF': 20}, lotes={'A': 7, 'B': 7}).resolver()
+    assert operaciones(resultado) == {'A': ('compra', 7), 'B': ('venta', 7)}
+    assert resultado['pesos_finales'] == pytest.approx({'ACC': 0.85, 'ETF': 0.15})
+    assert resultado['efectivo_restante'] == {}
+    for tipo, peso in resultado['pesos_finales'].items():
+        assert abs(peso - resultado['pesos_objetivo'][tipo]) < 70.0 / 200.0
+
+
+def test_lotes_por_tipo_y_minimo():
+    # Las ventas van al lote más cercano (1,5 lotes -> 2); como A ya queda en su objetivo,
+    # el sobrante de la venta se queda como efectivo.
+    resultado = rebalanceo(objetivos_tipo={'ACC': 80, 'ETF': 20}, lotes={'ETF': 4}).resolver()
+    assert operaciones(resultado) == {'A': ('compra', 6), 'B': ('venta', 8)}
+    assert resultado['efectivo_restante'] == {'degiro': pytest.approx(20.0)}
+    # Operaciones por debajo del importe mínimo no se proponen.
+    resultado = rebalanceo(objetivos_tipo={'ACC': 55, 'ETF': 45}, minimo=20.0).resolver()
+    assert resultado['operaciones'] == []
+
+
+def test_transferencia_entre_brokers():
+    resultado = rebalanceo(cantidades=(10,) * 4, precios=(10.0,) * 4, tipos=('ACC', 'ETF') * 2,
+                           brokers=('degiro', 'degiro', 'ocean', 'ocean'),
+                           objetivos_broker={'degiro': 25, 'ocean': 75}).resolver()
+    assert resultado['transferencias'] == {'degiro': -100.0, 'ocean': 100.0}
+    assert operaciones(resultado) == {'A': ('venta', 5), 'B': ('venta', 5), 'C': ('compra', 5), 'D': ('compra', 5)}
+    # Sin objetivos por tipo se conservan los pesos actuales.
+    assert resultado['pesos_finales'] == pytest.approx({'ACC': 0.5, 'ETF': 0.5})
+    assert resultado['efectivo_restante'] == {}
+
+
+def test_efectivo_de_broker_desconocido():
+    with pytest.raises(ValueError):
+        rebalanceo().resolver(efectivo={'otro': 100.0})
+
+
+def test_arranque_en_caliente_igual_que_en_frio():
+    azar = random.Random(1)
+    n = 200
+    cantidades = [azar.randint(0, 50) for _ in range(n)]
+    precios = [azar.uniform(1, 100) for _ in range(n)]
+    tipos = [azar.choice(['ACC', 'ETF', 'PP', 'FON']) for _ in range(n)]
+    brokers = [azar.choice(['degiro', 'ocean', 'myinvestor']) for _ in range(n)]
+    objetivos = {'ACC': 40, 'ETF': 30, 'PP': 20, 'FON': 10}
+    efectivo = {'degiro': 1000.0}
+
+    caliente = rebalanceo(cantidades, precios, tipos, brokers, objetivos_tipo=objetivos, efectivo=efectivo)
+    caliente.resolver()
+    nuevos = [precio * azar.uniform(0.9, 1.1) for precio in precios]
+    en_caliente = caliente.resolver(nuevos)
+    en_frio = rebalanceo(cantidades, nuevos, tipos, brokers, objetivos_tipo=objetivos,
+                         efectivo=efectivo).resolver()
+    assert np.array_equal(en_caliente['cantidades'], en_frio['cantidades'])
+    assert en_caliente['pesos_finales'] == pytest.approx(en_frio['pesos_finales'])
+    assert en_caliente['iteraciones'] <= en_frio['iteraciones']
@@ -0,0 +1,57 @@
+import time
+
+import pytest
+
+from services.market_data import LimiteExcedido, ProveedorInestable
+from services.resiliencia import (ABIERTO, CERRADO, CircuitoAbierto, Cortacircuitos, LimitadorTasa,
+                                  ProveedorResiliente)
+
+
+def test_cortacircuitos_abre_tras_umbral_y_cierra_con_exito():
+    cortacircuitos = Cortacircuitos(umbral=2, reapertura=0.05)
+    cortacircuitos.fallo()
+    assert cortacircuitos.permitir()
+    cortacircuitos.fallo()
+    assert cortacircuitos.estado == ABIERTO
+    assert not cortacircuitos.permitir()
+    time.sleep(0.06)
+    assert cortacircuitos.permitir()
+    cortacircuitos.exito()
+    assert cortacircuitos.estado == CERRADO
+
+
+def test_limitador_respeta_timeout():
+    limitador = LimitadorTasa(tasa=1.0, capacidad=1)
+    assert limitador.adquirir(0)
+    assert not limitador.adquirir(0.1)
+
+
+def test_semiabierto_sin_ficha_no_bloquea_el_proveedor():
+    # Un 429 abre el circuito y pausa el limitador más de lo que se espera por una ficha:
+    # la llamada de prueba agota el timeout, pero el proveedor debe recuperarse.
+    inestable = ProveedorInestable({'A': 1.0}, prob_limite=1.0, reintentar_en=0.6)
+    proveedor = ProveedorResiliente(inestable, cortacircuitos=Cortacircuitos(umbral=1, reapertura=0.05),
+                                    timeout_ficha=0.2)
+    with pytest.raises(LimiteExcedido):
+        proveedor.obtener_lote(['A'])
+    time.sleep(0.06)
+    with pytest.raises(TimeoutError):
+        proveedor.obtener_lote(['A'])
+
+    inestable.prob_limite = 0.0
+    time.sleep(0.6)
+    assert proveedor.obtener_lote(['A'])['A'][0] == 1.0
+    assert proveedor.cortacircuitos.estado == CERRADO
+
+
+def test_circuito_abierto_rechaza_sin_llamar():
+    inestable = ProveedorInestable({'A': 1.0}, prob_timeout=1.0, espera_timeout=0.0)
+    proveedor = ProveedorResiliente(inestable, cortacircuitos=Cortacircuitos(umbral=2, reapertura=60))
+    for _ in range(2):
+        with pytest.raises(TimeoutError):
+            proveedor.obtener_lote(['A'])
+    with pytest.raises(CircuitoAbierto):
+        proveedor.obtener_lote(['A'])
+    metricas = proveedor.metricas.instantanea()
+    assert metricas['peticiones'] == 2
+    assert metricas['rechazadas'] == 1
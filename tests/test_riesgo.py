@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from models.asset import Asset
+from models.portfolio import Portfolio
+from services.historico import AlmacenHistorico
+from services.riesgo import riesgo_cartera, simular
+
+SIMBOLOS = ('A', 'B', 'C')
+
+
+@pytest.fixture
+def almacen(tmp_path):
+    almacen = AlmacenHistorico(str(tmp_path / "historico"))
+    rng = np.random.default_rng(3)
+    fechas = np.datetime64('2022-01-03') + np.arange(300)
+    for i, simbolo in enumerate(SIMBOLOS):
+        rentabilidades = rng.normal(0.0002, 0.01 * (i + 1), len(fechas))
+        almacen.anadir(simbolo, fechas, 100 * np.exp(np.cumsum(rentabilidades)))
+    return almacen
+
+
+def cartera(tmp_path, activos):
+    portfolio = Portfolio(str(tmp_path / "cartera.json"))
+    with portfolio.transaction():
+        for simbolo, tipo, broker, divisa in activos:
+            portfolio.add_asset(Asset(simbolo, simbolo, 10, 100.0, 1000.0, 'No', tipo, broker, divisa))
+    return portfolio
+
+
+def test_var_menor_que_cvar_y_contribuciones(tmp_path, almacen):
+    portfolio = cartera(tmp_path, [('A', 'ACC', 'degiro', 'EUR'), ('B', 'ETF', 'degiro', 'EUR'),
+                                   ('C', 'ETF', 'ocean', 'EUR'), ('Z', 'ACC', 'ocean', 'EUR')])
+    resultado = riesgo_cartera(portfolio, almacen, caminos=20_000, semilla=7, procesos=1)
+    assert resultado['sin_historico'] == ['Z']
+    assert resultado['valor'] == 3000.0
+    for nivel in (0.95, 0.99):
+        assert 0 < resultado['var'][nivel] <= resultado['cvar'][nivel]
+    assert resultado['var'][0.95] <= resultado['var'][0.99]
+    cvar = resultado['cvar'][resultado['nivel_contribuciones']]
+    for grupo in ('por_activo', 'por_tipo', 'por_broker'):
+        assert sum(resultado[grupo].values()) == pytest.approx(cvar)
+    assert set(resultado['por_tipo']) == {'ACC', 'ETF'}
+    # Misma semilla, mismo resultado.
+    assert riesgo_cartera(portfolio, almacen, caminos=20_000, semilla=7, procesos=1)['cvar'] == resultado['cvar']
+
+
+def test_pool_igual_que_un_proceso():
+    media = np.array([0.0, 0.001])
+    covarianza = np.array([[0.0004, 0.0001], [0.0001, 0.0009]])
+    argumentos = ([1000.0, 2000.0], media, covarianza)
+    un_proceso = simular(*argumentos, caminos=4000, semilla=11, procesos=1, caminos_bloque=1000)
+    pool = simular(*argumentos, caminos=4000, semilla=11, procesos=2, caminos_bloque=1000)
+    assert pool['var'] == un_proceso['var']
+    assert pool['cvar'] == un_proceso['cvar']
+    assert np.allclose(pool['contribuciones'], un_proceso['contribuciones'])
+
+
+def test_cartera_vacia(tmp_path, almacen):
+    resultado = riesgo_cartera(Portfolio(str(tmp_path / "vacia.json")), almacen)
+    assert resultado == {'sin_historico': [], 'sin_tipo': [], 'valor': 0.0, 'var': {}, 'cvar': {},
+                         'por_activo': {}, 'por_tipo': {}, 'por_broker': {}}
+
+
+def test_un_solo_activo(tmp_path, almacen):
+    portfolio = cartera(tmp_path, [('B', 'ETF', 'degiro', 'EUR')])
+    resultado = riesgo_cartera(portfolio, almacen, caminos=20_000, semilla=1, procesos=1)
+    assert 0 < resultado['var'][0.99] <= resultado['cvar'][0.99]
+    assert resultado['por_activo'] == {'B': pytest.approx(resultado['cvar'][0.99])}
+
+
+def test_sin_tipo_de_cambio_queda_fuera(tmp_path, almacen):
+    portfolio = cartera(tmp_path, [('A', 'ACC', 'degiro', 'EUR'), ('B', 'ETF', 'degiro', 'USD')])
+    resultado = riesgo_cartera(portfolio, almacen, {'EUR': 1.0}, caminos=5000, procesos=1)
+    assert resultado['sin_tipo'] == ['B']
+    assert list(resultado['por_activo']) == ['A']
+    con_tipo = riesgo_cartera(portfolio, almacen, {'EUR': 1.0, 'USD': 0.5}, caminos=5000, procesos=1)
+    assert con_tipo['valor'] == 1500.0
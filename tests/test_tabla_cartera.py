@@ -0,0 +1,93 @@
+import random
+
+from gui.tabla_cartera import TablaCartera
+
+
+# Treeview mínimo en memoria (sin pantalla): solo lo que usa TablaCartera para filas.
+class ArbolFalso:
+    def __init__(self):
+        self.hijos = []
+        self.valores = {}
+
+    def get_children(self, padre=""):
+        return tuple(self.hijos)
+
+    def exists(self, iid):
+        return iid in self.valores
+
+    def insert(self, padre, posicion, iid, values, tags=()):
+        self.hijos.insert(len(self.hijos) if posicion == "end" else posicion, iid)
+        self.valores[iid] = values
+
+    def item(self, iid, values, tags=()):
+        self.valores[iid] = values
+
+    def move(self, iid, padre, posicion):
+        self.hijos.remove(iid)
+        self.hijos.insert(posicion, iid)
+
+    def delete(self, *iids):
+        for iid in iids:
+            self.hijos.remove(iid)
+            del self.valores[iid]
+
+    def prev(self, iid):
+        i = self.hijos.index(iid)
+        return self.hijos[i - 1] if i > 0 else ""
+
+    def next(self, iid):
+        i = self.hijos.index(iid)
+        return self.hijos[i + 1] if i + 1 < len(self.hijos) else ""
+
+    def set(self, iid, columna, valor):
+        pass
+
+
+def tabla():
+    tabla = TablaCartera.__new__(TablaCartera)
+    tabla.total = 0.0
+    tabla.tipos = None
+    tabla._filas = {}
+    tabla._orden = (None, False)
+    tabla.tree = ArbolFalso()
+    return tabla
+
+
+def fila(simbolo, importe):
+    return {'símbolo': simbolo, 'título': simbolo, 'cantidad': 1, 'precio_actual': importe,
+            'importe_total': importe, 'divisa': 'EUR', 'tipo_activo': 'ACC', 'broker': 'degiro'}
+
+
+def test_filas_nuevas_y_cambiadas_respetan_el_orden():
+    azar = random.Random(0)
+    for columna, descendente in (('importe_total', False), ('importe_total', True), ('símbolo', False)):
+        t = tabla()
+        t.cargar([fila(f"S{i:03d}", azar.uniform(1, 100)) for i in range(20)], 1000.0)
+        t.ordenar(columna, descendente)
+        for i in range(100):
+            simbolo = f"S{azar.randrange(40):03d}"
+            t.actualizar_fila(fila(simbolo, azar.uniform(1, 100)))
+            claves = [t._clave(columna)(s) for s in t.tree.get_children()]
+            assert claves == sorted(claves, reverse=descendente)
+        assert len(t.tree.get_children()) == len(t._filas)
+
+
+def test_sin_orden_se_anade_al_final():
+    t = tabla()
+    t.cargar([fila('B', 2.0), fila('A', 1.0)], 3.0)
+    t.actualizar_fila(fila('C', 0.5))
+    t.actualizar_fila(fila('A', 9.0))
+    assert t.tree.get_children() == ('B', 'A', 'C')
+
+
+def test_tipos_nuevos_recalculan_porcentajes_y_orden():
+    t = tabla()
+    dolares = dict(fila('U', 100.0), divisa='USD')
+    t.cargar([fila('E', 90.0), dolares], 90.0, {'EUR': 1.0})
+    t.ordenar('% Activo', True)
+    assert t.tree.get_children() == ('E', 'U')
+    t.cambiar_tipos({'EUR': 1.0, 'USD': 0.9}, 180.0)
+    assert t.tipos['USD'] == 0.9
+    assert t.tree.get_children() == ('E', 'U')
+    t.cambiar_tipos({'EUR': 1.0, 'USD': 1.1}, 200.0)
+    assert t.tree.get_children() == ('U', 'E')
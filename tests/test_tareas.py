@@ -0,0 +1,84 @@
+import threading
+import tkinter as tk
+
+from gui.tareas import EjecutorTareas, GuardadoDiferido, volcar_guardados
+
+
+# Sustituto de la raíz de Tk: el sondeo de la cola no hace falta para estas pruebas.
+class RaizFalsa:
+    def __init__(self):
+        self.errores = []
+
+    def after(self, ms, funcion):
+        return None
+
+    def report_callback_exception(self, tipo, valor, traza):
+        self.errores.append(valor)
+
+
+def test_cerrar_termina_los_guardados_y_cancela_el_resto():
+    ejecutor = EjecutorTareas(RaizFalsa(), max_hilos=1)
+    empezado = threading.Event()
+    seguir = threading.Event()
+    hechos = []
+
+    def descarga_en_marcha(tarea):
+        empezado.set()
+        seguir.wait(5)
+        tarea.comprobar()
+        hechos.append('descarga en marcha')
+
+    ejecutor.enviar(descarga_en_marcha)
+    empezado.wait(5)
+    ejecutor.enviar(lambda tarea: hechos.append('guardado'), guardado=True)
+    ejecutor.enviar(lambda tarea: hechos.append('descarga'))
+    ejecutor.enviar(lambda tarea: hechos.append('otro guardado'), guardado=True)
+
+    threading.Timer(0.05, seguir.set).start()
+    ejecutor.cerrar()
+    assert hechos == ['guardado', 'otro guardado']
+
+
+# Ventana ya destruida al salir: sus temporizadores no se pueden cancelar.
+class VentanaDestruida:
+    def after(self, ms, funcion):
+        return "after#1"
+
+    def after_cancel(self, identificador):
+        raise tk.TclError("application has been destroyed")
+
+
+def test_volcar_guardados_escribe_lo_pendiente_al_salir():
+    ejecutor = EjecutorTareas(RaizFalsa())
+    escritos = []
+    cambios = {'SAN': 1.5}
+
+    def preparar():
+        pagos = dict(cambios)
+        cambios.clear()
+        return pagos
+
+    guardado = GuardadoDiferido(VentanaDestruida(), preparar, escritos.append, ejecutor)
+    guardado.marcar()
+    volcar_guardados()
+    ejecutor.cerrar()
+    assert escritos == [{'SAN': 1.5}]
+    assert not guardado.pendiente
+
+
+def test_error_en_callback_se_informa_y_no_corta_la_cola():
+    raiz = RaizFalsa()
+    ejecutor = EjecutorTareas(raiz)
+    hechos = []
+
+    def fallar(resultado):
+        raise RuntimeError("callback roto")
+
+    # Como guardados, para que cerrar() espere a los dos y sus resultados queden en la cola.
+    ejecutor.enviar(lambda tarea: 1, al_terminar=fallar, guardado=True)
+    ejecutor.enviar(lambda tarea: 2, al_terminar=hechos.append, guardado=True)
+    ejecutor.cerrar()
+    ejecutor._cerrado = False
+    ejecutor._sondear()
+    assert [str(e) for e in raiz.errores] == ["callback roto"]
+    assert hechos == [2]
@@ -0,0 +1,123 @@
+import threading
+
+import pytest
+
+from models.asset import Asset
+from models.portfolio import Portfolio
+from services.agregados import agregados_cartera
+from services.market_data import ProveedorFalso
+from services.tiempo_real import FuenteSimulada, FuenteSondeo, MotorTiempoReal
+
+
+@pytest.fixture
+def cartera(tmp_path):
+    portfolio = Portfolio(str(tmp_path / "cartera.json"))
+    with portfolio.transaction():
+        portfolio.add_asset(Asset('A', 'A', 10, 1.0, 10.0, 'No', 'ACC', 'degiro'))
+        portfolio.add_asset(Asset('B', 'B', 5, 2.0, 10.0, 'No', 'ETF', 'degiro'))
+    return portfolio
+
+
+def lineas_diario(portfolio):
+    with open(portfolio.journal_file) as f:
+        return f.readlines()
+
+
+# Fuente que entrega los ticks a mano, sin hilo.
+class FuenteManual:
+    def iniciar(self, simbolos, al_recibir):
+        self.al_recibir = al_recibir
+
+    def detener(self):
+        pass
+
+
+def test_motor_se_queda_con_el_ultimo_precio(cartera):
+    fuente = FuenteManual()
+    motor = MotorTiempoReal(cartera, fuente)
+    motor.iniciar()
+    fuente.al_recibir({'A': 1.5, 'Z': 9.0})
+    fuente.al_recibir({'A': 1.7, 'B': 2.0})
+    assert motor.recibidos == 4
+
+    totales = agregados_cartera(cartera)
+    cambios = motor.aplicar(totales)
+    # B no cambia de precio y Z no está en la cartera.
+    assert [(anterior['símbolo'], nuevo['precio_actual']) for anterior, nuevo in cambios] == [('A', 1.7)]
+    assert totales['general'] == pytest.approx(27.0)
+    assert totales['general'] == pytest.approx(agregados_cartera(cartera)['general'])
+    assert motor.aplicar(totales) == []
+
+
+def test_motor_persiste_una_sola_entrada_al_detener(cartera):
+    fuente = FuenteManual()
+    motor = MotorTiempoReal(cartera, fuente)
+    motor.iniciar()
+    entradas = len(lineas_diario(cartera))
+    for precio in (1.1, 1.2, 1.3):
+        fuente.al_recibir({'A': precio})
+        motor.aplicar()
+    assert len(lineas_diario(cartera)) == entradas
+
+    fuente.al_recibir({'B': 2.5})
+    motor.detener()
+    assert not motor.activo
+    assert len(lineas_diario(cartera)) == entradas + 1
+    recargada = Portfolio(cartera.cartera_file)
+    assert [a.precio_actual for a in recargada.get_all_assets()] == [1.3, 2.5]
+
+
+def primeras_rafagas(fuente, simbolos, n=3):
+    lotes = []
+    recibido = threading.Event()
+
+    def al_recibir(ticks):
+        lotes.append(dict(ticks))
+        if len(lotes) >= n:
+            recibido.set()
+
+    fuente.iniciar(simbolos, al_recibir)
+    assert recibido.wait(5)
+    fuente.detener()
+    return lotes[:n]
+
+
+def test_fuente_simulada_es_reproducible():
+    rafagas = [primeras_rafagas(FuenteSimulada({'A': 1.0, 'B': 2.0}, periodo=0.005, semilla=7), ['A', 'B', 'Z'])
+               for _ in range(2)]
+    assert rafagas[0] == rafagas[1]
+    assert all(set(rafaga) <= {'A', 'B'} for rafaga in rafagas[0])
+
+
+def test_fuente_sondeo_solo_emite_cambios():
+    proveedor = ProveedorFalso({'A': 1.0, 'B': 2.0})
+    recibidos = []
+    segundo = threading.Event()
+
+    def al_recibir(cambios):
+        recibidos.append(cambios)
+        # Tras el primer sondeo cambia solo A.
+        proveedor.precios['A'] = 1.5
+        if len(recibidos) == 2:
+            segundo.set()
+
+    fuente = FuenteSondeo(proveedor, intervalo=0.01)
+    fuente.iniciar(['A', 'B', 'Z'], al_recibir)
+    assert segundo.wait(5)
+    fuente.detener()
+    assert recibidos[:2] == [{'A': 1.0, 'B': 2.0}, {'A': 1.5}]
+
+
+def test_salir_detiene_los_motores_vivos(cartera):
+    from gui import main_window
+
+    fuente = FuenteManual()
+    motor = MotorTiempoReal(cartera, fuente)
+    motor.iniciar()
+    main_window._motores_vivos.add(motor)
+    # Tick recibido pero aún sin aplicar por ningún fotograma.
+    fuente.al_recibir({'A': 1.9})
+    main_window.detener_motores()
+    assert not main_window._motores_vivos
+    assert not motor.activo
+    assert Portfolio(cartera.cartera_file).get_asset_by_symbol('A').precio_actual == 1.9
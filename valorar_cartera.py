@@ -0,0 +1,152 @@
+import argparse
+import json
+import os
+import sys
+
+from models.portfolio import Portfolio
+from services.dividendos import DIVIDENDOS_DB, abrir_libro
+from services.operaciones import OPERACIONES_DB
+from services.valoracion import valorar_cartera, escribir_json, escribir_csv, escribir_parquet, claves_a_texto
+
+CARTERA_ARCHIVO = "data/cartera.json"
+
+
+def crear_parser():
+    parser = argparse.ArgumentParser(description="Valoración de la cartera sin interfaz gráfica.")
+    parser.add_argument("--cartera", default=CARTERA_ARCHIVO, help="fichero de cartera (JSON)")
+    parser.add_argument("--refrescar", action="store_true", help="actualiza los precios antes de valorar")
+    parser.add_argument("--dividendos", default=DIVIDENDOS_DB, help="libro de dividendos; vacío para omitirlo")
+    parser.add_argument("--operaciones", default=OPERACIONES_DB,
+                        help="libro de operaciones con el que conciliar la cartera; vacío para omitirlo")
+    parser.add_argument("--sincronizar", action="store_true",
+                        help="aplica a la cartera las cantidades del libro de operaciones antes de valorar")
+    parser.add_argument("--formato", choices=["json", "csv", "parquet"], default="json")
+    parser.add_argument("--salida", default="-", help="fichero de salida ('-' para la salida estándar)")
+    parser.add_argument("--agregados", help="con csv/parquet, fichero JSON donde escribir los totales")
+    parser.add_argument("--lote", nargs="+", metavar="CARTERA",
+                        help="revaloriza varias carteras con una sola consulta de precios y escribe un resumen JSON")
+    parser.add_argument("--procesos", type=int, help="procesos para --lote y --riesgo (por defecto, uno por núcleo)")
+    parser.add_argument("--riesgo", action="store_true",
+                        help="VaR/CVaR Monte Carlo con el histórico local en lugar de la valoración")
+    parser.add_argument("--caminos", type=int, default=100_000, help="caminos simulados para --riesgo")
+    parser.add_argument("--horizonte", type=int, default=1, help="sesiones del horizonte de --riesgo")
+    parser.add_argument("--semilla", type=int, default=0, help="semilla de la simulación de --riesgo")
+    parser.add_argument("--rebalancear", action="store_true",
+                        help="operaciones para llevar la cartera a los pesos objetivo en lugar de la valoración")
+    parser.add_argument("--objetivos", help="pesos objetivo, efectivo por broker y lotes para --rebalancear "
+                                             "(JSON; por defecto, los guardados desde la interfaz)")
+    return parser
+
+
+def revalorizar_lote(args):
+    from services.revalorizacion import revalorizar_carteras, escribir_resumen
+
+    resultado = revalorizar_carteras(args.lote, procesos=args.procesos)
+    if args.salida == "-":
+        json.dump(claves_a_texto(resultado), sys.stdout, indent=4, ensure_ascii=False)
+        sys.stdout.write("\n")
+    else:
+        escribir_resumen(resultado, args.salida)
+    return 0
+
+
+def calcular_riesgo(args):
+    from services.divisas import tipos_cartera
+    from services.historico import obtener_almacen
+    from services.riesgo import riesgo_cartera
+
+    portfolio = Portfolio(args.cartera)
+    almacen = obtener_almacen()
+    almacen.actualizar([asset.simbolo for asset in portfolio.get_all_assets()])
+    resultado = riesgo_cartera(portfolio, almacen, tipos_cartera(portfolio), caminos=args.caminos,
+                               horizonte=args.horizonte, semilla=args.semilla, procesos=args.procesos)
+    if args.salida == "-":
+        json.dump(claves_a_texto(resultado), sys.stdout, indent=4, ensure_ascii=False)
+        sys.stdout.write("\n")
+    else:
+        with open(args.salida, "w", encoding="utf-8") as salida:
+            json.dump(claves_a_texto(resultado), salida, indent=4, ensure_ascii=False)
+    return 0
+
+
+def calcular_rebalanceo(args):
+    from services.divisas import tipos_cartera
+    from services.rebalanceo import OBJETIVOS_ARCHIVO, cargar_objetivos, rebalancear_cartera
+
+    portfolio = Portfolio(args.cartera)
+    objetivos = cargar_objetivos(args.objetivos or OBJETIVOS_ARCHIVO)
+    _, resultado = rebalancear_cartera(portfolio, objetivos, tipos_cartera(portfolio))
+    resultado.pop('cantidades')
+    if args.salida == "-":
+        json.dump(resultado, sys.stdout, indent=4, ensure_ascii=False)
+        sys.stdout.write("\n")
+    else:
+        with open(args.salida, "w", encoding="utf-8") as salida:
+            json.dump(resultado, salida, indent=4, ensure_ascii=False)
+    return 0
+
+
+def conciliar_con_libro(portfolio, args):
+    # Avisa por stderr de las cantidades que no coinciden con el libro; con --sincronizar
+    # se corrigen antes de valorar. Sin libro no hay nada que comparar y no se crea.
+    from services.operaciones import LibroOperaciones, MotorCoste, conciliar, sincronizar_cartera
+
+    if not args.operaciones or not os.path.exists(args.operaciones):
+        return
+    libro = LibroOperaciones(args.operaciones)
+    try:
+        motor = MotorCoste(libro)
+        motor.actualizar()
+        if args.sincronizar:
+            for simbolo, en_cartera, en_libro in sincronizar_cartera(portfolio, motor):
+                print(f"Corregido: {simbolo} (cartera {en_cartera:g}, libro {en_libro:g})", file=sys.stderr)
+        # Los activos sin historial no se corrigen: solo se avisa.
+        for simbolo, en_cartera, en_libro in conciliar(portfolio, motor):
+            if en_libro is None:
+                print(f"Sin operaciones en el libro: {simbolo} (cartera {en_cartera:g})", file=sys.stderr)
+            else:
+                print(f"No coincide con el libro: {simbolo} (cartera {en_cartera:g}, libro {en_libro:g})",
+                      file=sys.stderr)
+    finally:
+        libro.cerrar()
+
+
+def main(argv=None):
+    args = crear_parser().parse_args(argv)
+    if args.lote:
+        return revalorizar_lote(args)
+    if args.riesgo:
+        return calcular_riesgo(args)
+    if args.rebalancear:
+        return calcular_rebalanceo(args)
+    if args.formato == "parquet" and args.salida == "-":
+        print("La salida Parquet necesita --salida con un fichero.", file=sys.stderr)
+        return 2
+
+    portfolio = Portfolio(args.cartera)
+    conciliar_con_libro(portfolio, args)
+    libro = abrir_libro(args.dividendos) if args.dividendos else None
+    valoracion = valorar_cartera(portfolio, refrescar=args.refrescar, libro=libro)
+
+    if args.formato == "parquet":
+        escribir_parquet(valoracion, args.salida)
+    else:
+        escribir = escribir_json if args.formato == "json" else escribir_csv
+        if args.salida == "-":
+            escribir(valoracion, sys.stdout)
+        else:
+            with open(args.salida, "w", newline="", encoding="utf-8") as salida:
+                escribir(valoracion, salida)
+
+    if args.agregados:
+        with open(args.agregados, "w", encoding="utf-8") as salida:
+            json.dump(claves_a_texto(valoracion['agregados']), salida, indent=4, ensure_ascii=False)
+    if args.refrescar or args.sincronizar:
+        portfolio.compact()
+    if libro is not None:
+        libro.cerrar()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())